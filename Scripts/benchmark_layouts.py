@@ -0,0 +1,72 @@
+import os
+import random
+import sys
+import timeit
+
+# Run from the repo root: python Scripts/benchmark_layouts.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from layouts.fast import LIQUIDITY_STATE_V4, MARKET_STATE_V3, CPMM_POOL_STATE, CLMM_POOL_STATE
+
+SAMPLES = 200           # random accounts decoded per layout in the equivalence check
+ITERATIONS = 20_000     # parses per layout in the benchmark
+
+# Fields read on the hot path (utils.pool_utils.fetch_amm_v4_pool_keys)
+HOT_FIELDS = {
+    'LiquidityStateV4': ['serumMarket', 'coinDecimals', 'pcDecimals', 'ammOpenOrders', 'ammTargetOrders', 'poolCoinTokenAccount',
+                         'poolPcTokenAccount', 'swapFeeNumerator', 'swapFeeDenominator'],
+    'MarketStateV3': ['vault_signer_nonce', 'base_mint', 'quote_mint', 'base_vault', 'quote_vault', 'bids', 'asks', 'event_queue'],
+    'CpmmPoolState': ['amm_config', 'token_0_vault', 'token_1_vault', 'mint_0_decimals', 'mint_1_decimals', 'open_time'],
+    'ClmmPoolState': ['amm_config', 'token_vault_0', 'token_vault_1', 'tick_spacing', 'liquidity', 'sqrt_price_x64', 'tick_current'],
+}
+
+def random_account(fast_layout) -> bytes:
+    data = bytearray(random.getrandbits(8) for _ in range(fast_layout.size))
+    if fast_layout is MARKET_STATE_V3:
+        # account_flags: 7 flag bits followed by 57 bits that must be zero (Const)
+        data[5:13] = bytes([random.getrandbits(7)]) + bytes(7)
+    return bytes(data)
+
+# construct is the reference - every field must decode to the same value (tests/test_layouts.py runs the same check)
+def check_equivalence(fast_layout) -> list:
+    """Returns a description of every mismatching field (empty when both decoders agree)."""
+    mismatches = []
+    for _ in range(SAMPLES):
+        data = random_account(fast_layout)
+        expected = fast_layout.layout.parse(data)
+        actual = fast_layout.parse(data)
+        for name in fast_layout.record_class._fields:
+            if actual[name] != expected[name]:
+                mismatches.append(f"{fast_layout.name}.{name}: fast={actual[name]!r} construct={expected[name]!r}")
+    return mismatches
+
+def benchmark(fast_layout) -> tuple:
+    data = random_account(fast_layout)
+    fields = HOT_FIELDS[fast_layout.name]
+
+    def construct_parse():
+        parsed = fast_layout.layout.parse(data)
+        for name in fields:
+            getattr(parsed, name)
+
+    def fast_parse():
+        parsed = fast_layout.parse(data)
+        for name in fields:
+            getattr(parsed, name)
+
+    construct_time = timeit.timeit(construct_parse, number=ITERATIONS) / ITERATIONS
+    fast_time = timeit.timeit(fast_parse, number=ITERATIONS) / ITERATIONS
+    return construct_time, fast_time
+
+if __name__ == "__main__":
+    random.seed(0)
+    print(f"{'layout':<18}{'bytes':>7}{'fields':>8}{'construct (us)':>17}{'fast (us)':>12}{'speedup':>10}")
+    for fast_layout in (LIQUIDITY_STATE_V4, MARKET_STATE_V3, CPMM_POOL_STATE, CLMM_POOL_STATE):
+        mismatches = check_equivalence(fast_layout)
+        if mismatches:
+            print("\n".join(mismatches[:20]))
+            sys.exit(f"{fast_layout.name}: {len(mismatches)} field values differ between construct and the fast decoder")
+        field_count = len(fast_layout.record_class._fields)
+        construct_time, fast_time = benchmark(fast_layout)
+        print(f"{fast_layout.name:<18}{fast_layout.size:>7}{field_count:>8}{construct_time * 1e6:>17.2f}{fast_time * 1e6:>12.2f}{construct_time / fast_time:>9.1f}x")
+    print(f"Equivalence: {SAMPLES} random accounts per layout decode identically with construct and the fast decoders")
@@ -0,0 +1,102 @@
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+# Run from the repo root: python Scripts/benchmark_trade_pipeline.py [--trades 200] [--concurrency 20] [--latency 0.05] [--rate-limit 50]
+# Every RPC call and websocket subscription of the buy path (pool keys, reserves, blockhash, send, confirmation,
+# getTransaction) is answered by the in-process fake cluster of utils.fake_rpc, so throughput and tail latency can be
+# measured under chosen network latency, provider rate limits and dropped transactions without touching mainnet.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the buy pipeline against a local fake Solana RPC")
+    parser.add_argument('--trades', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=10, help="trades in flight at the same time")
+    parser.add_argument('--pools', type=int, default=10, help="distinct pools the trades are spread over")
+    parser.add_argument('--latency', type=float, default=0.02, help="seconds added to every RPC call and notification")
+    parser.add_argument('--jitter', type=float, default=0.01)
+    parser.add_argument('--rate-limit', type=int, default=0, help="RPC calls per second before HTTP 429 (0 = unlimited)")
+    parser.add_argument('--drop-rate', type=float, default=0.0, help="share of sent transactions that never land")
+    parser.add_argument('--confirm-delay', type=float, default=0.4, help="seconds from send to the transaction landing")
+    parser.add_argument('--accounts', default=None, help="utils.replay recording to load real account data from")
+    parser.add_argument('--timeout', type=float, default=10.0, help="seconds before a trade counts as timed out")
+    parser.add_argument('--port', type=int, default=8901)
+    return parser.parse_args()
+
+args = parse_args()
+
+# Point every endpoint at the fake cluster before config is imported, and never record a benchmark
+local_url = f"127.0.0.1:{args.port}"
+for name in ('WS_URL', 'PRICE_FEED_WS_URL'):
+    os.environ[name] = f"ws://{local_url}"
+for name in ('RPC_URL', 'QN_RPC_URL', 'METIS_RPC_URL'):
+    os.environ[name] = f"http://{local_url}"
+os.environ['QN_WS_URL'] = ''
+os.environ['RECORD_EVENTS_FILE'] = ''
+
+from utils.fake_rpc import FakeRpcServer, FakeRpcSettings, FakeRpcTransport, FakeSolana
+from utils.replay import instrument_rpc_clients, use_transport
+
+fake = FakeSolana(FakeRpcSettings(
+    latency=args.latency, jitter=args.jitter, rate_limit=args.rate_limit, drop_rate=args.drop_rate, confirm_delay=args.confirm_delay
+))
+transport = use_transport(FakeRpcTransport(fake))
+
+from config import client, qn_client, CONFIRMATION_TIMEOUT
+from raydium import amm_v4
+from utils.chain_state import chain_state
+from utils.confirmation import confirmation_service
+
+def percentile(samples: list, share: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(share * len(ordered)))]
+
+async def timed_buy(semaphore: asyncio.Semaphore, pair_address: str, token_mint: str) -> tuple:
+    """Returns (outcome, seconds) - outcome is 'filled', 'failed' or 'timeout'."""
+    async with semaphore:
+        started_at = time.perf_counter()
+        try:
+            confirmed, _, _ = await asyncio.wait_for(amm_v4.buy(pair_address, token_mint, sol_in=0.01, slippage=10), timeout=args.timeout)
+        except asyncio.TimeoutError:
+            return 'timeout', time.perf_counter() - started_at
+        return ('filled' if confirmed is True else 'failed'), time.perf_counter() - started_at
+
+async def benchmark():
+    if args.accounts:
+        print(f"Loaded {fake.load_recording(args.accounts)} accounts from {args.accounts}")
+    pools = [fake.add_amm_v4_pool() for _ in range(args.pools)]
+
+    server = FakeRpcServer(fake)
+    await server.start(port=args.port)
+    await instrument_rpc_clients(client, qn_client)
+    chain_state.start()
+    confirmation_service.start()
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    started_at = time.perf_counter()
+    results = await asyncio.gather(*(timed_buy(semaphore, *pools[i % len(pools)]) for i in range(args.trades)))
+    elapsed = time.perf_counter() - started_at
+
+    await confirmation_service.stop()
+    await chain_state.stop()
+    await server.stop()
+
+    outcomes = {outcome: [seconds for result, seconds in results if result == outcome] for outcome in ('filled', 'failed', 'timeout')}
+    filled = outcomes['filled']
+    print(f"{args.trades} trades | concurrency: {args.concurrency} | latency: {args.latency * 1000:.0f}ms +{args.jitter * 1000:.0f}ms | "
+          f"rate limit: {args.rate_limit or 'none'} | drop rate: {args.drop_rate:.0%} | confirm delay: {args.confirm_delay}s")
+    print(f"Finished in {elapsed:.2f}s | throughput: {args.trades / elapsed:.1f} trades/s | filled: {len(filled)} | "
+          f"failed: {len(outcomes['failed'])} | timed out: {len(outcomes['timeout'])}")
+    if filled:
+        print(f"Buy call to fill: p50 {percentile(filled, 0.5) * 1000:.0f}ms | p90 {percentile(filled, 0.9) * 1000:.0f}ms | "
+              f"p99 {percentile(filled, 0.99) * 1000:.0f}ms | max {max(filled) * 1000:.0f}ms | mean {statistics.mean(filled) * 1000:.0f}ms")
+    print(f"RPC calls: {sum(fake.calls.values())} | HTTP 429: {transport.rate_limited} | dropped transactions: {fake.dropped}")
+    print(" | ".join(f"{method}: {count}" for method, count in fake.calls.most_common()))
+    if args.timeout > CONFIRMATION_TIMEOUT:
+        print(f"Note: dropped transactions give up after CONFIRMATION_TIMEOUT ({CONFIRMATION_TIMEOUT}s), not --timeout")
+
+if __name__ == "__main__":
+    asyncio.run(benchmark())
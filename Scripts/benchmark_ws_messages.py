@@ -0,0 +1,125 @@
+import json
+import os
+import random
+import string
+import sys
+import time
+
+# Run from the repo root: python Scripts/benchmark_ws_messages.py [recorded_frames.jsonl]
+# A recording holds one raw websocket frame per line. Without one, synthetic full-detail blockNotification frames are used.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.ws_messages import MIGRATION_MARKERS, WITHDRAW_LOG, INITIALIZE2_LOG, decode_transactions
+
+MIGRATION_ADDRESS = '39azUYFWPz3VHgKCf3VChUwbpURdCHRxjWVowf5jUJjg'
+
+FRAMES = 200                # synthetic frames
+TRANSACTIONS_PER_BLOCK = 40 # transactions mentioning the migration address per synthetic block
+MIGRATION_SHARE = 0.05      # share of synthetic frames holding a withdraw or initialize2
+REPEATS = 5                 # passes over the frames per decoder (best pass is reported)
+
+def random_key() -> str:
+    return ''.join(random.choices(string.ascii_letters + string.digits, k=44))
+
+def synthetic_transaction(kind: str=None) -> dict:
+    mint = random_key()
+    logs = [f"Program {random_key()} invoke [1]", "Program log: Instruction: Transfer", f"Program {random_key()} consumed 4645 of 200000 compute units"] * 6
+    if kind == 'withdraw':
+        logs.insert(3, WITHDRAW_LOG)
+    elif kind == 'initialize2':
+        logs.insert(3, INITIALIZE2_LOG)
+    token_balance = lambda owner: {
+        "accountIndex": random.randrange(20), "mint": mint, "owner": owner, "programId": random_key(),
+        "uiTokenAmount": {"amount": str(random.getrandbits(48)), "decimals": 6, "uiAmount": 1.0, "uiAmountString": "1"}
+    }
+    return {
+        "transaction": {
+            "signatures": [random_key() + random_key()],
+            "message": {
+                "accountKeys": [random_key() for _ in range(20)],
+                "header": {"numRequiredSignatures": 1, "numReadonlySignedAccounts": 0, "numReadonlyUnsignedAccounts": 8},
+                "recentBlockhash": random_key(),
+                "instructions": [{"programIdIndex": 5, "accounts": list(range(18)), "data": random_key() * 3, "stackHeight": None}] * 4
+            }
+        },
+        "meta": {
+            "err": None, "fee": 5000, "computeUnitsConsumed": 120000,
+            "preBalances": [random.getrandbits(40) for _ in range(20)],
+            "postBalances": [random.getrandbits(40) for _ in range(20)],
+            "innerInstructions": [{"index": 0, "instructions": [{"programIdIndex": 7, "accounts": [1, 2, 3], "data": random_key()}] * 6}],
+            "logMessages": logs,
+            "preTokenBalances": [token_balance(random_key()) for _ in range(3)],
+            "postTokenBalances": [token_balance(random_key()) for _ in range(2)] + [token_balance(MIGRATION_ADDRESS)],
+            "rewards": [], "loadedAddresses": {"writable": [], "readonly": []}, "status": {"Ok": None}
+        },
+        "version": 0
+    }
+
+def synthetic_frames() -> list:
+    frames = []
+    for slot in range(FRAMES):
+        transactions = [synthetic_transaction() for _ in range(TRANSACTIONS_PER_BLOCK)]
+        if random.random() < MIGRATION_SHARE:
+            transactions[random.randrange(TRANSACTIONS_PER_BLOCK)] = synthetic_transaction(random.choice(['withdraw', 'initialize2']))
+        frames.append(json.dumps({
+            "jsonrpc": "2.0", "method": "blockNotification",
+            "params": {"result": {"context": {"slot": slot}, "value": {"slot": slot, "block": {
+                "blockhash": random_key(), "parentSlot": slot - 1, "blockTime": 1_700_000_000 + slot, "transactions": transactions
+            }, "err": None}}, "subscription": 1}
+        }))
+    return frames
+
+def load_frames(path: str) -> list:
+    with open(path) as f:
+        return [line.rstrip('\n') for line in f if line.strip()]
+
+# Reference - what the listeners did before: json.loads every frame, then scan logMessages line by line
+def json_extract(frame: str) -> list:
+    data = json.loads(frame)
+    found = []
+    if data.get('method') == 'blockNotification':
+        block = data['params']['result']['value'].get('block') or {}
+        for tx in block.get('transactions', []):
+            logs = (tx.get('meta') or {}).get('logMessages') or []
+            if any(marker in log for log in logs for marker in MIGRATION_MARKERS):
+                found.append((tx['transaction']['signatures'][0], tuple(tx['transaction']['message']['accountKeys'])))
+    elif data.get('method') == 'logsNotification':
+        value = data['params']['result']['value']
+        if any(marker in log for log in value.get('logs') or [] for marker in MIGRATION_MARKERS):
+            found.append((value['signature'], ()))
+    return found
+
+def fast_extract(frame: str) -> list:
+    return [
+        (event.signature, tuple(event.transaction.account_keys) if event.transaction else ())
+        for event in decode_transactions(frame)
+    ]
+
+def best_time(extract, frames: list) -> float:
+    best = float('inf')
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        for frame in frames:
+            extract(frame)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+if __name__ == "__main__":
+    random.seed(0)
+    frames = load_frames(sys.argv[1]) if len(sys.argv) > 1 else synthetic_frames()
+    total_bytes = sum(len(frame) for frame in frames)
+
+    # The typed decoder must find exactly the migrations the json.loads scan finds
+    expected = [json_extract(frame) for frame in frames]
+    actual = [fast_extract(frame) for frame in frames]
+    if expected != actual:
+        raise AssertionError("decode_transactions and the json.loads scan disagree")
+    migrations = sum(len(found) for found in expected)
+
+    json_time = best_time(json_extract, frames)
+    fast_time = best_time(fast_extract, frames)
+    print(f"{len(frames)} frames | {total_bytes / len(frames) / 1024:.0f} KB per frame | {migrations} migration transactions")
+    print(f"{'decoder':<26}{'frames/s':>12}{'MB/s':>10}{'us/frame':>12}")
+    for name, elapsed in (('json.loads + scan', json_time), ('pre-filter + msgspec', fast_time)):
+        print(f"{name:<26}{len(frames) / elapsed:>12.0f}{total_bytes / elapsed / 1e6:>10.1f}{elapsed / len(frames) * 1e6:>12.1f}")
+    print(f"Speedup: {json_time / fast_time:.1f}x | both decoders found the same {migrations} migration transactions")
@@ -0,0 +1,120 @@
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import statistics
+import sys
+import time
+
+# Record: run the bot with RECORD_EVENTS_FILE=<path> set - websocket frames and HTTP/RPC responses are appended to <path>.
+# Replay: python Scripts/replay_migrations.py <path> [--target log_subscribe_v4|main] [--speed 1] [--port 8900]
+# The frames are served by a local websocket server and every HTTP/RPC call is answered from the recording, so a burst of
+# migrations runs through the listener, filters and trade stack offline. --speed 0 replays as fast as possible.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# listen_logs (log_subscribe_v4) or listen_for_migrations (run by main.py)
+TARGETS = ('log_subscribe_v4', 'main')
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Replay a recorded migration event stream")
+    parser.add_argument('recording')
+    parser.add_argument('--target', choices=TARGETS, default='log_subscribe_v4')
+    parser.add_argument('--speed', type=float, default=1.0, help="1 = recorded timing, 2 = twice as fast, 0 = as fast as possible")
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--source', default=None, help="websocket url whose frames are replayed (default: the first one recorded)")
+    parser.add_argument('--drain', type=float, default=30.0, help="seconds to keep running after the last frame")
+    return parser.parse_args()
+
+args = parse_args()
+
+# Point every endpoint at the local replay server before config is imported, and never re-record a replay
+local_url = f"127.0.0.1:{args.port}"
+for name in ('WS_URL', 'PRICE_FEED_WS_URL'):
+    os.environ[name] = f"ws://{local_url}"
+for name in ('RPC_URL', 'QN_RPC_URL', 'METIS_RPC_URL'):
+    os.environ[name] = f"http://{local_url}"
+os.environ['QN_WS_URL'] = ''
+os.environ['RECORD_EVENTS_FILE'] = ''
+
+import websockets
+
+from utils.replay import read_events, start_replay
+from utils.ws_messages import INITIALIZE2_LOG, has_marker
+
+# Must run before the target module creates its HTTP/RPC clients
+transport = start_replay(args.recording)
+target = importlib.import_module(args.target)
+
+class ReplayServer:
+    """
+    Local websocket server that streams the recorded frames to every log/block subscription.
+    Other subscriptions (price feed, signature confirmations) are acknowledged and left idle.
+    """
+
+    def __init__(self, frames: list, speed: float):
+        self.frames = frames                # [(recorded wall clock time, text frame)]
+        self.speed = speed
+        self.frames_sent = 0
+        self.initialize2_times: list = []   # time.monotonic() when each frame holding an initialize2 was sent
+        self.done = asyncio.Event()
+
+    async def handler(self, websocket, *_):
+        subscription_ids = 0
+        async for message in websocket:
+            request = json.loads(message)
+            subscription_ids += 1
+            await websocket.send(json.dumps({"jsonrpc": "2.0", "result": subscription_ids, "id": request.get("id")}))
+            if request.get("method") in ('logsSubscribe', 'blockSubscribe'):
+                await self.stream(websocket)
+
+    async def stream(self, websocket):
+        start = time.monotonic()
+        first_timestamp = self.frames[0][0] if self.frames else 0
+        for timestamp, frame in self.frames:
+            if self.speed:
+                delay = (timestamp - first_timestamp) / self.speed - (time.monotonic() - start)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            await websocket.send(frame)
+            self.frames_sent += 1
+            if has_marker(frame, (INITIALIZE2_LOG,)):
+                self.initialize2_times.append(time.monotonic())
+        self.done.set()
+
+def detection_to_send(initialize2_times: list, send_times: list) -> list:
+    """Seconds from each initialize2 frame to the first sendTransaction after it (before the next initialize2)."""
+    latencies = []
+    for i, sent_at in enumerate(initialize2_times):
+        next_frame = initialize2_times[i + 1] if i + 1 < len(initialize2_times) else float('inf')
+        first_send = next((t for t in send_times if sent_at <= t < next_frame), None)
+        if first_send is not None:
+            latencies.append(first_send - sent_at)
+    return latencies
+
+async def replay():
+    ws_events = [event for event in read_events(args.recording) if event.kind == 'ws']
+    source = args.source or (ws_events[0].source if ws_events else None)
+    frames = [(event.timestamp, event.payload.decode()) for event in ws_events if event.source == source]
+    if not frames:
+        print(f"No websocket frames recorded in {args.recording}")
+        return
+
+    server = ReplayServer(frames, args.speed)
+    started_at = time.monotonic()
+    async with websockets.serve(server.handler, '127.0.0.1', args.port):
+        task = asyncio.create_task(target.main())
+        await server.done.wait()
+        replayed_in = time.monotonic() - started_at
+        await asyncio.sleep(args.drain)
+        task.cancel()
+
+    latencies = detection_to_send(server.initialize2_times, transport.send_times)
+    print(f"Replayed {server.frames_sent} frames from {source} in {replayed_in:.2f}s (speed: {args.speed or 'max'})")
+    print(f"HTTP/RPC responses served: {transport.served} | method fallbacks: {transport.fallbacks} | unmatched: {transport.unmatched}")
+    print(f"initialize2 frames: {len(server.initialize2_times)} | sendTransaction calls: {len(transport.send_times)}")
+    if latencies:
+        print(f"Detection -> send: median {statistics.median(latencies) * 1000:.1f}ms | max {max(latencies) * 1000:.1f}ms | trades: {len(latencies)}")
+
+if __name__ == "__main__":
+    asyncio.run(replay())
@@ -13,6 +13,9 @@ load_dotenv()
 
 # Load remaining environment varialbes
 WS_URL = os.getenv('WS_URL', '')
+PRICE_FEED_WS_URL = os.getenv('PRICE_FEED_WS_URL', WS_URL)
+QN_WS_URL = os.getenv('QN_WS_URL', '')
+RECORD_EVENTS_FILE = os.getenv('RECORD_EVENTS_FILE', '')   # append websocket frames and HTTP/RPC responses to this file (utils.replay) - empty disables it
 RPC_URL = os.getenv('RPC_URL', '')
 QN_RPC_URL = os.getenv('QN_RPC_URL', '')
 METIS_RPC_URL = os.getenv('METIS_RPC_URL', '')
@@ -21,7 +24,12 @@ COLD_WALLET_ADDRESS = os.getenv('COLD_WALLET_ADDRESS', '')
 SIGNATURE = os.getenv('RUGCHECK_SIGNATURE')
 TWEET_SCOUT_KEY = os.getenv('TWEET_SCOUT_API_KEY')
 
-# Define the CSVs to save files
+# Define where the migration and trade rows are saved (utils.storage)
+STORAGE_BACKEND = 'sqlite'          # 'sqlite' - one WAL database | 'parquet' - daily partitioned Parquet files (needs pyarrow) | 'csv' - the CSV files below
+STORAGE_SQLITE_FILE = 'bot_data.db'
+STORAGE_PARQUET_DIR = 'data'
+STORAGE_FLUSH_INTERVAL = 5          # seconds between background flushes of the buffered rows
+STORAGE_FLUSH_ROWS = 100            # flush straight away once this many rows are buffered
 CSV_MIGRATIONS_FILE = 'migration_data.csv'
 CSV_TRADES_FILE = 'trade_data.csv'
 
@@ -29,15 +37,66 @@ CSV_TRADES_FILE = 'trade_data.csv'
 STOPLOSS = 0.10                     # trailing stoploss value
 COMMITTMENT_LEVEL = 'finalized'     # level at which sol processing occurs
 RELAY_DELAY = 2                     # time when to reconnect to websocket after it drops
+LISTENER_WS_URLS = [url for url in (WS_URL, QN_WS_URL) if url]  # endpoints the migration log listener subscribes on at once (first arrival wins)
+LISTENER_SUBSCRIPTION = 'blockSubscribe'   # 'blockSubscribe' - full transactions in the notification (no getTransaction) | 'logsSubscribe' - logs only
+LISTENER_DEDUPE_SIZE = 4096         # number of recent signatures remembered to drop the copies delivered by the slower endpoints
+LISTENER_RECV_TIMEOUT = 300         # seconds without a message before a listener endpoint reconnects
+LISTENER_STATS_INTERVAL = 300       # seconds between logs of the per-endpoint arrival stats
+WORKER_POOL_SIZE = 4                # filter workers draining the migration listener queue (utils.worker_pool)
+WORKER_QUEUE_SIZE = 100             # max migration events waiting for a filter worker - further events are dropped and counted
+WORKER_STATS_INTERVAL = 300         # seconds between logs of the worker pool queue depth, drops and latencies
+TRACE_FILE = 'traces.jsonl'         # spans from log notification to confirmed fill are appended here, one JSON line each (utils.tracing) - empty disables it
+TRACE_STATS_INTERVAL = 300          # seconds between logs of the per-stage p50/p99 span latencies
+METRICS_HOST = '127.0.0.1'          # interface the Prometheus metrics endpoint listens on (utils.metrics)
+METRICS_PORT = 9108                 # port of the metrics endpoint - None disables the endpoint and the request instrumentation
 TIME_TO_SLEEP = 15                  # sleep time between api calls for filters_utils functions
 TIMEOUT = 30000                     # sleep time between api calls for filters_utils functions -> mainly for scraping functions
 HTTPX_TIMEOUT = 10                  # timeout specifically for HTTPX
+HTTPX_MAX_CONNECTIONS = 50          # connection pool size for the shared HTTPX client
+HTTPX_MAX_KEEPALIVE = 20            # number of idle keep-alive connections kept in the shared HTTPX client pool
+HTTP_RETRIES = 3                    # max number of attempts for an external API call (http_utils.get_with_backoff)
+HTTP_BACKOFF_BASE = 0.5             # first backoff delay (seconds) - doubles on each retry, with jitter
+HTTP_BACKOFF_MAX = TIME_TO_SLEEP    # cap on a single backoff delay (seconds)
+LOOP_LAG_INTERVAL = 0.5             # how often the event loop lag monitor wakes up (seconds)
+LOOP_LAG_WARN = 0.1                 # log a warning when the event loop was blocked for longer than this (seconds)
 MAX_TRADE_TIME_MINS = 3             # maximum trade duration
+TAKE_PROFIT = 0.40                  # raydium trades: sell the rest of the position when the price is this far above the entry price
+HARD_STOPLOSS = 0.20                # raydium trades: sell when the price is this far below the entry price
+EXIT_LADDER = [(0.25, 50), (TAKE_PROFIT, 100)]  # raydium trades: (gain above entry, % of the original position to sell) take profit rungs - the last rung sells whatever is left
+TRAILING_STOP_ACTIVATION = 0.20     # raydium trades: the STOPLOSS trailing stop only arms once the high is this far above entry
+TIME_DECAY_START = 0.5              # raydium trades: fraction of MAX_TRADE_TIME_MINS after which the next take profit target starts to decay
+TIME_DECAY_FLOOR = 0.25             # raydium trades: share of the take profit distance above entry left at the deadline
+POSITION_CHECK_INTERVAL = 1         # seconds between position manager ticks (catches deadlines on pools with no price updates)
+POSITION_TABLE_CAPACITY = 64        # initial number of rows in the position table - grows automatically
+POSITION_MAX_EXIT_FAILURES = 5      # failed sells in a row before the position manager abandons a position
 SELL_LOOP_DELAY = 10                # delay between api calls in execute_sell function
 MONITOR_PRICE_DELAY = 3             # length of time between price API calls -> to prevent rate limit
 PRICE_LOOP_RETRIES = 5              # max number of times to attempt to fetch a rpice
+POOL_KEYS_CACHE_TTL = 3600          # seconds an AMM v4 pool keys entry stays in the in-memory cache (keys never change once a pool exists)
+POOL_KEYS_CACHE_MAX_SIZE = 256      # max number of pools held in the in-memory pool keys cache (least recently used are evicted)
+POOL_KEYS_REDIS_DB = None           # redis db for the second-tier pool keys cache - None disables it
+CORRELATION_TTL = 600               # seconds a withdraw waits for its initialize2 before it is dropped from the correlation store
+CORRELATION_MAX_SIZE = 1024         # max number of pending withdraws held in the correlation store (oldest are evicted)
+CORRELATION_REDIS_DB = 2            # redis db the pending withdraws are persisted to (survives restarts) - None disables it
+CORRELATION_VERDICT_TIMEOUT = 5      # seconds an initialize2 waits for the filter verdict of a withdraw whose filters are still running
+RESERVE_POLL_INTERVAL = 1          # seconds between batched reserve reads of all open pools while the price feed websocket is down
+BLOCKHASH_MAX_AGE = 30              # seconds a cached blockhash is reused for before fetching a new one (blockhashes expire after ~60s)
+BLOCKHASH_REFRESH_INTERVAL = 5      # seconds between background blockhash refreshes (utils.chain_state)
+CONFIRMATION_TIMEOUT = 45          # seconds to wait for a transaction to confirm before giving up
+CONFIRMATION_POLL_INTERVAL = 1      # seconds between shared getSignatureStatuses polls of all pending signatures (utils.confirmation)
+CONFIRMATION_POLL_AFTER = 5         # seconds a signature waits on its websocket subscription before it is also polled
+CONFIRMATION_DETAIL_RETRIES = 3     # attempts at fetching the full transaction once its signature has confirmed
+CONFIRMATION_DETAIL_CONCURRENCY = 8 # max concurrent getTransaction calls made by the signature status poller
+SIMULATE_BUY = True                 # simulate buy transactions before sending them (costs an RPC round trip)
 START_UP_SLEEP = 5                  # number of seconds after migration before attempting to buy -> often an error occurs if too soon
 
+# Define the per-source filter deadlines (seconds from when the filter lookups are fanned out)
+FILTER_DEADLINES = {
+    'rugcheck': 3.0,                # RugCheck report - required for the filter verdict
+    'dexscreener': 3.0,             # DexScreener orders - required for the filter verdict
+    'ipfs': 4.5,                    # IPFS metadata - chained onto RugCheck (needs the metadata uri), informational only
+}
+
 # Define SOL constants
 SOL_DECIMALS = 9
 TRADE_AMOUNT_SOL = 0.01
@@ -48,6 +107,8 @@ SOL_MINT = 'So11111111111111111111111111111111111111112'
 
 # Define priority fee ranges
 FEE_LEVELS = ['50', '55', '60', '65', '70', '75', '85']
+SUBMISSION_STRATEGY = 'parallel'                # 'serial' - escalate through FEE_LEVELS one at a time | 'parallel' - broadcast PARALLEL_FEE_LEVELS at once
+PARALLEL_FEE_LEVELS = [['50', '65', '85']]      # groups of fee levels broadcast together (a later group is only tried if the earlier one fails)
 PRIORITY_FEE_MIN=30_000
 PRIORITY_FEE_MAX=500_000
 PRIORITY_FEE_NUM_BLOCKS=100
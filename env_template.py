@@ -1,5 +1,6 @@
 # RPC connections
 WS_URL = ""
+QN_WS_URL = ""
 RPC_URL = ""
 METIS_RPC_URL = ""
 # RPC_URL = ""
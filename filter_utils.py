@@ -8,9 +8,12 @@ import re
 from urllib.parse import urlparse
 import asyncio
 import time
+from typing import Awaitable, Callable, Optional
 import httpx
-import requests
-from config import WALLET_ADDRESS, SIGNATURE, TWEET_SCOUT_KEY, TIME_TO_SLEEP, TIMEOUT, PRIVATE_KEY, RAYDIUM_ADDRESS, migrations_logger
+from http_utils import get_with_backoff
+from config import WALLET_ADDRESS, SIGNATURE, TWEET_SCOUT_KEY, TIMEOUT, PRIVATE_KEY, RAYDIUM_ADDRESS, FILTER_DEADLINES, migrations_logger
+from utils.metrics import filter_results
+from utils.tracing import tracer
 
 # TweetScout endpoint to get twitter ID from the username. The also have the reverse endpoing (get handle from ID)
 # https://api.tweetscout.io/v2/handle-to-id/{user_handle}
@@ -18,7 +21,7 @@ from config import WALLET_ADDRESS, SIGNATURE, TWEET_SCOUT_KEY, TIME_TO_SLEEP, TI
 # Check to see if DexScreener enhanced listing has been paid 
 async def get_dex_paid(httpx_client, token_mint_address):
     try:
-        response = await httpx_client.get(f'https://api.dexscreener.com/orders/v1/solana/{token_mint_address}', headers={})
+        response = await get_with_backoff(f'https://api.dexscreener.com/orders/v1/solana/{token_mint_address}', httpx_client=httpx_client, headers={})
         data = response.json()
     
         if not data:
@@ -27,7 +30,6 @@ async def get_dex_paid(httpx_client, token_mint_address):
     
     except Exception as e:
         migrations_logger.error(f'Dexscreener error: {e}')
-        time.sleep(TIME_TO_SLEEP)
         return None, None
 
 
@@ -39,13 +41,12 @@ async def tweet_scout_get_followers(twitter_handle):
         params = {'user_handle': twitter_handle}
         url = 'https://api.tweetscout.io/v2/followers-stats'
 
-        response = requests.get(url=url, headers=headers, params=params, timeout=30)
+        response = await get_with_backoff(url, headers=headers, params=params, timeout=30)
         data = response.json()
         return data
     
     except Exception as e:
         migrations_logger.error(f'TweetScout get_followers error: {e}')
-        time.sleep(TIME_TO_SLEEP)
         return {}
 
 
@@ -56,13 +57,12 @@ async def tweet_scout_get_score(twitter_handle):
         headers = {'Accept': 'application/json', 'ApiKey': TWEET_SCOUT_KEY}
         url = f'https://api.tweetscout.io/v2/score/{twitter_handle}'
         
-        response = requests.get(url=url, headers=headers)
+        response = await get_with_backoff(url, headers=headers)
         score = response.json()
         return score
     
     except Exception as e:
         migrations_logger.error(f'TweetScout get_score error: {e}')
-        time.sleep(TIME_TO_SLEEP)
         return {}
 
 
@@ -72,12 +72,11 @@ async def tweet_scout_get_top_followers(twitter_handle):
     try:
         headers = {'Accept': 'application/json', 'ApiKey': TWEET_SCOUT_KEY}
         url = f'https://api.tweetscout.io/v2/top-followers/{twitter_handle}'
-        response = requests.get(url=url, headers=headers)
+        response = await get_with_backoff(url, headers=headers)
         score = response.json()
         return score
     except Exception as e:
         migrations_logger.error(f'TweetScout get_top_followers error: {e}')
-        time.sleep(TIME_TO_SLEEP)
         return []
 
 
@@ -87,12 +86,11 @@ async def tweet_scout_get_user_info(twitter_handle):
     try:
         headers = {'Accept': 'application/json', 'ApiKey': TWEET_SCOUT_KEY}
         url = f'https://api.tweetscout.io/v2/info/{twitter_handle}'
-        response = requests.get(url=url, headers=headers)
+        response = await get_with_backoff(url, headers=headers)
         user_info = response.json()
         return user_info
     except Exception as e:
         migrations_logger.error(f'TweetScout get_user_info error: {e}')
-        time.sleep(TIME_TO_SLEEP)
         return {}
 
 
@@ -103,7 +101,7 @@ async def tweet_scout_get_recycled_handles(twitter_handle):
         headers = {'Accept': 'application/json', 'ApiKey': TWEET_SCOUT_KEY}
         url = 'https://api.tweetscout.io/v2/handle-history'
 
-        response = requests.get(url=url, headers=headers, params=querystring)
+        response = await get_with_backoff(url, headers=headers, params=querystring)
         handle_info = response.json()
         
         if handle_info.get('message', ''):
@@ -114,7 +112,6 @@ async def tweet_scout_get_recycled_handles(twitter_handle):
             return {'handles_count': count, 'previous_handles': handles}
     except Exception as e:
         migrations_logger.error(f'TweetScout get_user_info error: {e}0')
-        time.sleep(TIME_TO_SLEEP)
         return {}
 
 
@@ -515,6 +512,49 @@ def is_domain_allowed(url: str) -> bool:
     return True
 
 
+# Add the IPFS social links to the RugCheck metadata
+def add_ipfs_data(metadata: dict, ipfs_data: dict):
+    """
+    Merges the output of get_ipfs_data into the metadata dictionary (in place).
+
+    Args:
+        metadata (dict): The output from fetch_token_metadata function.
+        ipfs_data (dict): The output from get_ipfs_data function. None if the IPFS fetch did not complete.
+
+    Returns:
+        dict: The updated metadata dictionary.
+    """
+    ipfs_data = ipfs_data or {}
+    metadata['ipfs_url'] = ipfs_data.get('ipfs_url', '')
+    metadata['ipfs_description'] = ipfs_data.get('ifps_description', '')
+    metadata['twitter_url'] = ipfs_data.get('twitter', '')
+    metadata['twitter_handle'] = extract_twitter_handle_or_false(metadata['twitter_url'])
+    metadata['telegram_url'] = ipfs_data.get('telegram', '')
+    metadata['website_url'] = ipfs_data.get('website', '')
+
+    if metadata['website_url'] and metadata['website_url'] is not None:
+        metadata['website_valid'] = is_domain_allowed(metadata['website_url'])
+    else:
+        metadata['website_valid'] = False
+    return metadata
+
+
+# Metadata, risks and holder metrics from a RugCheck report
+def parse_rugcheck_report(token_details: dict):
+    """
+    Extracts everything the filters use from a RugCheck report.
+
+    Args:
+        token_details (dict): The output from fetch_token_details function.
+
+    Returns:
+        tuple: (metadata, risks, holder_metrics). metadata is an empty dict if it could not be extracted.
+    """
+    metadata = fetch_token_metadata(token_details) or {}
+    metadata['image_url'] = (token_details.get('fileMeta') or {}).get('image')
+    return metadata, identify_risks(token_details), holder_analysis(token_details)
+
+
 # RugCheck wrapper function
 async def rugcheck_analysis(httpx_client: httpx.AsyncClient, token_mint_address: str, download_image: bool=False, save_path: str='./images'):
     """
@@ -534,35 +574,17 @@ async def rugcheck_analysis(httpx_client: httpx.AsyncClient, token_mint_address:
             # migrations_logger.error('Failed to fetch token details.')
             return None, None, None
         
-        # Token metadata
-        metadata = fetch_token_metadata(token_details)
+        # Token metadata, risks and holder analysis
+        metadata, risks, holder_metrics = parse_rugcheck_report(token_details)
 
         # IPFS data (social links)
-        ipfs_data = await get_ipfs_data(httpx_client, token_details.get('tokenMeta', {}).get('uri', ''))
-        metadata['ipfs_url'] = ipfs_data.get('ipfs_url', '')
-        metadata['ipfs_description'] = ipfs_data.get('ifps_description', '')
-        metadata['twitter_url'] = ipfs_data.get('twitter', '')
-        metadata['twitter_handle'] = extract_twitter_handle_or_false(metadata['twitter_url'])
-        metadata['telegram_url'] = ipfs_data.get('telegram', '')
-        metadata['website_url'] = ipfs_data.get('website', '')
-
-        if metadata['website_url'] and metadata['website_url'] is not None:
-            metadata['website_valid'] = is_domain_allowed(metadata['website_url'])
-        else:
-            metadata['website_valid'] = False
-        
-        # Image URL
-        image_url = token_details.get('fileMeta', {}).get('image')
-        metadata['image_url'] = image_url
+        ipfs_data = await get_ipfs_data(httpx_client, (token_details.get('tokenMeta') or {}).get('uri', ''))
+        add_ipfs_data(metadata, ipfs_data)
 
         # Download image if required
-        if download_image and image_url:
+        if download_image and metadata['image_url']:
             image_path = await download_token_image(httpx_client, token_details, token_mint_address, save_path)
             metadata['image_path'] = image_path
-        
-        # Risks and holder analysis
-        risks = identify_risks(token_details)
-        holder_metrics = holder_analysis(token_details)
 
         # logger.info(f"Rugcheck Analysis: {result}")
         return metadata, risks, holder_metrics
@@ -572,40 +594,139 @@ async def rugcheck_analysis(httpx_client: httpx.AsyncClient, token_mint_address:
         return None, None, None
 
 
+# Await a fanned-out filter lookup, giving up once the source's deadline has passed
+async def await_with_deadline(task: asyncio.Task, source: str, deadline: float):
+    """
+    Waits for a filter lookup task until an absolute deadline (event loop time).
+    A task that is still running when the deadline passes is cancelled.
+
+    Args:
+        task (asyncio.Task): The lookup task started by process_new_tokens.
+        source (str): Name of the data source - used for logging.
+        deadline (float): Absolute deadline in event loop time (loop.time()).
+
+    Returns:
+        tuple: (result, timed_out). result is None if the deadline was missed.
+    """
+    timeout = max(deadline - asyncio.get_running_loop().time(), 0)
+    try:
+        return await asyncio.wait_for(task, timeout=timeout), False
+    except asyncio.TimeoutError:
+        migrations_logger.warning(f'{source} lookup missed its deadline - continuing with a partial verdict')
+        return None, True
+
+
 # Run the various token filters
-async def process_new_tokens(httpx_client, token_address):
-    
+async def process_new_tokens(
+    httpx_client, 
+    token_address, 
+    deadlines: dict=FILTER_DEADLINES, 
+    on_verdict: Optional[Callable[[bool, dict], Awaitable]]=None
+):
+    """
+    Runs the token filters with every independent lookup started at the same time.
+
+    RugCheck and DexScreener are fanned out together. The IPFS fetch needs the metadata uri
+    from RugCheck, so it is chained onto the RugCheck task rather than waiting for the whole pipeline.
+    Each source has its own deadline (measured from the fan-out). If a source misses it, the
+    verdict is made with the data that has arrived - missing RugCheck or DexScreener data fails the filters.
+
+    The verdict only needs RugCheck and DexScreener, so it is made before waiting on IPFS. on_verdict is
+    awaited with (filters_result, data_to_save) at that point - the IPFS data is merged into
+    data_to_save['metadata'] afterwards, as it is only saved for analysis.
+
+    Args:
+        httpx_client (httpx.AsyncClient): The async HTTP client instance.
+        token_address (str): The token mint address to filter.
+        deadlines (dict): Per-source deadlines in seconds - keys 'rugcheck', 'dexscreener' and 'ipfs'.
+        on_verdict (callable): Optional coroutine function called as soon as the verdict is known.
+
+    Returns:
+        tuple: (filters_result, data_to_save). (None, None) if RugCheck returned no data.
+    """
+    loop = asyncio.get_running_loop()
+    start_time = loop.time()
+    started_at = time.monotonic()
+
+    # Fan out the independent lookups - each one is a stage of the token's trace (utils.tracing)
+    rugcheck_task = asyncio.create_task(tracer.timed('rugcheck', fetch_token_details(httpx_client, token_address)))
+    dex_task = asyncio.create_task(tracer.timed('dexscreener', get_dex_paid(httpx_client=httpx_client, token_mint_address=token_address)))
+
+    async def ipfs_after_rugcheck():
+        token_details = await rugcheck_task
+        if not token_details:
+            return None
+        return await tracer.timed('ipfs', get_ipfs_data(httpx_client, (token_details.get('tokenMeta') or {}).get('uri', '')))
+    ipfs_task = asyncio.create_task(ipfs_after_rugcheck())
+
     # Perform RugCheck analysis
-    metadata, risks, holder_metrics = await rugcheck_analysis(httpx_client=httpx_client, token_mint_address=token_address)
-    if metadata is None:
+    timed_out = []
+    token_details, rugcheck_timed_out = await await_with_deadline(rugcheck_task, 'RugCheck', start_time + deadlines['rugcheck'])
+    if rugcheck_timed_out:
+        timed_out.append('rugcheck')
+    elif not token_details:
+        dex_task.cancel()
+        ipfs_task.cancel()
+        filter_results.inc(result='no_data')
         return None, None
     
-    migrations_logger.info(f'Rugcheck done for {token_address}')
+    if token_details:
+        metadata, risks, holder_metrics = parse_rugcheck_report(token_details)
+        migrations_logger.info(f'Rugcheck done for {token_address}')
+    else:
+        metadata, risks, holder_metrics = {}, None, None
 
     # Extract and log token symbol and name
-    if metadata is not None:
-        symbol = metadata.get('symbol', '')
-        name = metadata.get('name', '')
-        migrations_logger.info(f'Symbol: {symbol} - Name: {name}')
-    else: 
-        migrations_logger.error(f'Rugcheck error for: {token_address}')
+    symbol = metadata.get('symbol', '')
+    name = metadata.get('name', '')
+    migrations_logger.info(f'Symbol: {symbol} - Name: {name}')
 
     # Determine is DexScreener has been paid and log the result
-    is_dex_paid_parsed, is_dex_paid_raw = await get_dex_paid(httpx_client=httpx_client, token_mint_address=token_address)
+    dex_result, dex_timed_out = await await_with_deadline(dex_task, 'DexScreener', start_time + deadlines['dexscreener'])
+    if dex_timed_out:
+        timed_out.append('dexscreener')
+        is_dex_paid_parsed, is_dex_paid_raw = None, None
+    else:
+        is_dex_paid_parsed, is_dex_paid_raw = dex_result
     migrations_logger.info(f'DexScreener done for {token_address}')
 
-    # Perform trade filters and log the result
+    # Perform trade filters and log the result - the verdict does not wait for IPFS
     filters_result = await trade_filters(risks, holder_metrics, is_dex_paid_parsed)
-    migrations_logger.info(f'Potential trade: {symbol} - {token_address} - {filters_result}')
+    filter_results.inc(result='passed' if filters_result is True else 'failed')
+    trace = tracer.current()
+    if trace is not None:
+        tracer.record(trace, 'filter', started_at, time.monotonic())
+    elapsed = loop.time() - start_time
+    migrations_logger.info(f'Potential trade: {symbol} - {token_address} - {filters_result} | filters took {elapsed:.2f}s | timed out: {timed_out}')
     
     data_to_save = {
         'metadata': metadata, 
         'risks': risks, 
         'holder_metrics': holder_metrics, 
         'is_dex_paid_parsed': is_dex_paid_parsed, 
-        'is_dex_paid_raw': is_dex_paid_raw
+        'is_dex_paid_raw': is_dex_paid_raw,
+        'timed_out_sources': timed_out
         }
     
+    if on_verdict is not None:
+        try:
+            await on_verdict(filters_result, data_to_save)
+        except BaseException:
+            # Nothing will wait for the IPFS lookup any more
+            ipfs_task.cancel()
+            raise
+
+    # IPFS data (social links) - only saved for analysis. It is chained onto RugCheck, so skip it if RugCheck missed its deadline
+    if rugcheck_timed_out:
+        ipfs_task.cancel()
+        ipfs_data, ipfs_timed_out = None, True
+    else:
+        ipfs_data, ipfs_timed_out = await await_with_deadline(ipfs_task, 'IPFS', start_time + deadlines['ipfs'])
+    if ipfs_timed_out:
+        timed_out.append('ipfs')
+    if token_details:
+        add_ipfs_data(metadata, ipfs_data)
+    
     return filters_result, data_to_save
 
 
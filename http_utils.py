@@ -0,0 +1,100 @@
+import asyncio
+import random
+import httpx
+from config import (HTTPX_TIMEOUT, HTTPX_MAX_CONNECTIONS, HTTPX_MAX_KEEPALIVE, HTTP_RETRIES, HTTP_BACKOFF_BASE, HTTP_BACKOFF_MAX,
+                    LOOP_LAG_INTERVAL, LOOP_LAG_WARN, migrations_logger)
+from utils.metrics import event_loop_lag
+from utils.replay import http_transport
+
+# Status codes that are worth retrying - rate limits and transient server errors
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Shared pooled client used by the external-API helpers (created lazily so it binds to the running loop)
+_shared_httpx_client = None
+
+# Latest event loop lag measurements - updated by monitor_loop_lag
+loop_lag_stats = {'last': 0.0, 'max': 0.0, 'blocked_count': 0}
+
+
+# Create a pooled HTTPX client
+def create_httpx_client(timeout: float=HTTPX_TIMEOUT) -> httpx.AsyncClient:
+    """
+    Creates an httpx.AsyncClient with a bounded connection pool and keep-alive connections,
+    so repeated calls to the same API reuse their TCP/TLS connections.
+    Requests go through utils.replay.http_transport - counted by utils.metrics, and recorded or replayed when enabled.
+    """
+    limits = httpx.Limits(max_connections=HTTPX_MAX_CONNECTIONS, max_keepalive_connections=HTTPX_MAX_KEEPALIVE)
+    return httpx.AsyncClient(timeout=timeout, limits=limits, transport=http_transport(limits))
+
+
+# Get the process-wide HTTPX client
+def get_httpx_client() -> httpx.AsyncClient:
+    global _shared_httpx_client
+    if _shared_httpx_client is None or _shared_httpx_client.is_closed:
+        _shared_httpx_client = create_httpx_client()
+    return _shared_httpx_client
+
+
+# Work out how long to wait before the next attempt
+def backoff_delay(attempt: int, response: httpx.Response=None) -> float:
+    """
+    Exponential backoff with full jitter. A Retry-After header (in seconds) takes precedence.
+    """
+    if response is not None:
+        retry_after = response.headers.get('Retry-After')
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), HTTP_BACKOFF_MAX)
+    return random.uniform(0, min(HTTP_BACKOFF_BASE * 2 ** attempt, HTTP_BACKOFF_MAX))
+
+
+# GET request with async retries - never blocks the event loop
+async def get_with_backoff(url: str, httpx_client: httpx.AsyncClient=None, retries: int=HTTP_RETRIES, **kwargs) -> httpx.Response:
+    """
+    Makes a GET request, retrying on connection errors, timeouts, 429 and 5xx responses.
+
+    Args:
+        url (str): The URL to request.
+        httpx_client (httpx.AsyncClient): Client to use. Defaults to the shared pooled client.
+        retries (int): Maximum number of attempts.
+        **kwargs: Passed through to httpx.AsyncClient.get (headers, params, ...).
+
+    Returns:
+        httpx.Response: The last response received. Raises the last exception if no response was received.
+    """
+    httpx_client = httpx_client or get_httpx_client()
+    for attempt in range(retries):
+        response = None
+        try:
+            response = await httpx_client.get(url, **kwargs)
+            if response.status_code not in RETRY_STATUS_CODES:
+                return response
+            migrations_logger.warning(f'HTTP {response.status_code} from {url} - attempt {attempt + 1}/{retries}')
+        except httpx.HTTPError as e:
+            migrations_logger.warning(f'HTTP error from {url}: {e} - attempt {attempt + 1}/{retries}')
+            if attempt == retries - 1:
+                raise
+        
+        if attempt < retries - 1:
+            await asyncio.sleep(backoff_delay(attempt, response))
+    return response
+
+
+# Measure how long the event loop is blocked for
+async def monitor_loop_lag(interval: float=LOOP_LAG_INTERVAL, warn_threshold: float=LOOP_LAG_WARN):
+    """
+    Sleeps for a fixed interval and measures how late it wakes up. Any lateness is time during which
+    the event loop was blocked (e.g. by a synchronous HTTP call or time.sleep), stalling the websocket
+    readers and trade monitors. Run it as a background task: asyncio.create_task(monitor_loop_lag()).
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lag = loop.time() - start - interval
+        
+        loop_lag_stats['last'] = lag
+        event_loop_lag.observe(max(lag, 0))
+        loop_lag_stats['max'] = max(loop_lag_stats['max'], lag)
+        if lag > warn_threshold:
+            loop_lag_stats['blocked_count'] += 1
+            migrations_logger.warning(f'Event loop was blocked for {lag:.3f}s (max so far: {loop_lag_stats["max"]:.3f}s)')
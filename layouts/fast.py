@@ -0,0 +1,125 @@
+import struct
+from construct import BytesInteger, Bytes, Flag, FormatField, Padded, Pass, Renamed, SizeofError
+
+from layouts.amm_v4 import LIQUIDITY_STATE_LAYOUT_V4, MARKET_STATE_LAYOUT_V3
+from layouts.clmm import CLMM_POOL_STATE_LAYOUT
+from layouts.cpmm import CPMM_POOL_STATE_LAYOUT
+
+# Compiles fixed size construct Structs into a single struct.Struct + a __slots__ record class.
+#
+# Primitive fields (ints, flags, fixed bytes, byte integers) are unpacked in one struct.unpack_from call.
+# Everything else (nested structs, arrays, adapters, bit structs) is decoded lazily by its own construct
+# subcon from a memoryview slice, only when the attribute is first read. construct stays the reference
+# implementation - tests/test_layouts.py checks that both decode the same values.
+
+class FastRecord:
+    __slots__ = ('_data',)
+
+    def __getitem__(self, name):
+        return getattr(self, name)
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self._fields}
+
+class FastLayout:
+    def __init__(self, layout, name: str):
+        self.layout = layout
+        self.name = name
+        self.struct, self.record_class, self._build = _compile(layout, name)
+        self.size = self.struct.size
+
+    def parse(self, data) -> FastRecord:
+        view = memoryview(data)
+        return self._build(view, self.struct.unpack_from(view))
+
+    def __repr__(self):
+        return f"<FastLayout {self.name} {self.size} bytes>"
+
+# struct codes for construct's primitive FormatFields
+def _format_code(subcon) -> str:
+    return subcon.fmtstr.lstrip('<>=!')
+
+def _lazy_property(subcon, offset: int, size: int, slot: str):
+    def getter(self):
+        try:
+            return getattr(self, slot)
+        except AttributeError:
+            value = subcon.parse(self._data[offset:offset + size])
+            setattr(self, slot, value)
+            return value
+    return property(getter)
+
+def _compile(layout, name: str) -> tuple:
+    fmt = ['<']
+    fields = []             # field names in layout order
+    slots = []
+    namespace = {}
+    assignments = []        # generated lines of the record builder
+    index = 0               # index into the unpacked tuple
+    offset = 0
+
+    for subcon in layout.subcons:
+        field_name = subcon.name if isinstance(subcon, Renamed) else None
+        inner = subcon.subcon if isinstance(subcon, Renamed) else subcon
+        try:
+            size = inner.sizeof()
+        except SizeofError:
+            raise ValueError(f"{name}: {field_name or inner} is not fixed size - parse this layout with construct instead")
+
+        if field_name is None:
+            # Unnamed subcons (Padding, Const, ...) are not exposed by construct either, just skipped
+            fmt.append(f'{size}x')
+            offset += size
+            continue
+
+        fields.append(field_name)
+        if isinstance(inner, FormatField):
+            fmt.append(_format_code(inner))
+            assignments.append(f"    r.{field_name} = v[{index}]")
+            index += 1
+            slots.append(field_name)
+        elif type(inner) is Flag:
+            fmt.append('?')
+            assignments.append(f"    r.{field_name} = v[{index}]")
+            index += 1
+            slots.append(field_name)
+        elif type(inner) is Bytes and isinstance(inner.length, int):
+            fmt.append(f'{size}s')
+            assignments.append(f"    r.{field_name} = v[{index}]")
+            index += 1
+            slots.append(field_name)
+        elif type(inner) is BytesInteger and isinstance(inner.length, int):
+            fmt.append(f'{size}s')
+            byteorder = 'little' if inner.swapped else 'big'
+            assignments.append(f"    r.{field_name} = _from_bytes(v[{index}], '{byteorder}', signed={inner.signed})")
+            index += 1
+            slots.append(field_name)
+        elif type(inner) is Padded and type(inner.subcon) is type(Pass):
+            # Named padding - construct returns None
+            fmt.append(f'{size}x')
+            assignments.append(f"    r.{field_name} = None")
+            slots.append(field_name)
+        else:
+            fmt.append(f'{size}x')
+            slot = f'_lazy_{field_name}'
+            slots.append(slot)
+            namespace[field_name] = _lazy_property(inner, offset, size, slot)
+        offset += size
+
+    namespace['__slots__'] = tuple(slots)
+    namespace['_fields'] = tuple(fields)
+    record_class = type(name, (FastRecord,), namespace)
+
+    source = "\n".join(["def build(data, v):", "    r = _new(_cls)", "    r._data = data", *assignments, "    return r"])
+    scope = {'_new': object.__new__, '_cls': record_class, '_from_bytes': int.from_bytes}
+    exec(source, scope)
+    return struct.Struct(''.join(fmt)), record_class, scope['build']
+
+def compile_layout(layout, name: str) -> FastLayout:
+    return FastLayout(layout, name)
+
+# Precompiled decoders - drop-in replacements for LAYOUT.parse(data) where only attribute access is used
+LIQUIDITY_STATE_V4 = compile_layout(LIQUIDITY_STATE_LAYOUT_V4, 'LiquidityStateV4')
+MARKET_STATE_V3 = compile_layout(MARKET_STATE_LAYOUT_V3, 'MarketStateV3')
+CPMM_POOL_STATE = compile_layout(CPMM_POOL_STATE_LAYOUT, 'CpmmPoolState')
+CLMM_POOL_STATE = compile_layout(CLMM_POOL_STATE_LAYOUT, 'ClmmPoolState')
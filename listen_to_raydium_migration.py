@@ -5,13 +5,14 @@ from solders.pubkey import Pubkey   # type: ignore
 from datetime import datetime, timezone
 from config import MIGRATION_ADDRESS, WS_URL, RPC_URL, RELAY_DELAY, migrations_logger
 from storage_utils import store_token_address, fetch_token_address
+from utils.ws_messages import INITIALIZE2_LOG, Transaction, decode_transactions
 
 # Parse the instruction
-async def process_initialize2_transaction(data, redis_client_tokens, queue):
+async def process_initialize2_transaction(data: Transaction, redis_client_tokens, queue):
     """Process and decode an initialize2 transaction"""
     try:
-        signature = data['transaction']['signatures'][0]
-        account_keys = data['transaction']['message']['accountKeys']
+        signature = data.signature
+        account_keys = data.account_keys
         if len(account_keys) > 18:
             token_address = account_keys[18]
             pair_address = account_keys[2]
@@ -59,18 +60,9 @@ async def listen_for_migrations(redis_client_tokens, queue):
             while True:
                 try:
                     response = await asyncio.wait_for(websocket.recv(), timeout=30)
-                    data = json.loads(response)
-                    if 'method' in data and data['method'] == 'blockNotification' and ('params' in data) and ('result' in data['params']):
-                        block_data = data['params']['result']
-                        if 'value' in block_data and 'block' in block_data['value']:
-                            block = block_data['value']['block']
-                            if 'transactions' in block:
-                                for tx in block['transactions']:
-                                    logs = tx.get('meta', {}).get('logMessages', [])
-                                    for log in logs:
-                                        if 'Program log: initialize2: InitializeInstruction2' in log:
-                                            await process_initialize2_transaction(tx, redis_client_tokens, queue)
-                                            break
+                    # Only blocks holding an initialize2 are decoded, and only the fields we read
+                    for event in decode_transactions(response, markers=(INITIALIZE2_LOG,)):
+                        await process_initialize2_transaction(event.transaction, redis_client_tokens, queue)
                 except asyncio.TimeoutError:
                     pass
 
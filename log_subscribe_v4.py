@@ -5,9 +5,13 @@ import json
 import httpx
 import re
 import aiohttp
+import msgspec
+import time
 from datetime import datetime
-from config import MIGRATION_ADDRESS, WS_URL, RPC_URL, RELAY_DELAY, migrations_logger, HTTPX_TIMEOUT, SELL_SLIPPAGE
+from config import (MIGRATION_ADDRESS, WS_URL, RPC_URL, RELAY_DELAY, migrations_logger, HTTPX_TIMEOUT, SELL_SLIPPAGE, LISTENER_WS_URLS, LISTENER_STATS_INTERVAL, 
+                    client, qn_client)
 from pprint import pprint
+from typing import Optional
 
 from solders.signature import Signature  # type: ignore
 from solana.rpc.commitment import Processed, Confirmed, Finalized
@@ -16,58 +20,101 @@ from solana.rpc.async_api import AsyncClient
 from filter_utils import process_new_tokens, trade_filters
 from storage_utils import parse_migrations_to_save
 from trade_utils_raydium import raydium_trade_wrapper# , startup_sell
+from raydium.amm_v4 import prepare_buy
 from trade_utils import startup_sell
+from http_utils import create_httpx_client, monitor_loop_lag
+from utils.chain_state import chain_state
+from utils.correlation_store import CorrelationStore, create_correlation_store
+from utils.log_listener import LogListener
+from utils.metrics import metrics_server, migrations_seen
+from utils.replay import instrument_rpc_clients
+from utils.tracing import tracer
+from utils.ws_messages import WITHDRAW_LOG, Transaction, TransactionEvent, TransactionResponse, decode_transaction_response
 
 # Initialize the rpc_client and httpx_client globally.
 rpc_client = AsyncClient(RPC_URL)
-httpx_client = httpx.AsyncClient(timeout=HTTPX_TIMEOUT)
+httpx_client = create_httpx_client()
 redis_client_trades = redis.Redis(host='localhost', port=6379, db=1)
 
-async def fetch_transaction_details(signature, pending_trades, is_withdraw=True):
-    """Fetch full transaction details using getParsedTransaction."""
+# Tracks tokens from withdraw events and their filter outcomes until the initialize2 arrives - survives reconnects
+pending_trades = create_correlation_store('pending_trades')
+
+async def get_transaction_result(signature: str) -> Optional[Transaction]:
+    """Fetch full transaction details using getTransaction - only needed when the notification did not carry them."""
+    # Convert the signature string to the appropriate Signature type.
+    sig = Signature.from_string(signature)
+    
+    # Fetch the transaction details.
+    details = await rpc_client.get_transaction(
+        sig,
+        'json',
+        commitment=Confirmed,
+        max_supported_transaction_version=0
+    )
+    
+    # Decode only the fields we read (the same schema as the blockSubscribe transactions).
+    if isinstance(details, dict):
+        return msgspec.convert(details, TransactionResponse).result
+    return decode_transaction_response(details.to_json())
+
+def start_migration_trace(token_mint: str, received_at: float, dispatched_at: float, source: str, event: str) -> None:
+    """Starts the mint's trace at the notification and records the ws_recv and tx_fetch stages."""
+    resolved_at = time.monotonic()
+    trace = tracer.start_trace(token_mint, received_at or dispatched_at)
+    tracer.record(trace, 'ws_recv', trace.started_at, dispatched_at, event=event)
+    tracer.record(trace, 'tx_fetch', dispatched_at, resolved_at, event=event, source=source)
+
+async def fetch_transaction_details(signature, pending_trades: CorrelationStore, is_withdraw=True, transaction: Optional[Transaction]=None, received_at: float=0.0):
+    """
+    Resolves the token mint (and LP address for initialize2) of a migration transaction and acts on it.
+
+    transaction is the full transaction delivered by a blockSubscribe notification. When it is given the mint and pool
+    are read straight from it, and getTransaction is only called as a fallback if they cannot be found there.
+    received_at is when the notification frame was read - the start of the mint's trace (utils.tracing).
+    """
     try:
-        # Convert the signature string to the appropriate Signature type.
-        sig = Signature.from_string(signature)
-        
-        # Fetch the transaction details.
-        details = await rpc_client.get_transaction(
-            sig,
-            'json',
-            commitment=Confirmed,
-            max_supported_transaction_version=0
-        )
+        dispatched_at = time.monotonic()
         
-        # Convert details to dict if necessary.
-        if isinstance(details, dict):
-            data = details
-        else:
-            data = json.loads(details.to_json())
-        
-        result = data.get("result")
-        if not result:
-            migrations_logger.warning("No result in transaction details.")
-            return None
-
         # Fetch token mint from postTokenBalances using the same logic for both cases.
-        post_token_balances = result.get("meta", {}).get("postTokenBalances", [])
-        token_mint = next(
-            (tb.get("mint") for tb in post_token_balances if tb.get("owner") == MIGRATION_ADDRESS),
-            None
-        )
+        result = transaction
+        source = 'notification'
+        token_mint = result.owned_mint(MIGRATION_ADDRESS) if result else None
+        if token_mint is None:
+            source = 'getTransaction'
+            result = await get_transaction_result(signature)
+            if not result:
+                migrations_logger.warning("No result in transaction details.")
+                return None
+            token_mint = result.owned_mint(MIGRATION_ADDRESS)
         
         if is_withdraw:
             if token_mint and token_mint not in pending_trades:
+                start_migration_trace(token_mint, received_at, dispatched_at, source, 'withdraw')
                 migrations_logger.info(f"Withdraw detected | token mint: {token_mint}")
+                # Record the withdraw straight away so a duplicate notification is ignored while the filters run
+                await pending_trades.put(token_mint, passed=None)
+                
+                # Publish the verdict as soon as it is made - the IPFS data is only needed for saving
+                async def publish_verdict(filters_result, data_to_save):
+                    if filters_result is True:
+                        # Pre-arm the buy so the initialize2 event only has to patch amounts, sign and send
+                        with tracer.span('prepare_buy'):
+                            template = await prepare_buy(token_mint)
+                        await pending_trades.put(token_mint, passed=True, data=data_to_save, template=template)
+                    else:
+                        await pending_trades.put(token_mint, passed=False, data=data_to_save)
+                
                 # Run the risk filters.
-                filters_result, data_to_save = await process_new_tokens(httpx_client, token_mint)
+                filters_result, data_to_save = await process_new_tokens(httpx_client, token_mint, on_verdict=publish_verdict)
                 
-                # Save data regardless, but mark whether the token passed.
+                # Save the data of the tokens that passed, but mark a token without RugCheck data as failed.
                 if filters_result is True:
-                    pending_trades[token_mint] = {"data": data_to_save, "passed": True}
                     await parse_migrations_to_save(token_address=token_mint, data_to_save=data_to_save, filters_result=filters_result)
-                else:
-                    pending_trades[token_mint] = {"data": data_to_save, "passed": False}
+                elif filters_result is None:
+                    await pending_trades.put(token_mint, passed=False, data=data_to_save)
                 
+                # The withdraw trace ends with the filter verdict - the trade is traced from the initialize2
+                tracer.end_trace()
                 return token_mint
             else:
                 migrations_logger.warning("Withdraw detected | no token mint found or token already processed.")
@@ -75,24 +122,27 @@ async def fetch_transaction_details(signature, pending_trades, is_withdraw=True)
         
         else:
             # For initialize2 events, also fetch the liquidity pool (pair) address.
-            account_keys = result.get("transaction", {}).get("message", {}).get("accountKeys", [])
+            account_keys = result.account_keys
             if len(account_keys) > 2:
                 liquidity_pool_address = account_keys[2]
-                # Check if we have recorded this token from a previous withdraw event.
-                if token_mint in pending_trades:
-                    trade_info = pending_trades[token_mint]
-                    if trade_info["passed"]:
+                # Check if we have recorded this token from a previous withdraw event - popping it also records the withdraw -> initialize2 gap
+                trade_info = await pending_trades.pop(token_mint)
+                if trade_info is not None:
+                    if trade_info.passed:
                         migrations_logger.info(f"Token mint: {token_mint} | LP address: {liquidity_pool_address} - executing trade")
+                        # A new trace from the initialize2 notification - the trade task inherits it
+                        start_migration_trace(token_mint, received_at, dispatched_at, source, 'initialize2')
                         asyncio.create_task(raydium_trade_wrapper(
                                 httpx_client=httpx_client, 
                                 redis_trades=redis_client_trades, 
                                 pair_address=liquidity_pool_address, 
-                                token_mint=token_mint)
+                                token_mint=token_mint,
+                                template=trade_info.template)
                                 )
+                    elif trade_info.passed is None:
+                        migrations_logger.info(f"Token mint: {token_mint} | LP address: {liquidity_pool_address} - no risk filter verdict in time, skipping.")
                     else:
                         migrations_logger.info(f"Token mint: {token_mint} | LP address: {liquidity_pool_address} - risk filters did not pass.")
-                    # Remove the token from pending trades after processing.
-                    pending_trades.pop(token_mint)
                     return (token_mint, liquidity_pool_address)
                 else:
                     migrations_logger.info(f"Initialize2 event for token {token_mint} but no prior withdraw event found.")
@@ -109,73 +159,60 @@ def contains_initialize2_log(logs):
     pattern = re.compile(r"Program log: initialize2:\s*InitializeInstruction2")
     return any(pattern.search(log) for log in logs)
 
-async def listen_logs():
-    # Instantiate global connection objects
-    global rpc_client
-    global httpx_client
-    global redis_client_trades
+async def handle_log_notification(event: TransactionEvent) -> None:
+    """Dispatches the first arrival of each migration transaction."""
+    logs = event.logs
+    sig = event.signature
     
-    # Use a dictionary to track tokens from withdraw events and their filter outcomes.
-    pending_trades = {}
+    if WITHDRAW_LOG in logs:
+        migrations_logger.info(f"Withdraw signature: {sig}")
+        migrations_seen.inc(event='withdraw')
+        asyncio.create_task(fetch_transaction_details(sig, pending_trades, True, event.transaction, event.received_at))
     
+    elif contains_initialize2_log(logs):
+        migrations_logger.info(f"Initialize2 signature: {sig}")
+        migrations_seen.inc(event='initialize2')
+        asyncio.create_task(fetch_transaction_details(sig, pending_trades, False, event.transaction, event.received_at))
+
+async def log_listener_stats(listener: LogListener):
     while True:
-        try:
-            # Pass ping_interval and ping_timeout to maintain a heartbeat.
-            async with websockets.connect(WS_URL, ping_interval=60, ping_timeout=20) as websocket:
-                subscription_request = json.dumps({
-                    "jsonrpc": "2.0",
-                    "id": 1,
-                    "method": "logsSubscribe",
-                    "params": [
-                        {"mentions": [MIGRATION_ADDRESS]},
-                        {"commitment": "confirmed"}
-                    ]
-                })
-                await websocket.send(subscription_request)
-                response = await websocket.recv()
-                migrations_logger.info(f"Subscription response: {response}")
-                migrations_logger.info("Listening for Pump.fun migrations - withdraw and initialize2 instructions...")
-
-                while True:
-                    message = await asyncio.wait_for(websocket.recv(), timeout=300)
-                    data = json.loads(message)
-                    
-                    if (
-                        "method" in data and data["method"] == "logsNotification" and
-                        "params" in data and "result" in data["params"]
-                    ):
-                        block_data = data["params"]["result"]
-                        if "value" in block_data and "logs" in block_data["value"]:
-                            logs = block_data["value"]["logs"]
-                            sig = block_data["value"].get("signature")
-                            if not sig:
-                                continue
-                            
-                            if "Program log: Instruction: Withdraw" in logs:
-                                migrations_logger.info(f"Withdraw signature: {sig}")
-                                asyncio.create_task(fetch_transaction_details(sig, pending_trades, True))
-                            
-                            elif contains_initialize2_log(logs):
-                                migrations_logger.info(f"Initialize2 signature: {sig}")
-                                asyncio.create_task(fetch_transaction_details(sig, pending_trades, False))
-        except Exception as e:
-            migrations_logger.error(f"Exception in listen_logs: {e}")
-            migrations_logger.info(f"Reconnecting in {RELAY_DELAY} seconds...")
-            try:
-                await rpc_client.close()
-                await httpx_client.aclose()
-                await redis_client_trades.aclose()
-            except Exception as close_e:
-                migrations_logger.error(f"Error closing async clients: {close_e}")
-            rpc_client = AsyncClient(RPC_URL)
-            httpx_client = httpx.AsyncClient(timeout=HTTPX_TIMEOUT)
-            redis_client_trades = redis.Redis(host='localhost', port=6379, db=1)
-            await asyncio.sleep(RELAY_DELAY)
+        await asyncio.sleep(LISTENER_STATS_INTERVAL)
+        migrations_logger.info(f"Log listener endpoint stats:\n{listener.stats_summary()}")
+
+async def listen_logs():
+    # Subscribe on every configured endpoint at once - each reconnects on its own, so a drop on one leaves no gap
+    listener = LogListener(on_notification=handle_log_notification, ws_urls=LISTENER_WS_URLS)
+    migrations_logger.info(f"Listening for Pump.fun migrations - withdraw and initialize2 instructions on {len(LISTENER_WS_URLS)} endpoints...")
+    
+    stats_task = asyncio.create_task(log_listener_stats(listener))
+    try:
+        await listener.run_forever()
+    finally:
+        stats_task.cancel()
+        await listener.stop()
 
 async def main():
     
+    # Record (or replay) the RPC responses when utils.replay is active
+    await instrument_rpc_clients(rpc_client, client, qn_client)
+    
+    # Track how long the event loop is blocked for
+    asyncio.create_task(monitor_loop_lag())
+    
+    # Keep a fresh blockhash and the rent constant in memory for the transaction builders
+    chain_state.start()
+    
+    # Log the per-stage latencies of the notification -> fill traces
+    tracer.start()
+    
+    # Expose the counters and histograms of utils.metrics for Prometheus
+    await metrics_server.start()
+    
     await startup_sell(rpc_client, redis_client_trades, sell_slippage=SELL_SLIPPAGE)
     
+    # Pick up the withdraws still waiting for their initialize2 from before a restart
+    await pending_trades.restore()
+    
     try:
         await listen_logs()
     except Exception as e:
@@ -17,11 +17,17 @@ from filter_utils import process_new_tokens
 from trade_utils_raydium import raydium_trade_wrapper# , startup_sell
 
 from migration_listener import listen_for_migrations
+from http_utils import create_httpx_client, monitor_loop_lag
+from utils.chain_state import chain_state
+from utils.replay import instrument_rpc_clients
+from utils.metrics import metrics_server
+from utils.tracing import tracer
+from config import client, qn_client
 
 
 # Instantiate the relevant objects
 rpc_client = AsyncClient(RPC_URL)
-httpx_client = httpx.AsyncClient(timeout=HTTPX_TIMEOUT)
+httpx_client = create_httpx_client()
 redis_client_tokens = redis.Redis(host='localhost', port=6379, db=0)
 redis_client_trades = redis.Redis(host='localhost', port=6379, db=1)
 
@@ -58,6 +64,21 @@ async def consume_queue(queue, httpx_client):
         
 async def main():
     
+    # Record (or replay) the RPC responses when utils.replay is active
+    await instrument_rpc_clients(rpc_client, client, qn_client)
+    
+    # Track how long the event loop is blocked for
+    asyncio.create_task(monitor_loop_lag())
+    
+    # Keep a fresh blockhash and the rent constant in memory for the transaction builders
+    chain_state.start()
+    
+    # Log the per-stage latencies of the notification -> fill traces
+    tracer.start()
+    
+    # Expose the counters and histograms of utils.metrics for Prometheus
+    await metrics_server.start()
+    
     # Check to see if any start up tokens that need to be sold
     await startup_sell(rpc_client, redis_client_trades, sell_slippage=SELL_SLIPPAGE)
     # await startup_sell(httpx_client=httpx_client)         # error code: InstructionErrorCustom(11) 
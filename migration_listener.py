@@ -1,32 +1,55 @@
 import websockets
 import asyncio
 import json
+import time
 from solders.pubkey import Pubkey   # type: ignore
 from datetime import datetime, timezone
+from typing import Optional
 from config import MIGRATION_ADDRESS, WS_URL, RPC_URL, RELAY_DELAY, migrations_logger
 
 from filter_utils import process_new_tokens, trade_filters
 from storage_utils import parse_migrations_to_save
+from utils.correlation_store import create_correlation_store
+from utils.metrics import migrations_seen
+from utils.replay import record_frame
+from utils.tracing import tracer
+from utils.worker_pool import WorkerPool
+from utils.ws_messages import WITHDRAW_LOG, INITIALIZE2_LOG, Transaction, TransactionEvent, decode_transactions
 
-async def process_withdraw_transaction(data, withdraw_tokens, httpx_client):
+# Tokens with a withdraw event that are waiting for their initialize2 - kept across reconnects
+withdraw_tokens = create_correlation_store('withdraw_tokens')
+
+# Filter workers fed by the websocket reader - created on the first connect and kept across reconnects
+migration_workers: Optional[WorkerPool] = None
+
+async def process_withdraw_transaction(data: Transaction, withdraw_tokens, httpx_client, received_at: float=0.0):
     """Process and decode a withdraw transaction.
     
     This function extracts the token and pair addresses from the transaction.
     After running your risk filters (not shown here), if the token passes,
-    it is added to the in-memory dictionary.
+    it is added to the correlation store.
     """
     try:
-        account_keys = data['transaction']['message']['accountKeys']
+        account_keys = data.account_keys
         if len(account_keys) > 10:
             token_address = account_keys[10] # consider fetching the address from postTokenBalances where owner is the migration address
             if token_address not in withdraw_tokens:
-                migrations_logger.info(f'Withdraw event detected - {token_address}')
-                withdraw_tokens.add(token_address)
-                
-                # Run the token filters and save the data to the spreadsheet
-                filters_result, data_to_save = await process_new_tokens(httpx_client, token_address)
-                if filters_result is not None:
-                    await parse_migrations_to_save(token_address=token_address, data_to_save=data_to_save, filters_result=filters_result)
+                # Trace the token from the frame - ws_recv includes the wait for a filter worker
+                trace = tracer.start_trace(token_address, received_at or None)
+                tracer.record(trace, 'ws_recv', trace.started_at, time.monotonic(), event='withdraw')
+                try:
+                    migrations_logger.info(f'Withdraw event detected - {token_address}')
+                    await withdraw_tokens.put(token_address, passed=None)
+                    
+                    # Run the token filters - the verdict is stored before the IPFS data arrives, then the data is saved
+                    async def publish_verdict(filters_result, data_to_save):
+                        await withdraw_tokens.put(token_address, passed=filters_result, data=data_to_save)
+                    filters_result, data_to_save = await process_new_tokens(httpx_client, token_address, on_verdict=publish_verdict)
+                    if filters_result is not None:
+                        await parse_migrations_to_save(token_address=token_address, data_to_save=data_to_save, filters_result=filters_result)
+                finally:
+                    # The worker task is reused for the next event, so never leave the trace bound
+                    tracer.end_trace()
                     
             else:
                 migrations_logger.info(f'Withdraw event already processed for token {token_address}')
@@ -36,26 +59,23 @@ async def process_withdraw_transaction(data, withdraw_tokens, httpx_client):
         migrations_logger.error(f'Error processing withdraw transaction: {str(e)}')
 
 
-async def process_initialize2_transaction(data, queue, withdraw_tokens):
+async def process_initialize2_transaction(data: Transaction, queue, withdraw_tokens):
     """Process and decode an initialize2 transaction only if a prior withdraw event was detected.
     
     If the token (extracted from account_keys[18]) has been seen via a withdraw event,
     then we push it to our queue, store it, and log the event.
     """
     try:
-        account_keys = data['transaction']['message']['accountKeys']
+        account_keys = data.account_keys
         if len(account_keys) > 18:
             token_address = account_keys[18]
             pair_address = account_keys[2]
-            if token_address in withdraw_tokens:
-                # Check if token has already been processed (cached)
+            # Remove token from the store once processed - this also records the withdraw -> initialize2 gap
+            if await withdraw_tokens.pop(token_address) is not None:
                 migrations_logger.info(f'Both events confirmed for token: {token_address} - Pair: {pair_address}')
                 
                 # await execute_buy(token_address, pair_address)
                 # await queue.put((token_address, pair_address))
-                
-                # Remove token from the set once processed
-                withdraw_tokens.remove(token_address)
             else:
                 migrations_logger.info(f'Initialize2 event for token {token_address} but no prior withdraw event found.')
         else:
@@ -64,20 +84,40 @@ async def process_initialize2_transaction(data, queue, withdraw_tokens):
         migrations_logger.error(f'Error processing initialize2 transaction: {str(e)}')
 
 
+async def process_migration_event(event: TransactionEvent, queue, httpx_client):
+    """Runs in a migration worker - the withdraw branch awaits the full filter chain. Each transaction is handled once."""
+    if any(WITHDRAW_LOG in log for log in event.logs):
+        migrations_seen.inc(event='withdraw')
+        await process_withdraw_transaction(event.transaction, withdraw_tokens, httpx_client, event.received_at)
+    elif any(INITIALIZE2_LOG in log for log in event.logs):
+        migrations_seen.inc(event='initialize2')
+        await process_initialize2_transaction(event.transaction, queue, withdraw_tokens)
+
+
 async def listen_for_migrations(queue, httpx_client):
     """
     Listen for both withdraw and initialize2 instructions.
 
-    A local set (withdraw_tokens) keeps track of tokens that have had a withdraw event.
-    Later, when an initialize2 event is seen for a token already in that set, it is processed.
+    The correlation store (withdraw_tokens) keeps track of tokens that have had a withdraw event.
+    Later, when an initialize2 event is seen for a token already in the store, it is processed.
+    Withdraws without an initialize2 expire after CORRELATION_TTL.
+    
+    The reader only decodes frames and submits the migration transactions to a bounded worker pool, so it keeps
+    reading while the filters run. Events are taken in arrival order, so a withdraw is recorded before its initialize2.
     """
     
     # async with httpx.AsyncClient(timeout=HTTPX_TIMEOUT) as httpx_client:
     # use the client for your HTTP calls
 
     
-    # Local cache to record tokens with a withdraw event
-    withdraw_tokens = set()
+    # Pick up the withdraws still waiting for their initialize2 (from redis after a restart)
+    if len(withdraw_tokens) == 0:
+        await withdraw_tokens.restore()
+    
+    global migration_workers
+    if migration_workers is None:
+        migration_workers = WorkerPool('migration', handler=lambda event: process_migration_event(event, queue, httpx_client))
+        migration_workers.start()
 
     try:
         async with websockets.connect(WS_URL) as websocket:
@@ -104,23 +144,12 @@ async def listen_for_migrations(queue, httpx_client):
             while True:
                 try:
                     response = await asyncio.wait_for(websocket.recv(), timeout=30)
-                    data = json.loads(response)
+                    received_at = time.monotonic()
+                    record_frame(WS_URL, response)
                     
-                    if (
-                        'method' in data and data['method'] == 'blockNotification' and
-                        'params' in data and 'result' in data['params']
-                    ):
-                        block_data = data['params']['result']
-                        if 'value' in block_data and 'block' in block_data['value']:
-                            block = block_data['value']['block']
-                            if 'transactions' in block:
-                                for tx in block['transactions']:
-                                    logs = tx.get('meta', {}).get('logMessages', [])
-                                    for log in logs:
-                                        if 'Program log: Instruction: Withdraw' in log:
-                                            await process_withdraw_transaction(tx, withdraw_tokens, httpx_client)
-                                        elif 'Program log: initialize2: InitializeInstruction2' in log:
-                                            await process_initialize2_transaction(tx, queue, withdraw_tokens)
+                    # Blocks without a migration are skipped on the raw frame, the rest only decode the fields we read
+                    for event in decode_transactions(response, received_at=received_at):
+                        migration_workers.submit(event)
                 except asyncio.TimeoutError:
                     pass
 
@@ -1,9 +1,12 @@
 import base64
 import os
+import time
+from dataclasses import dataclass
 from typing import Optional
 from solana.rpc.commitment import Processed
-from solana.rpc.types import TokenAccountOpts, TxOpts
+from solana.rpc.types import TokenAccountOpts
 from solders.compute_budget import set_compute_unit_limit, set_compute_unit_price  # type: ignore
+from solders.instruction import Instruction  # type: ignore
 from solders.message import MessageV0  # type: ignore
 from solders.pubkey import Pubkey  # type: ignore
 from solders.system_program import (
@@ -11,8 +14,6 @@ from solders.system_program import (
     create_account_with_seed,
 )
 from solders.transaction import VersionedTransaction  # type: ignore
-# from spl.token.client import Token
-from spl.token.async_client import AsyncToken
 from spl.token.instructions import (
     CloseAccountParams,
     InitializeAccountParams,
@@ -21,39 +22,41 @@ from spl.token.instructions import (
     get_associated_token_address,
     initialize_account,
 )
-from utils.common_utils import confirm_txn, get_token_balance
+from utils.common_utils import get_token_balance_raw
+from utils.chain_state import chain_state
+from utils.submission import broadcast_transactions
 from utils.pool_utils import (
     AmmV4PoolKeys,
-    fetch_amm_v4_pool_keys,
-    get_amm_v4_reserves,
+    get_amm_v4_pool_keys,
+    get_amm_v4_raw_reserves,
     make_amm_v4_swap_instruction
 )
-from config import client, payer_keypair, UNIT_BUDGET, trade_logger
+from config import client, payer_keypair, UNIT_BUDGET, SIMULATE_BUY, trade_logger
 from raydium.constants import ACCOUNT_LAYOUT_LEN, SOL_DECIMAL, TOKEN_PROGRAM_ID, WSOL
-
-
-async def buy(pair_address:str, token_mint:str, sol_in:float=0.01, slippage:int=5, priority_fee:int=100_000):
+from utils.price_feed import reserves_to_price
+from utils.tracing import tracer
+
+
+@dataclass
+class BuyTemplate:
+    """Everything needed for a buy that does not depend on the pool or the trade amounts."""
+    token_mint: str
+    token_account: Pubkey
+    create_token_account_instruction: Optional[Instruction]
+    wsol_seed: str
+    wsol_token_account: Pubkey
+    rent_lamports: int
+    init_wsol_account_instruction: Instruction
+    close_wsol_account_instruction: Instruction
+
+async def prepare_buy(token_mint:str) -> Optional[BuyTemplate]:
+    """
+    Pre-arms a buy as soon as a withdraw event passes the filters - before the pool exists.
+    The token account, WSOL seed account and rent are all resolved here, so that the initialize2
+    event only has to fetch the pool, patch in the amounts, apply the cached blockhash, sign and send.
+    """
     try:
-        # trade_logger.info("Fetching pool keys...")
-        pool_keys: Optional[AmmV4PoolKeys] = await fetch_amm_v4_pool_keys(pair_address)
-        if pool_keys is None:
-            trade_logger.error(f"No pool keys found for {pair_address}")
-            return False, None, None
-        # trade_logger.info("Pool keys fetched successfully.")
-
-        mint = (pool_keys.base_mint if pool_keys.base_mint != WSOL else pool_keys.quote_mint)
-
-        # trade_logger.info("Calculating transaction amounts...")
-        amount_in = int(sol_in * SOL_DECIMAL)
-
-        base_reserve, quote_reserve, token_decimal = await get_amm_v4_reserves(pool_keys)
-        amount_out = sol_for_tokens(sol_in, base_reserve, quote_reserve)
-        trade_logger.info(f"Estimated Amount Out: {int(amount_out*10**token_decimal)}")
-
-        slippage_adjustment = 1 - (slippage / 100)
-        amount_out_with_slippage = amount_out * slippage_adjustment
-        minimum_amount_out = int(amount_out_with_slippage * 10**token_decimal)
-        trade_logger.info(f"Amount In: {amount_in} | Minimum Amount Out: {minimum_amount_out}")
+        mint = Pubkey.from_string(token_mint)
 
         # trade_logger.info("Checking for existing token account...")
         token_account_check = await client.get_token_accounts_by_owner(
@@ -75,20 +78,7 @@ async def buy(pair_address:str, token_mint:str, sol_in:float=0.01, slippage:int=
         wsol_token_account = Pubkey.create_with_seed(
             payer_keypair.pubkey(), seed, TOKEN_PROGRAM_ID
         )
-        balance_needed = await AsyncToken.get_min_balance_rent_for_exempt_for_account(client)
-
-        # trade_logger.info("Creating and initializing WSOL account...")
-        create_wsol_account_instruction = create_account_with_seed(
-            CreateAccountWithSeedParams(
-                from_pubkey=payer_keypair.pubkey(),
-                to_pubkey=wsol_token_account,
-                base=payer_keypair.pubkey(),
-                seed=seed,
-                lamports=int(balance_needed + amount_in),
-                space=ACCOUNT_LAYOUT_LEN,
-                owner=TOKEN_PROGRAM_ID,
-            )
-        )
+        balance_needed = await chain_state.get_rent_exempt_balance()
 
         init_wsol_account_instruction = initialize_account(
             InitializeAccountParams(
@@ -99,16 +89,6 @@ async def buy(pair_address:str, token_mint:str, sol_in:float=0.01, slippage:int=
             )
         )
 
-        # trade_logger.info("Creating swap instructions...")
-        swap_instruction = make_amm_v4_swap_instruction(
-            amount_in=amount_in,
-            minimum_amount_out=minimum_amount_out,
-            token_account_in=wsol_token_account,
-            token_account_out=token_account,
-            accounts=pool_keys,
-            owner=payer_keypair.pubkey(),
-        )
-
         # trade_logger.info("Preparing to close WSOL account after swap...")
         close_wsol_account_instruction = close_account(
             CloseAccountParams(
@@ -118,69 +98,152 @@ async def buy(pair_address:str, token_mint:str, sol_in:float=0.01, slippage:int=
                 owner=payer_keypair.pubkey(),
             )
         )
+        
+        return BuyTemplate(
+            token_mint=token_mint,
+            token_account=token_account,
+            create_token_account_instruction=create_token_account_instruction,
+            wsol_seed=seed,
+            wsol_token_account=wsol_token_account,
+            rent_lamports=int(balance_needed),
+            init_wsol_account_instruction=init_wsol_account_instruction,
+            close_wsol_account_instruction=close_wsol_account_instruction,
+        )
+
+    except Exception as e:
+        trade_logger.error(f"Error occurred while preparing buy transaction: {e}")
+        return None
+
+def sign_fee_variants(instructions:list, priority_fees:list, blockhash) -> list:
+    """Compiles and signs one transaction per compute unit price. instructions must not include the compute budget instructions."""
+    transactions = []
+    for fee in priority_fees:
+        compiled_message = MessageV0.try_compile(
+            payer_keypair.pubkey(),
+            [set_compute_unit_limit(UNIT_BUDGET), set_compute_unit_price(fee)] + instructions,
+            [],
+            blockhash,
+        )
+        transactions.append(VersionedTransaction(compiled_message, [payer_keypair]))
+    return transactions
+
+async def buy(pair_address:str, token_mint:str, sol_in:float=0.01, slippage:int=5, priority_fee:int=100_000, template:Optional[BuyTemplate]=None, priority_fees:Optional[list]=None):
+    """
+    Buys token_mint with sol_in SOL. If priority_fees is given, one variant is signed per compute unit price and
+    they are all broadcast at once. The variants are only mutually exclusive while the (non-idempotent) token
+    account creation is part of the transaction, so otherwise only the highest fee is sent.
+    """
+    try:
+        start_time = time.perf_counter()
+        if template is None:
+            template = await prepare_buy(token_mint)
+            if template is None:
+                return False, None, None
+
+        # trade_logger.info("Fetching pool keys...")
+        with tracer.span('pool_keys'):
+            pool_keys: Optional[AmmV4PoolKeys] = await get_amm_v4_pool_keys(pair_address)
+        if pool_keys is None:
+            trade_logger.error(f"No pool keys found for {pair_address}")
+            return False, None, None
+        # trade_logger.info("Pool keys fetched successfully.")
+
+        # trade_logger.info("Calculating transaction amounts...")
+        amount_in = int(sol_in * SOL_DECIMAL)
+
+        with tracer.span('reserves'):
+            token_reserve, sol_reserve, token_decimal = await get_amm_v4_raw_reserves(pool_keys)
+        if token_reserve is None:
+            return False, None, None
+        amount_out = sol_for_tokens(amount_in, token_reserve, sol_reserve, pool_keys.swap_fee_numerator, pool_keys.swap_fee_denominator)
+        trade_logger.info(f"Estimated Amount Out: {amount_out}")
+
+        minimum_amount_out = apply_slippage(amount_out, slippage)
+        trade_logger.info(f"Amount In: {amount_in} | Minimum Amount Out: {minimum_amount_out}")
+
+        # Patch the amounts into the pre-armed template
+        create_wsol_account_instruction = create_account_with_seed(
+            CreateAccountWithSeedParams(
+                from_pubkey=payer_keypair.pubkey(),
+                to_pubkey=template.wsol_token_account,
+                base=payer_keypair.pubkey(),
+                seed=template.wsol_seed,
+                lamports=int(template.rent_lamports + amount_in),
+                space=ACCOUNT_LAYOUT_LEN,
+                owner=TOKEN_PROGRAM_ID,
+            )
+        )
+
+        # trade_logger.info("Creating swap instructions...")
+        swap_instruction = make_amm_v4_swap_instruction(
+            amount_in=amount_in,
+            minimum_amount_out=minimum_amount_out,
+            token_account_in=template.wsol_token_account,
+            token_account_out=template.token_account,
+            accounts=pool_keys,
+            owner=payer_keypair.pubkey(),
+        )
 
         instructions = [
-            set_compute_unit_limit(UNIT_BUDGET),
-            set_compute_unit_price(priority_fee),
             create_wsol_account_instruction,
-            init_wsol_account_instruction,
+            template.init_wsol_account_instruction,
         ]
 
-        if create_token_account_instruction:
-            instructions.append(create_token_account_instruction)
+        if template.create_token_account_instruction:
+            instructions.append(template.create_token_account_instruction)
 
         instructions.append(swap_instruction)
-        instructions.append(close_wsol_account_instruction)
+        instructions.append(template.close_wsol_account_instruction)
+
+        fees = sorted(set(priority_fees)) if priority_fees else [priority_fee]
+        if len(fees) > 1 and template.create_token_account_instruction is None:
+            trade_logger.warning("Token account already exists - fee variants are not mutually exclusive. Sending the highest fee only")
+            fees = fees[-1:]
 
         # trade_logger.info("Compiling transaction message...")
-        latest_blockhash = await client.get_latest_blockhash()
-        latest_blockhash = latest_blockhash.value.blockhash
-        compiled_message = MessageV0.try_compile(
-            payer_keypair.pubkey(),
-            instructions,
-            [],
-            latest_blockhash,
-        )
+        with tracer.span('build', variants=len(fees)):
+            latest_blockhash = await chain_state.get_blockhash()
+            transactions = sign_fee_variants(instructions, fees, latest_blockhash)
         
-        trade_logger.info("Simulating buy transaction...")
-        simulation_txn_sig = await client.simulate_transaction(
-            txn=VersionedTransaction(compiled_message, [payer_keypair]),
-            sig_verify=False,
-            commitment=Processed
-        )
-        
-        simulation_status = simulation_txn_sig.value.err
-        if simulation_status is not None:
-            error = simulation_status.err
-            trade_logger.error(f"Simulation error - error code: {error} ")
-            return error, None, None
+        if SIMULATE_BUY:
+            trade_logger.info("Simulating buy transaction...")
+            with tracer.span('simulate'):
+                simulation_txn_sig = await client.simulate_transaction(
+                    txn=transactions[0],
+                    sig_verify=False,
+                    commitment=Processed
+                )
+            
+            simulation_status = simulation_txn_sig.value.err
+            if simulation_status is not None:
+                error = simulation_status.err
+                trade_logger.error(f"Simulation error - error code: {error} ")
+                return error, None, None
         
-        trade_logger.info("Sending transaction...")
-        txn_sig = await client.send_transaction(
-            txn=VersionedTransaction(compiled_message, [payer_keypair]),
-            opts=TxOpts(skip_preflight=True),
-        )
-        txn_sig = txn_sig.value
-        trade_logger.info(f"Transaction Signature: {txn_sig}")
-
-        # trade_logger.info("Confirming transaction...")
-        confirmed, trade_data = await confirm_txn(txn_sig, token_mint)
+        # trade_logger.info("Sending and confirming transaction...")
+        confirmed, trade_data, txn_sig = await broadcast_transactions(transactions, fees, token_mint, started_at=start_time)
         if confirmed is True:
             trade_data["buy_transaction_hash"] = str(txn_sig)
-        return confirmed, trade_data, quote_reserve/base_reserve
+        return confirmed, trade_data, reserves_to_price(token_reserve, sol_reserve, token_decimal)
 
     except Exception as e:
         trade_logger.error(f"Error occurred during buy transaction: {e}")
         return None, None, None
 
-async def sell(pair_address:str, token_mint:str, percentage:int=100, slippage:int=5, priority_fee:int=100_000):
+async def sell(pair_address:str, token_mint:str, percentage:int=100, slippage:int=5, priority_fee:int=100_000, priority_fees:Optional[list]=None):
+    """
+    Sells percentage of the wallet's token_mint balance. If priority_fees is given, one variant is signed per compute
+    unit price and they are all broadcast at once. The variants are only mutually exclusive when the token account is
+    closed in the same transaction (percentage=100), so partial sells only send the highest fee.
+    """
     try:
+        start_time = time.perf_counter()
         if not (1 <= percentage <= 100):
             trade_logger.error("Percentage must be between 1 and 100.")
             return False, None
 
         # trade_logger.info("Fetching pool keys...")
-        pool_keys: Optional[AmmV4PoolKeys] = await fetch_amm_v4_pool_keys(pair_address)
+        pool_keys: Optional[AmmV4PoolKeys] = await get_amm_v4_pool_keys(pair_address)
         if pool_keys is None:
             trade_logger.error("No pool keys found...")
             return False, None
@@ -188,26 +251,24 @@ async def sell(pair_address:str, token_mint:str, percentage:int=100, slippage:in
         mint = (pool_keys.base_mint if pool_keys.base_mint != WSOL else pool_keys.quote_mint)
 
         # trade_logger.info("Retrieving token balance...")
-        token_balance = await get_token_balance(str(mint))
+        token_balance = await get_token_balance_raw(str(mint))
         trade_logger.info(f"Wallet balance: {token_balance}")
 
         if token_balance == 0 or token_balance is None:
             trade_logger.error("No tokens available to sell.")
             return False, None
 
-        token_balance = token_balance * (percentage / 100)
-        # trade_logger.info(f"Selling {percentage}% of the token balance, adjusted balance: {token_balance}")
+        amount_in = int(token_balance * percentage // 100)
+        # trade_logger.info(f"Selling {percentage}% of the token balance, adjusted balance: {amount_in}")
 
         # trade_logger.info("Calculating transaction amounts...")
-        base_reserve, quote_reserve, token_decimal = await get_amm_v4_reserves(pool_keys)
-        amount_out = tokens_for_sol(token_balance, base_reserve, quote_reserve)
-        trade_logger.info(f"Estimated Amount Out: {int(amount_out * SOL_DECIMAL)}")
-
-        slippage_adjustment = 1 - (slippage / 100)
-        amount_out_with_slippage = amount_out * slippage_adjustment
-        minimum_amount_out = int(amount_out_with_slippage * SOL_DECIMAL)
+        token_reserve, sol_reserve, token_decimal = await get_amm_v4_raw_reserves(pool_keys)
+        if token_reserve is None:
+            return False, None
+        amount_out = tokens_for_sol(amount_in, token_reserve, sol_reserve, pool_keys.swap_fee_numerator, pool_keys.swap_fee_denominator)
+        trade_logger.info(f"Estimated Amount Out: {amount_out}")
 
-        amount_in = int(token_balance * 10**token_decimal)
+        minimum_amount_out = apply_slippage(amount_out, slippage)
         trade_logger.info(f"Amount In: {amount_in} | Minimum Amount Out: {minimum_amount_out}")
         token_account = get_associated_token_address(payer_keypair.pubkey(), mint)
 
@@ -216,7 +277,7 @@ async def sell(pair_address:str, token_mint:str, percentage:int=100, slippage:in
         wsol_token_account = Pubkey.create_with_seed(
             payer_keypair.pubkey(), seed, TOKEN_PROGRAM_ID
         )
-        balance_needed = await AsyncToken.get_min_balance_rent_for_exempt_for_account(client)
+        balance_needed = await chain_state.get_rent_exempt_balance()
 
         create_wsol_account_instruction = create_account_with_seed(
             CreateAccountWithSeedParams(
@@ -260,8 +321,6 @@ async def sell(pair_address:str, token_mint:str, percentage:int=100, slippage:in
         )
 
         instructions = [
-            set_compute_unit_limit(UNIT_BUDGET),
-            set_compute_unit_price(priority_fee),
             create_wsol_account_instruction,
             init_wsol_account_instruction,
             swap_instructions,
@@ -280,20 +339,18 @@ async def sell(pair_address:str, token_mint:str, percentage:int=100, slippage:in
             )
             instructions.append(close_token_account_instruction)
 
+        fees = sorted(set(priority_fees)) if priority_fees else [priority_fee]
+        if len(fees) > 1 and percentage != 100:
+            trade_logger.warning("Partial sell - fee variants are not mutually exclusive. Sending the highest fee only")
+            fees = fees[-1:]
+
         # trade_logger.info("Compiling transaction message...")
-        
-        latest_blockhash = await client.get_latest_blockhash()
-        latest_blockhash = latest_blockhash.value.blockhash
-        compiled_message = MessageV0.try_compile(
-            payer_keypair.pubkey(),
-            instructions,
-            [],
-            latest_blockhash,
-        )
+        latest_blockhash = await chain_state.get_blockhash()
+        transactions = sign_fee_variants(instructions, fees, latest_blockhash)
 
         trade_logger.info("Simulating sell transaction...")
         simulation_txn_sig = await client.simulate_transaction(
-            txn=VersionedTransaction(compiled_message, [payer_keypair]),
+            txn=transactions[0],
             sig_verify=False,
             commitment=Processed
         )
@@ -305,16 +362,8 @@ async def sell(pair_address:str, token_mint:str, percentage:int=100, slippage:in
             return error, None
         # return False
     
-        trade_logger.info("Sending transaction...")
-        txn_sig = await client.send_transaction(
-            txn=VersionedTransaction(compiled_message, [payer_keypair]),
-            opts=TxOpts(skip_preflight=True),
-        )
-        txn_sig = txn_sig.value
-        trade_logger.info(f"Transaction Signature: {txn_sig}")
-
-        # trade_logger.info("Confirming transaction...")
-        confirmed, trade_data = await confirm_txn(txn_sig, token_mint)
+        # trade_logger.info("Sending and confirming transaction...")
+        confirmed, trade_data, txn_sig = await broadcast_transactions(transactions, fees, token_mint, started_at=start_time)
         if confirmed is True:
             trade_data["sell_transaction_hash"] = str(txn_sig)
         return confirmed, trade_data
@@ -323,18 +372,27 @@ async def sell(pair_address:str, token_mint:str, percentage:int=100, slippage:in
         trade_logger.error(f"Error occurred during sell transaction: {e}")
         return None, None
 
-def sol_for_tokens(sol_amount, base_vault_balance, quote_vault_balance, swap_fee=0.25):
-    effective_sol_used = sol_amount - (sol_amount * (swap_fee / 100))
-    constant_product = base_vault_balance * quote_vault_balance
-    updated_base_vault_balance = constant_product / (quote_vault_balance + effective_sol_used)
-    tokens_received = base_vault_balance - updated_base_vault_balance
-    return round(tokens_received, 9)
-
-def tokens_for_sol(token_amount, base_vault_balance, quote_vault_balance, swap_fee=0.25):
-    effective_tokens_sold = token_amount * (1 - (swap_fee / 100))
-    constant_product = base_vault_balance * quote_vault_balance
-    updated_quote_vault_balance = constant_product / (base_vault_balance + effective_tokens_sold)
-    sol_received = quote_vault_balance - updated_quote_vault_balance
-    return round(sol_received, 9)
+def swap_amount_out(amount_in:int, reserve_in:int, reserve_out:int, fee_numerator:int=25, fee_denominator:int=10_000) -> int:
+    """
+    Exact integer constant-product quote, mirroring the AMM v4 program's swap_base_in:
+    the fee is rounded up and taken from the input, the amount out is rounded down.
+    All amounts are raw u64 values (smallest unit).
+    """
+    if amount_in <= 0 or reserve_in <= 0 or reserve_out <= 0:
+        return 0
+    fee = -(-amount_in * fee_numerator // fee_denominator)
+    amount_in_less_fee = amount_in - fee
+    return reserve_out * amount_in_less_fee // (reserve_in + amount_in_less_fee)
+
+def apply_slippage(amount_out:int, slippage:float) -> int:
+    # slippage is a percentage - converted to basis points so the result stays an exact integer
+    slippage_bps = int(round(slippage * 100))
+    return amount_out * (10_000 - slippage_bps) // 10_000
+
+def sol_for_tokens(lamports_in:int, token_reserve:int, sol_reserve:int, fee_numerator:int=25, fee_denominator:int=10_000) -> int:
+    return swap_amount_out(lamports_in, sol_reserve, token_reserve, fee_numerator, fee_denominator)
+
+def tokens_for_sol(tokens_in:int, token_reserve:int, sol_reserve:int, fee_numerator:int=25, fee_denominator:int=10_000) -> int:
+    return swap_amount_out(tokens_in, token_reserve, sol_reserve, fee_numerator, fee_denominator)
 
 
@@ -1,9 +1,8 @@
 import asyncio
 import json
-import os
-import csv
 from datetime import datetime, timezone
-from config import CSV_MIGRATIONS_FILE, CSV_TRADES_FILE, migrations_logger, trade_logger
+from config import migrations_logger, trade_logger
+from utils.storage import MIGRATIONS_TABLE, TRADES_TABLE, storage_writer
 
 #---------------------
 #   REDIS FUNCTIONS
@@ -62,21 +61,21 @@ async def fetch_token_address(redis_client_token, token_address):
         return json.loads(data)
 
 
-#--------------------
-#   CSV FUNCTIONS
-#--------------------
+#------------------------
+#   STORAGE FUNCTIONS
+#------------------------
 
-# Parse migrations to be saved in a csv
+# Parse migrations to be saved
 async def parse_migrations_to_save(token_address, data_to_save, filters_result):
     
     # Get the current timestamp
     current_time_utc = datetime.now(timezone.utc)
     timestamp_str = current_time_utc.strftime('%Y-%m-%d %H:%M:%S')
     
-    # Unpack the various dictionaries
-    metadata = data_to_save.get('metadata', '')
-    risks = data_to_save.get('risks', '')
-    holder_metrics = data_to_save.get('holder_metrics', '')
+    # Unpack the various dictionaries - these can be None when a filter source missed its deadline
+    metadata = data_to_save.get('metadata') or {}
+    risks = data_to_save.get('risks') or {}
+    holder_metrics = data_to_save.get('holder_metrics') or {}
 
      
     # Unpack the details of each dictionary
@@ -117,70 +116,18 @@ async def parse_migrations_to_save(token_address, data_to_save, filters_result):
         'execute_trade': filters_result
         }
     
-    # Save the results to a csv
-    await write_migrations_to_csv(results)
+    # Save the results for further analysis
+    await save_migration(results)
 
 
-# Save migrations to a csv for further analysis
-async def write_migrations_to_csv(data_dict):
-    
-    # Define the CSV columns
-    token_columns = [
-        'timestamp', 
-        'token_address', 
-        'name', 
-        'symbol', 
-        'description', 
-        'ipfs_description', 
-        'creator', 
-        'decimals', 
-        'ipfs_url', 
-        'twitter_url', 
-        'twitter_handle', 
-        'website_url', 
-        'website_valid', 
-        'telegram_url', 
-        'image_url', 
-        'risks', 
-        'score', 
-        'total_pct_top_5', 
-        'total_pct_top_10', 
-        'total_pct_top_20', 
-        'total_pct_insiders', 
-        'is_dexscreener_paid_parsed', 
-        'is_dexscreener_paid_raw', 
-        'number_of_twitter_handles', 
-        'previous_twitter_handles', 
-        'total_followers', 
-        'total_influencers_count', 
-        'total_projects_count', 
-        'total_venture_capitals_count', 
-        'total_user_protected', 
-        'twitter_score', 
-        'twitter_name', 
-        'twitter_screen_name', 
-        'twitter_description', 
-        'twitter_followers_count', 
-        'twitter_friends_count', 
-        'twitter_register_date', 
-        'twitter_tweets_count', 
-        'twitter_verified', 
-        'twitter_can_dm', 
-        'execute_trade'
-        ]
-
-    file_exists = os.path.isfile(CSV_MIGRATIONS_FILE)
-    with open(CSV_MIGRATIONS_FILE, mode='a', newline='', encoding='utf-8') as csvfile:
-        fieldnames = token_columns
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        if not file_exists:
-            writer.writeheader()
-        writer.writerow(data_dict)
-    migrations_logger.info('Saved new token to migrations csv')
-
-
-# Save trade data to a csv
-async def write_trades_to_csv(redis_client, tx_address, sell_data_dict):
+# Queue a migration row - written in the background by utils.storage
+async def save_migration(data_dict):
+    storage_writer.append(MIGRATIONS_TABLE, data_dict)
+    migrations_logger.info('Queued new token for the migrations table')
+
+
+# Save a finished trade (buy data from the cache merged with the sell data)
+async def save_trade(redis_client, tx_address, sell_data_dict):
     
     # Get buy trade data from cache
     buy_data_dict = await fetch_trade_data(redis_client, tx_address)
@@ -194,23 +141,6 @@ async def write_trades_to_csv(redis_client, tx_address, sell_data_dict):
         trade_logger.info(f'Return value in SOL for {pair_address}: {return_value}')
         trade_logger.info(f'Return % for {pair_address}: {round(return_perc,2)}%')
 
-        token_columns = [
-            'token_address', 
-            'pair_address',
-            'buy_timestamp', 
-            'buy_transaction_hash', 
-            'buy_tokens_spent', 
-            'buy_tokens_received', 
-            'buy_effective_price', 
-            'sell_timestamp', 
-            'sell_transaction_hash', 
-            'sell_tokens_spent', 
-            'sell_tokens_received', 
-            'sell_effective_price', 
-            'return_value', 
-            'return_perc' 
-            ]
-        
         # Merge the 2 dictionaries and update it with the new fileds
         data_dict = buy_data_dict | sell_data_dict
         data_dict.update({
@@ -221,24 +151,16 @@ async def write_trades_to_csv(redis_client, tx_address, sell_data_dict):
             'sell_effective_price': effective_sell_price
             })
         
-        # Save to CSV
-        file_exists = os.path.isfile(CSV_TRADES_FILE)
-        with open(CSV_TRADES_FILE, mode='a', newline='', encoding='utf-8') as csvfile:
-            fieldnames = token_columns
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            if not file_exists:
-                writer.writeheader()
-            writer.writerow(data_dict)
-
-            # Log the saved result
-            trade_logger.info('Saved new trade to csv')
-            
-            # Delete the key from Redis and log accordingly
-            # result = await redis_client.delete(tx_address)
-            # if result:
-            #     trade_logger.info(f'Redis key deleted for {pair_address}: True')
-            # else:
-            #     trade_logger.error(f'Redis key NOT deleted for {pair_address}: False')
+        # Queue the row - written in the background by utils.storage
+        storage_writer.append(TRADES_TABLE, data_dict)
+        trade_logger.info('Queued new trade for the trades table')
+        
+        # Delete the key from Redis and log accordingly
+        # result = await redis_client.delete(tx_address)
+        # if result:
+        #     trade_logger.info(f'Redis key deleted for {pair_address}: True')
+        # else:
+        #     trade_logger.error(f'Redis key NOT deleted for {pair_address}: False')
 
     except Exception as e:
-        trade_logger.error(f'Error with write_trades_to_csv function: {e}')
\ No newline at end of file
+        trade_logger.error(f'Error with save_trade function: {e}')
\ No newline at end of file
@@ -0,0 +1,25 @@
+import random
+
+import pytest
+
+from layouts.fast import LIQUIDITY_STATE_V4, MARKET_STATE_V3, CPMM_POOL_STATE, CLMM_POOL_STATE
+
+SAMPLES = 200           # random accounts decoded per layout
+
+def random_account(fast_layout) -> bytes:
+    data = bytearray(random.getrandbits(8) for _ in range(fast_layout.size))
+    if fast_layout is MARKET_STATE_V3:
+        # account_flags: 7 flag bits followed by 57 bits that must be zero (Const)
+        data[5:13] = bytes([random.getrandbits(7)]) + bytes(7)
+    return bytes(data)
+
+# construct is the reference - every field must decode to the same value
+@pytest.mark.parametrize('fast_layout', [LIQUIDITY_STATE_V4, MARKET_STATE_V3, CPMM_POOL_STATE, CLMM_POOL_STATE], ids=lambda layout: layout.name)
+def test_fast_layout_matches_construct(fast_layout):
+    random.seed(0)
+    for _ in range(SAMPLES):
+        data = random_account(fast_layout)
+        expected = fast_layout.layout.parse(data)
+        actual = fast_layout.parse(data)
+        for name in fast_layout.record_class._fields:
+            assert actual[name] == expected[name], f"{fast_layout.name}.{name}"
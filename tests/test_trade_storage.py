@@ -0,0 +1,47 @@
+import asyncio
+import json
+
+import pytest
+
+import storage_utils
+import trade_utils
+from utils.storage import TRADES_TABLE
+
+TOKEN = '5QBhsB1BndNhCN9bLQnzXAvmFYjz8RHzvBPQESjmpump'
+
+class CachedTrades:
+    """Stands in for the redis trades db - only get is used by save_trade."""
+
+    def __init__(self, data: dict):
+        self.data = data
+
+    async def get(self, key):
+        return json.dumps(self.data[key]) if key in self.data else None
+
+def test_execute_sell_queues_the_trade_row(monkeypatch):
+    async def returns(value):
+        return value
+
+    # Every network call of a successful sell returns its happy path
+    monkeypatch.setattr(trade_utils, 'get_token_balance', lambda **kwargs: returns(1_000))
+    monkeypatch.setattr(trade_utils, 'get_recent_prioritization_fees', lambda *args, **kwargs: returns({'recommended': 10_000}))
+    monkeypatch.setattr(trade_utils, 'get_jupiter_quote', lambda *args, **kwargs: returns({}))
+    monkeypatch.setattr(trade_utils, 'execute_swap', lambda **kwargs: returns('signature'))
+    monkeypatch.setattr(trade_utils, 'confirm_tx', lambda **kwargs: returns({'Status': 'Ok'}))
+    monkeypatch.setattr(trade_utils, 'get_transaction_details', lambda **kwargs: returns(
+        {'timestamp': '2026-10-17 12:00:00', 'inputMint_diff': -1_000.0, 'outputMint_diff': 0.012}
+    ))
+
+    queued = []
+    monkeypatch.setattr(storage_utils.storage_writer, 'append', lambda table, row: queued.append((table, row)))
+    redis_client = CachedTrades({TOKEN: {'pair_address': 'pair', 'buy_tokens_spent': -0.01, 'buy_tokens_received': 1_000.0}})
+
+    result = asyncio.run(trade_utils.execute_sell(rpc_client=None, httpx_client=None, redis_client_trades=redis_client, risky_address=TOKEN))
+
+    assert result is True
+    assert len(queued) == 1
+    table, row = queued[0]
+    assert table is TRADES_TABLE
+    assert row['token_address'] == TOKEN
+    assert row['sell_transaction_hash'] == 'signature'
+    assert row['return_value'] == pytest.approx(0.002)
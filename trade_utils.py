@@ -27,9 +27,11 @@ from config import (RPC_URL, PRIVATE_KEY, JUPITER_QUOTE_URL, JUPITER_SWAP_URL, J
                     WALLET_ADDRESS, COLD_WALLET_ADDRESS, TIME_TO_SLEEP, PRIORITY_FEE_MULTIPLIER, METIS_RPC_URL, MAX_TRADE_TIME_MINS,
                     PRIORITY_FEE_NUM_BLOCKS, PRIORITY_FEE_MIN, PRIORITY_FEE_MAX, SOL_AMOUNT_LAMPORTS, SOL_DECIMALS, SOL_MINT, 
                     trade_logger, MIN_SOL_BALANCE, SOL_MIN_BALANCE_LAMPORTS, SELL_LOOP_DELAY, MONITOR_PRICE_DELAY, STOPLOSS, PRICE_LOOP_RETRIES,
-                    BUY_SLIPPAGE, SELL_SLIPPAGE, START_UP_SLEEP, SELL_SLIPPAGE_DELAY, PRIORITY_FEE_STOPLOSS_MULTIPLIER)
+                    BUY_SLIPPAGE, SELL_SLIPPAGE, START_UP_SLEEP, SELL_SLIPPAGE_DELAY, PRIORITY_FEE_STOPLOSS_MULTIPLIER, CONFIRMATION_TIMEOUT)
 # from metadata_utils import fetch_token_metadata
-from storage_utils import store_trade_data, fetch_trade_data, write_trades_to_csv
+from storage_utils import store_trade_data, save_trade
+from utils.chain_state import chain_state
+from utils.confirmation import confirmation_service
 import redis.asyncio as redis
 
 
@@ -243,16 +245,12 @@ async def confirm_tx(rpc_client, signature, commitment=Finalized):
     signature_string = str(signature)
 
     try:
-        confirmation = await rpc_client.confirm_transaction(signature, commitment=commitment)
+        transaction_status = await confirmation_service.wait_for_signature(signature, commitment=str(commitment), timeout=CONFIRMATION_TIMEOUT)
 
-        if confirmation.value and len(confirmation.value) > 0:
-            transaction_status = confirmation.value[0]  
-            transaction_status = transaction_status.to_json()
-            transaction_status = json.loads(transaction_status)
-        
+        if transaction_status:
             # Unpack and log the results
-            status = next(iter(transaction_status["status"].keys()), None)
             error = transaction_status["err"]
+            status = "Ok" if error is None else "Err"
             confirmationStatus = transaction_status["confirmationStatus"]
 
             trade_logger.info(f"Trade confirmation for {signature_string} - Status: {status} - Error: {error} - ConfirmationStatus: {confirmationStatus}")
@@ -395,9 +393,8 @@ async def execute_swap(rpc_client:AsyncClient, httpx_client:httpx.AsyncClient, q
             raw_transaction = VersionedTransaction.from_bytes(base64.b64decode(swap_transaction))
             old_msg = raw_transaction.message
 
-            # Get a fresh blockhash 
-            fresh_blockhash_resp = await rpc_client.get_latest_blockhash()
-            fresh_blockhash = str(fresh_blockhash_resp.value.blockhash)
+            # Get a fresh blockhash from the background cache
+            fresh_blockhash = str(await chain_state.get_blockhash())
             
             # Replace Jupiter blockhash with the fresho one - prevents forked/ephemeral blockhash issues
             new_msg = clone_v0_message_with_new_blockhash(old_msg, fresh_blockhash)
@@ -733,15 +730,14 @@ async def execute_sell(rpc_client:AsyncClient, httpx_client:httpx.AsyncClient, r
         trade_logger.info(f"Sell transaction sent: https://solscan.io/tx/{signature}")
         sell_tx_result = await get_transaction_details(rpc_client=rpc_client, signature=signature, wallet_address=WALLET_ADDRESS, input_mint=risky_address, output_mint=SOL_MINT)
 
-        # Retrieve buy trade data from Redis and write both buy & sell data to CSV.
-        buy_trade_data = await fetch_trade_data(redis_client_trades=redis_client_trades, token_address=risky_address)
+        # Store the sell data - save_trade merges it with the buy data cached in Redis
         sell_trade_data = {
             "sell_timestamp": sell_tx_result["timestamp"],
             "sell_transaction_hash": str(signature),
             "sell_tokens_spent": sell_tx_result["inputMint_diff"],
             "sell_tokens_received": sell_tx_result["outputMint_diff"]
         }
-        await write_trades_to_csv(tx_address=risky_address, buy_data_dict=buy_trade_data, sell_data_dict=sell_trade_data, redis_client=redis_client_trades)
+        await save_trade(tx_address=risky_address, sell_data_dict=sell_trade_data, redis_client=redis_client_trades)
         return True
 
 
@@ -14,55 +14,62 @@ from solders.pubkey import Pubkey # type: ignore
 from solders.transaction_status import InstructionErrorCustom # type: ignore
 
 from utils.api import get_pool_info_by_mint
+from utils.common_utils import get_token_balance_raw
 from utils.pool_utils import (
     AmmV4PoolKeys,
-    fetch_amm_v4_pool_keys,
+    get_amm_v4_pool_keys,
     get_amm_v4_reserves)
 
-from raydium.amm_v4 import buy, sell
+from utils.price_feed import price_feed, reserve_aggregator
+from utils.position_manager import ExitSignal, position_manager
+from raydium.amm_v4 import BuyTemplate, buy, sell
 from raydium.constants import TOKEN_PROGRAM_ID, WSOL
-from storage_utils import store_trade_data, write_trades_to_csv
-from config import client, trade_logger, RPC_URL, QN_RPC_URL, PRIORITY_FEE_DICT, TRADE_AMOUNT_SOL, BUY_SLIPPAGE, SELL_SLIPPAGE, MAX_TRADE_TIME_MINS, JUPITER_QUOTE_URL, WALLET_ADDRESS, FEE_LEVELS
+from storage_utils import store_trade_data, save_trade
+from utils.metrics import open_positions, slippage_retries, trade_attempts, trades
+from utils.tracing import tracer
+from config import client, trade_logger, RPC_URL, QN_RPC_URL, PRIORITY_FEE_DICT, TRADE_AMOUNT_SOL, BUY_SLIPPAGE, SELL_SLIPPAGE, MAX_TRADE_TIME_MINS, JUPITER_QUOTE_URL, WALLET_ADDRESS, FEE_LEVELS, SUBMISSION_STRATEGY, PARALLEL_FEE_LEVELS
+
+# Report the number of open positions on every metrics scrape
+open_positions.set_function(lambda: len(position_manager))
 
 
 # Wrapper to house all trade logic and functions
-async def raydium_trade_wrapper(httpx_client: httpx.AsyncClient, redis_trades: redis.Redis, pair_address: str, token_mint: str) -> None:
+async def raydium_trade_wrapper(httpx_client: httpx.AsyncClient, redis_trades: redis.Redis, pair_address: str, token_mint: str, template: Optional[BuyTemplate] = None) -> None:
         
-    buy_result, buy_price = await execute_buy(httpx_client=httpx_client, redis_client_trades=redis_trades, pair_address=pair_address, token_mint=token_mint)
+    buy_result, buy_price = await execute_buy(httpx_client=httpx_client, redis_client_trades=redis_trades, pair_address=pair_address, token_mint=token_mint, template=template)
     trade_logger.info(f"Buy price: {buy_price}")
     
+    # The notification -> fill trace ends with the buy (the sells are not traced)
+    tracer.end_trace(outcome='filled' if buy_result is True else 'failed')
+    
     if buy_result:
         trade_logger.info(f"Trade in progress: {pair_address}")
+        if buy_price is None:
+            buy_price = await get_raydium_price(pair_address)
+        if buy_price is None:
+            trade_logger.warning(f"No buy price for {pair_address} - the position entry is taken from the first price update")
         
-        # Calculate trade parameters
-        trade_start_time = time.time()
-        take_profit_price = buy_price*(1 + 0.4)
-        stoploss_price = buy_price*(1 - 0.2)
-        while True:
-            
-            # Get current price
-            current_price = await get_raydium_price(pair_address)
-            
-            # Exit 1: if trade duration has expired
-            elapsed_time = time.time() - trade_start_time
-            if elapsed_time >= (MAX_TRADE_TIME_MINS * 60):
-                trade_logger.info(f"Trade duration for {pair_address} completed. Initiating ordered sell | Current price: {current_price}")
-                await execute_sell(httpx_client=httpx_client, redis_client_trades=redis_trades, pair_address=pair_address, token_mint=token_mint)
-                break
-                
-            # Exit 2: Take profit target is hit
-            elif current_price >= take_profit_price:
-                trade_logger.info(f"Take profit triggered for {pair_address} at price: {current_price}")
-                await execute_sell(httpx_client=httpx_client, redis_client_trades=redis_trades, pair_address=pair_address, token_mint=token_mint)
-                break
-            
-            # Exit 3: Stop loss
-            elif current_price <= stoploss_price:
-                trade_logger.info(f"Stoploss triggered for {pair_address} at price: {current_price}")
-                await execute_sell(httpx_client=httpx_client, redis_client_trades=redis_trades, pair_address=pair_address, token_mint=token_mint)
-                break
-            
-            await asyncio.sleep(0.5)
+        # Stream the pool's vault balances rather than polling them
+        pool_keys = await get_amm_v4_pool_keys(pair_address)
+        if pool_keys is not None:
+            await price_feed.add_pool(pair_address, pool_keys)
+            reserve_aggregator.start()
+        
+        # Exit rules (take profit ladder, trailing stop, stoploss, time decay) are evaluated centrally by the position manager on each price update
+        async def exit_position(signal: ExitSignal) -> bool:
+            trade_logger.info(f"Exit triggered for {pair_address} - {signal.reason} ({signal.percentage}%) | Current price: {signal.price}")
+            if not await get_token_balance_raw(token_mint):
+                # Nothing left to sell (sold elsewhere or the token account was closed) - retrying the sell cannot succeed
+                trade_logger.warning(f"No {token_mint} tokens left in the wallet - closing the position for {pair_address}")
+                position_manager.close(pair_address)
+                return False
+            return bool(await execute_sell(httpx_client=httpx_client, redis_client_trades=redis_trades, pair_address=pair_address, token_mint=token_mint, percentage=signal.percentage))
+        
+        try:
+            await position_manager.open(pair_address, token_mint, buy_price, on_exit=exit_position)
+        finally:
+            position_manager.close(pair_address)
+            await price_feed.remove_pool(pair_address)
         
     else:
         return None
@@ -72,7 +79,8 @@ async def raydium_trade_wrapper(httpx_client: httpx.AsyncClient, redis_trades: r
 async def execute_buy(httpx_client: httpx.AsyncClient, 
                       redis_client_trades: redis.Redis, 
                       pair_address: str, 
-                      token_mint: str) -> Union[Dict[str, Any], bool]:
+                      token_mint: str,
+                      template: Optional[BuyTemplate] = None) -> Union[Dict[str, Any], bool]:
     """
     Executes a Raydium trade (buy) with incremental adjustments for priority fee and slippage.
     
@@ -82,6 +90,7 @@ async def execute_buy(httpx_client: httpx.AsyncClient,
     
     :param httpx_client: The async HTTP client for network requests.
     :param pair_address: The address of the token pair.
+    :param template: Pre-armed buy from prepare_buy. Built here if not supplied.
     :return: The successful trade result, or False if all combinations fail.
     """
     
@@ -89,30 +98,36 @@ async def execute_buy(httpx_client: httpx.AsyncClient,
     
     # Get recent priority fees
     try:
-        fees_dict = await get_qn_priority_fees(httpx_client=httpx_client)
+        with tracer.span('priority_fees'):
+            fees_dict = await get_qn_priority_fees(httpx_client=httpx_client)
         trade_logger.info(f"Priority fees: {fees_dict}")
     except Exception as e:
         trade_logger.error(f"Failed to fetch priority fees - {e}")
         return False, None
 
     try:
-        # Create a loop of increasing priority fee levels
-        for level in FEE_LEVELS:
-            fee_value = fees_dict.get(level)
-            if fee_value is None:
+        # Create a loop of increasing priority fee levels - each group of levels is broadcast together
+        for levels in fee_level_groups():
+            fee_values = [fees_dict[lvl] for lvl in levels if fees_dict.get(lvl) is not None]
+            level = "/".join(levels)
+            if not fee_values:
                 trade_logger.warning(f"No priority fee found for {level}th. Skipping.")
                 continue
+            fee_value = max(fee_values)
 
             # Start with the smallest slippage value and increase if slippage exceed error is received
             current_slippage = BUY_SLIPPAGE['MIN']
             while current_slippage <= BUY_SLIPPAGE['MAX']:
                 trade_logger.info(f"Attempting buy with priority fee: {fee_value} ({level}th) and slippage: {current_slippage}%")
+                trade_attempts.inc(side='buy', fee_level=level)
                 result, trade_data, buy_price = await buy(
                     pair_address=pair_address,
                     token_mint=token_mint,
                     sol_in=TRADE_AMOUNT_SOL,
                     slippage=current_slippage,
-                    priority_fee=fee_value
+                    priority_fee=fee_value,
+                    template=template,
+                    priority_fees=fee_values
                 )
         
                 # If False/None is returned - typically due to insufficient priority fees. Break loop and try next fee level
@@ -125,6 +140,7 @@ async def execute_buy(httpx_client: httpx.AsyncClient,
                     error = result.code
                     if error == 30:
                         trade_logger.warning(f"Buy failed - insufficient slippage ({current_slippage}%). Increasing slippage and retrying")
+                        slippage_retries.inc(side='buy')
                         current_slippage = increase_slippage(current_slippage, BUY_SLIPPAGE)
                         continue
                 elif isinstance(result, dict):          # {'InstructionError': [5, {'Custom': 30}]} from confirm_tx
@@ -132,6 +148,7 @@ async def execute_buy(httpx_client: httpx.AsyncClient,
                     error = error.get("Custom")
                     if error == 30:
                         trade_logger.warning(f"Buy failed - insufficient slippage ({current_slippage}%). Increasing slippage and retrying")
+                        slippage_retries.inc(side='buy')
                         current_slippage = increase_slippage(current_slippage, BUY_SLIPPAGE)
                         continue
                 
@@ -144,6 +161,7 @@ async def execute_buy(httpx_client: httpx.AsyncClient,
                 if result:
                     # If buy function returns True, then trade and confirmation was successful
                     trade_logger.info(f"Buy successful with priority fee {fee_value} ({level}th) and slippage {current_slippage}%.")
+                    trades.inc(side='buy', outcome='filled', fee_level=level)
                     
                     # Cache trade data in redis
                     data_to_cache = {
@@ -160,10 +178,12 @@ async def execute_buy(httpx_client: httpx.AsyncClient,
 
         # Fail-safe if trade exhausts slippage or priority fee levels return Fa
         trade_logger.error("Buy operation failed for all priority fee and slippage combinations.")
+        trades.inc(side='buy', outcome='failed')
         return False, None
     
     except Exception as e:
         trade_logger.error(f"Unexpected buy function error: {e}")
+        trades.inc(side='buy', outcome='error')
         return False, None
 
 
@@ -172,7 +192,8 @@ async def execute_sell(
     httpx_client: httpx.AsyncClient, 
     redis_client_trades: redis.Redis,
     pair_address: str, 
-    token_mint: str
+    token_mint: str,
+    percentage: int = 100
     ) -> Union[Dict[str, Any], bool]:
     """
     Executes a Raydium trade (sell) with incremental adjustments for priority fee and slippage.
@@ -183,10 +204,11 @@ async def execute_sell(
     
     :param httpx_client: The async HTTP client for network requests.
     :param pair_address: The address of the token pair.
+    :param percentage: Percentage of the current token balance to sell (partial take profits).
     :return: The successful trade result, or False if all combinations fail.
     """
     
-    trade_logger.info(f"Starting sell transaction for pair address: {pair_address}")
+    trade_logger.info(f"Starting sell transaction for pair address: {pair_address} ({percentage}%)")
     
     # Get recent priority fees
     try:
@@ -197,25 +219,28 @@ async def execute_sell(
         return False
 
     try:
-        # Create a loop of increasing priority fee levels
-        for level in FEE_LEVELS:
-            fee_value = fees_dict.get(level)
-            if fee_value is None:
+        # Create a loop of increasing priority fee levels - each group of levels is broadcast together
+        for levels in fee_level_groups():
+            fee_values = [fees_dict[lvl] for lvl in levels if fees_dict.get(lvl) is not None]
+            level = "/".join(levels)
+            if not fee_values:
                 trade_logger.warning(f"No priority fee found for {level}th. Skipping.")
                 continue
+            fee_value = max(fee_values)
 
             # Start with the smallest slippage value and increase if slippage exceed error is received
             current_slippage = SELL_SLIPPAGE['MIN']
             while current_slippage <= SELL_SLIPPAGE['MAX']:
                 trade_logger.info(f"Attempting sell with priority fee: {fee_value} ({level}th) and slippage: {current_slippage}%")
                 
-                # Lower percentage for testing
+                trade_attempts.inc(side='sell', fee_level=level)
                 result, trade_data = await sell(
                     pair_address=pair_address,
                     token_mint=token_mint,
-                    percentage=100,
+                    percentage=percentage,
                     slippage=current_slippage,
-                    priority_fee=fee_value
+                    priority_fee=fee_value,
+                    priority_fees=fee_values
                 )
                 
                 # If False/None is returned - typically due to insufficient priority fees. Break loop and try next fee level
@@ -228,6 +253,7 @@ async def execute_sell(
                     error = result.code
                     if error == 30:
                         trade_logger.warning(f"Sell failed - insufficient slippage ({current_slippage}%). Increasing slippage and retrying")
+                        slippage_retries.inc(side='sell')
                         current_slippage = increase_slippage(current_slippage, SELL_SLIPPAGE)
                         continue
                     
@@ -236,6 +262,7 @@ async def execute_sell(
                     error = error.get("Custom")
                     if error == 30:
                         trade_logger.warning(f"Sell failed - insufficient slippage ({current_slippage}%). Increasing slippage and retrying")
+                        slippage_retries.inc(side='sell')
                         current_slippage = increase_slippage(current_slippage, SELL_SLIPPAGE)
                         continue
                 
@@ -247,6 +274,7 @@ async def execute_sell(
                 if result:
                     # If Sell function returns True, then trade and confirmation was successful
                     trade_logger.info(f"Sell successful with priority fee {fee_value} ({level}th) and slippage {current_slippage}%.")
+                    trades.inc(side='sell', outcome='filled', fee_level=level)
                                     
                     data_to_cache = {
                         'sell_timestamp': trade_data.get("Timestamp", ""),  
@@ -256,7 +284,7 @@ async def execute_sell(
                     }
                     
                     # Store the trade data for further analysis
-                    await write_trades_to_csv(
+                    await save_trade(
                         redis_client=redis_client_trades,
                         tx_address=token_mint,
                         sell_data_dict=data_to_cache
@@ -266,16 +294,18 @@ async def execute_sell(
 
         # Fail-safe if trade exhausts slippage or priority fee levels return Fa
         trade_logger.error("Sell operation failed for all priority fee and slippage combinations.")
+        trades.inc(side='sell', outcome='failed')
         return False
     
     except Exception as e:
         trade_logger.error(f"Unexpected buy function error: {e}")
+        trades.inc(side='sell', outcome='error')
         return False
 
 
-# Get the token price
+# Get the token price - pool keys come from the cache, so only the reserves are fetched on each tick
 async def get_raydium_price(pair_address):
-    pool_keys: Optional[AmmV4PoolKeys] = await fetch_amm_v4_pool_keys(pair_address)
+    pool_keys: Optional[AmmV4PoolKeys] = await get_amm_v4_pool_keys(pair_address)
     if pool_keys is None:
         trade_logger.error(f"No pool keys found for {pair_address}")
         return None
@@ -285,6 +315,13 @@ async def get_raydium_price(pair_address):
     return round(quote_reserve/base_reserve,9)
 
 
+# Groups of fee levels to attempt, in order. Each group is signed and broadcast at the same time
+def fee_level_groups() -> list:
+    if SUBMISSION_STRATEGY == 'parallel':
+        return PARALLEL_FEE_LEVELS
+    return [[level] for level in FEE_LEVELS]
+
+
 # Helper function to increase slippage in line with dict settings
 def increase_slippage(current: int, slippage_dict: dict) -> int:
     return min(current + slippage_dict['INCREMENTS'], slippage_dict['MAX'])
@@ -317,7 +354,7 @@ async def get_qn_priority_fees(httpx_client: httpx.AsyncClient, fees_account: st
 
         # Create a new dictionary with only fees greater than the median
         # keys_to_extract = {50, 55, 60, 65, 70, 75, 85}
-        keys_to_extract = {int(fee) for fee in FEE_LEVELS}
+        keys_to_extract = {int(fee) for fee in FEE_LEVELS} | {int(fee) for group in PARALLEL_FEE_LEVELS for fee in group}
         filtered_dict = {k: v for k, v in response.items() if int(k) in keys_to_extract}
         
         # Adjust values based on PRIORITY_FEE_MIN and PRIORITY_FEE_MAX
@@ -0,0 +1,52 @@
+import struct
+from typing import Optional
+
+from solana.rpc.commitment import Commitment, Processed
+from solana.rpc.types import DataSliceOpts
+from solders.pubkey import Pubkey  # type: ignore
+
+# Offset of the u64 amount inside an SPL token account (mint: 32 bytes, owner: 32 bytes, amount: 8 bytes)
+SPL_TOKEN_AMOUNT_OFFSET = 64
+SPL_TOKEN_AMOUNT = struct.Struct('<Q')
+
+# Only the 8 amount bytes of a token account are requested when reading balances
+TOKEN_AMOUNT_SLICE = DataSliceOpts(offset=SPL_TOKEN_AMOUNT_OFFSET, length=SPL_TOKEN_AMOUNT.size)
+
+def decode_spl_token_amount(data, offset: int=SPL_TOKEN_AMOUNT_OFFSET) -> int:
+    """Reads the u64 amount from SPL token account bytes. Pass offset=0 for data fetched with TOKEN_AMOUNT_SLICE."""
+    return SPL_TOKEN_AMOUNT.unpack_from(data, offset)[0]
+
+async def get_account_data(rpc_client, pubkey: Pubkey, commitment: Commitment=Processed) -> Optional[memoryview]:
+    """
+    Fetches an account as base64 and returns its raw bytes as a memoryview (None if the account does not exist).
+    The node skips the jsonParsed rendering and the caller decodes fields in place with struct.unpack_from / construct.
+    """
+    response = await rpc_client.get_account_info(pubkey, commitment=commitment, encoding="base64")
+    if response.value is None:
+        return None
+    return memoryview(response.value.data)
+
+async def get_multiple_account_data(
+    rpc_client, 
+    pubkeys: list, 
+    commitment: Commitment=Processed, 
+    data_slice: Optional[DataSliceOpts]=None
+) -> tuple:
+    """
+    Fetches several accounts as base64 in one call, optionally only a slice of each account's data.
+
+    Returns:
+        (slot, [memoryview | None, ...]) in the same order as pubkeys
+    """
+    response = await rpc_client.get_multiple_accounts(pubkeys, commitment=commitment, encoding="base64", data_slice=data_slice)
+    return response.context.slot, [memoryview(account.data) if account is not None else None for account in response.value]
+
+async def get_token_amounts(rpc_client, token_accounts: list, commitment: Commitment=Processed) -> tuple:
+    """
+    Reads the raw u64 balances of SPL token accounts, fetching only the 8 amount bytes of each.
+
+    Returns:
+        (slot, [amount | None, ...]) in the same order as token_accounts
+    """
+    slot, datas = await get_multiple_account_data(rpc_client, token_accounts, commitment, data_slice=TOKEN_AMOUNT_SLICE)
+    return slot, [decode_spl_token_amount(data, 0) if data is not None else None for data in datas]
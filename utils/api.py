@@ -1,17 +1,18 @@
 import json
 import asyncio
-import requests
+import httpx
+from http_utils import get_with_backoff
 
 WSOL = "So11111111111111111111111111111111111111112"
 
-def get_pool_info_by_id(pool_id: str) -> dict:
+async def get_pool_info_by_id(pool_id: str) -> dict:
     base_url = "https://api-v3.raydium.io/pools/info/ids"
     params = {"ids": pool_id}
     try:
-        response = requests.get(base_url, params=params)
+        response = await get_with_backoff(base_url, params=params)
         response.raise_for_status()
         return response.json()
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         return {"error": f"Failed to fetch pool info: {e}"}
 
 async def get_pool_info_by_mint(mint: str, pool_type: str = "all", sort_field: str = "default", 
@@ -27,7 +28,7 @@ async def get_pool_info_by_mint(mint: str, pool_type: str = "all", sort_field: s
     }
 
     try:
-        response = requests.get(base_url, params=params)
+        response = await get_with_backoff(base_url, params=params)
         response.raise_for_status()
         response = response.json() 
     
@@ -49,10 +50,10 @@ async def get_pool_info_by_mint(mint: str, pool_type: str = "all", sort_field: s
 
         return None  # Return None if no match is found
     
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         return {"error": f"Failed to fetch pair address: {e}"}
 
 
 # if __name__ == "__main__":
 #     result = asyncio.run(get_pool_info_by_mint("45CPLcWGGzVv8Adb7P4G1XMJiagrcDjKNN79hFXLpump"))
-#     print(json.dumps(result, indent=4))
\ No newline at end of file
+#     print(json.dumps(result, indent=4))
\ No newline at end of file
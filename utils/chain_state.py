@@ -0,0 +1,85 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from solana.rpc.async_api import AsyncClient
+from solders.hash import Hash  # type: ignore
+from spl.token.async_client import AsyncToken
+
+from config import client, trade_logger, BLOCKHASH_MAX_AGE, BLOCKHASH_REFRESH_INTERVAL
+
+@dataclass
+class CachedBlockhash:
+    blockhash: Hash
+    last_valid_block_height: int
+    fetched_at: float       # time.monotonic() when the blockhash was fetched
+
+class ChainStateCache:
+    """
+    Keeps a recent blockhash (and its last valid block height) plus the SPL token account rent-exempt
+    balance in memory, so transaction builders do not spend an RPC round trip on either.
+
+    A background task refreshes the blockhash every BLOCKHASH_REFRESH_INTERVAL seconds. If the cached
+    blockhash is older than BLOCKHASH_MAX_AGE (e.g. the refresher is not running) it is fetched on demand.
+    The rent-exempt balance is a constant, so it is only fetched once.
+    """
+
+    def __init__(self, rpc_client: AsyncClient=client, refresh_interval: float=BLOCKHASH_REFRESH_INTERVAL, max_age: float=BLOCKHASH_MAX_AGE):
+        self.rpc_client = rpc_client
+        self.refresh_interval = refresh_interval
+        self.max_age = max_age
+        self._blockhash: Optional[CachedBlockhash] = None
+        self._rent_lamports: Optional[int] = None
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def refresh_blockhash(self) -> CachedBlockhash:
+        response = await self.rpc_client.get_latest_blockhash()
+        self._blockhash = CachedBlockhash(
+            blockhash=response.value.blockhash,
+            last_valid_block_height=response.value.last_valid_block_height,
+            fetched_at=time.monotonic()
+        )
+        return self._blockhash
+
+    async def get_blockhash_info(self) -> CachedBlockhash:
+        cached = self._blockhash
+        if cached is not None and time.monotonic() - cached.fetched_at <= self.max_age:
+            return cached
+        
+        # Only one caller refreshes a stale blockhash - the rest wait and reuse it
+        async with self._lock:
+            cached = self._blockhash
+            if cached is None or time.monotonic() - cached.fetched_at > self.max_age:
+                cached = await self.refresh_blockhash()
+        return cached
+
+    async def get_blockhash(self) -> Hash:
+        return (await self.get_blockhash_info()).blockhash
+
+    async def get_rent_exempt_balance(self) -> int:
+        if self._rent_lamports is None:
+            self._rent_lamports = int(await AsyncToken.get_min_balance_rent_for_exempt_for_account(self.rpc_client))
+        return self._rent_lamports
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.refresh_blockhash()
+                if self._rent_lamports is None:
+                    await self.get_rent_exempt_balance()
+            except Exception as e:
+                trade_logger.error(f"Error refreshing blockhash cache: {e}")
+            await asyncio.sleep(self.refresh_interval)
+
+chain_state = ChainStateCache()
@@ -1,12 +1,15 @@
 import datetime
 import json
 import asyncio
+import time
 from solana.rpc.commitment import Processed, Confirmed, Finalized
 from solana.rpc.types import TokenAccountOpts
 from solders.signature import Signature #type: ignore
 from solders.pubkey import Pubkey  # type: ignore
 # from raydium.constants import TOKEN_PROGRAM_ID
-from config import client, payer_keypair, trade_logger, WALLET_ADDRESS
+from config import client, payer_keypair, trade_logger, WALLET_ADDRESS, CONFIRMATION_TIMEOUT
+from utils.confirmation import confirmation_service
+from utils.metrics import confirmation_seconds
 
 def get_wallet_changes(tx, spl_mint, wallet_pubkey):
     """
@@ -24,9 +27,8 @@ def get_wallet_changes(tx, spl_mint, wallet_pubkey):
       wallet_pubkey (str): Your wallet’s public key.
     
     Returns:
-      tuple: (sol_change, spl_token_change)
-             where sol_change is in lamports.
-             and spl_token_change is the difference in the "amount" field.
+      dict: Timestamp, SOL change (lamports), Token change (the difference in the "amount" field)
+            and Fee (lamports, from meta.fee - the base fee plus the priority fee).
     """
     
     # Filter outer details to get transaction timestamp
@@ -57,7 +59,7 @@ def get_wallet_changes(tx, spl_mint, wallet_pubkey):
 
     spl_token_change = post_amount - pre_amount
 
-    return {"Timestamp": formatted_datetime, "SOL change": sol_change, "Token change": spl_token_change}
+    return {"Timestamp": formatted_datetime, "SOL change": sol_change, "Token change": spl_token_change, "Fee": tx.get("fee")}
 
 async def get_token_balance(mint_str: str) -> float | None:
 
@@ -77,43 +79,51 @@ async def get_token_balance(mint_str: str) -> float | None:
     return None
 
 
-async def confirm_txn(txn_sig: Signature, spl_mint:str, max_retries: int = 15, retry_interval: int = 3) -> bool:    
-    retries = 1
+# Raw token balance (smallest unit) - used for exact sell amounts
+async def get_token_balance_raw(mint_str: str) -> int | None:
+
+    mint = Pubkey.from_string(mint_str)
+    response = await client.get_token_accounts_by_owner_json_parsed(
+        payer_keypair.pubkey(),
+        TokenAccountOpts(mint=mint),
+        commitment=Processed
+    )
+
+    if response.value:
+        return int(response.value[0].account.data.parsed['info']['tokenAmount']['amount'])
+    return None
+
+
+# Wait for the signature via the confirmation service - the transaction is fetched by the shared poller once it has confirmed
+async def confirm_txn(txn_sig: Signature, spl_mint:str, timeout: float = CONFIRMATION_TIMEOUT) -> tuple:    
+    started_at = time.perf_counter()
+    status = await confirmation_service.wait_for_signature(txn_sig, commitment="confirmed", timeout=timeout, with_transaction=True)
     
-    while retries < max_retries:
-        try:
-            txn_res = await client.get_transaction(
-                txn_sig, 
-                encoding="json", 
-                commitment=Confirmed, 
-                max_supported_transaction_version=0)
-            
-            txn_json = json.loads(txn_res.value.transaction.meta.to_json())
-            
-            if txn_json['err'] is None:
-                trade_logger.info(f"Transaction confirmed")
-                wallet_changes = get_wallet_changes(txn_res, spl_mint, WALLET_ADDRESS)
-                trade_logger.info(f"Transaction details: | SOL change: {wallet_changes.get('SOL change', '')} | Token change: {wallet_changes.get('Token change', '')}")
-                return True, wallet_changes
-            
-            # trade_logger.error("Error: Transaction not confirmed. Retrying...")
-            error = txn_json['err']
-            if error:
-                trade_logger.error(f"Transaction failed...{error}")     # {'InstructionError': [4, {'Custom': 30}]}            
-                return error, None
-
-        except Exception as e:
-            # Catch the error specifically relating to the confirmation failing
-            if str(e) == "'NoneType' object has no attribute 'transaction'":
-                trade_logger.info(f"Awaiting confirmation... try count: {retries}")
-                retries += 1
-                await asyncio.sleep(retry_interval)
-            else:
-                trade_logger.error(f"Confirm_tx error: {e}")
-                return e, None
+    if status is None:
+        confirmation_seconds.observe(time.perf_counter() - started_at, outcome='timeout')
+        trade_logger.error(f"No confirmation after {timeout} seconds. Transaction confirmation failed.")
+        return None, None
+    
+    error = status['err']
+    confirmation_seconds.observe(time.perf_counter() - started_at, outcome='failed' if error else 'confirmed')
+    if error:
+        trade_logger.error(f"Transaction failed...{error}")     # {'InstructionError': [4, {'Custom': 30}]}            
+        return error, None
+    
+    trade_logger.info(f"Transaction confirmed")
+    txn_res = status.get('transaction')
+    if txn_res is None:
+        # The transaction landed, only the details are missing
+        trade_logger.error(f"Transaction {txn_sig} confirmed but its details could not be fetched")
+        return True, {}
     
-    trade_logger.error("Max retries reached. Transaction confirmation failed.")
-    return None, None
+    try:
+        wallet_changes = get_wallet_changes(txn_res, spl_mint, WALLET_ADDRESS)
+    except Exception as e:
+        trade_logger.error(f"Error reading confirmed transaction details: {e}")
+        return True, {}
+    trade_logger.info(f"Transaction details: | SOL change: {wallet_changes.get('SOL change', '')} | Token change: {wallet_changes.get('Token change', '')}")
+    return True, wallet_changes
 
 
 
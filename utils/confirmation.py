@@ -0,0 +1,319 @@
+import asyncio
+import itertools
+import json
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+import websockets
+from solana.rpc.commitment import Confirmed
+from solders.signature import Signature  # type: ignore
+
+from config import (client, trade_logger, WS_URL, RELAY_DELAY, CONFIRMATION_POLL_INTERVAL, CONFIRMATION_POLL_AFTER, 
+                    CONFIRMATION_DETAIL_RETRIES, CONFIRMATION_DETAIL_CONCURRENCY)
+
+# Ordering of the commitment levels, used to decide if a polled status has reached the level a waiter asked for
+COMMITMENT_RANK = {'processed': 0, 'confirmed': 1, 'finalized': 2}
+
+# Max number of signatures accepted by a single getSignatureStatuses call
+MAX_SIGNATURE_STATUSES = 256
+
+@dataclass
+class _PendingSignature:
+    signature: str
+    commitment: str
+    future: asyncio.Future
+    registered_at: float                # time.monotonic() when the first waiter registered
+    with_transaction: bool = False      # fetch the full transaction once the signature has confirmed
+    waiters: int = 0
+    status: Optional[dict] = None       # set once the status is known and only the transaction details are outstanding
+    request_id: Optional[int] = None
+    subscription_id: Optional[int] = None
+
+@dataclass
+class PollerStats:
+    polls: int = 0                  # poll ticks that had signatures to query
+    rpc_calls: int = 0              # getSignatureStatuses calls
+    signatures_polled: int = 0      # signatures sent across all getSignatureStatuses calls
+    transactions_fetched: int = 0   # getTransaction calls (confirmed signatures only)
+    last_poll_size: int = 0
+    max_poll_size: int = 0
+
+    def summary(self) -> str:
+        return (f"polls: {self.polls} | getSignatureStatuses calls: {self.rpc_calls} | signatures polled: {self.signatures_polled} | "
+                f"getTransaction calls: {self.transactions_fetched} | largest poll: {self.max_poll_size}")
+
+class SignatureStatusPoller:
+    """
+    Polls every pending signature together, in getSignatureStatuses chunks of up to 256, on a fixed cadence.
+
+    Shared by all trade tasks so a burst of migrations costs one round of RPC calls per tick instead of one
+    getTransaction loop per transaction. The full transaction is only fetched for signatures that have
+    confirmed and whose waiter asked for it, and is delivered to the waiter with the status.
+    """
+
+    def __init__(
+        self, 
+        pending: dict, 
+        poll_interval: float=CONFIRMATION_POLL_INTERVAL, 
+        poll_after: float=CONFIRMATION_POLL_AFTER, 
+        chunk_size: int=MAX_SIGNATURE_STATUSES,
+        detail_concurrency: int=CONFIRMATION_DETAIL_CONCURRENCY,
+        is_streaming: Callable[[], bool]=lambda: False
+    ):
+        self.poll_interval = poll_interval
+        self.poll_after = poll_after
+        self.chunk_size = min(chunk_size, MAX_SIGNATURE_STATUSES)
+        self.is_streaming = is_streaming    # while statuses are streamed, only signatures older than poll_after are polled
+        self.stats = PollerStats()
+        self._pending = pending             # signature -> _PendingSignature, shared with the owner
+        self._detail_semaphore = asyncio.Semaphore(detail_concurrency)
+        self._detail_tasks: dict = {}       # signature -> asyncio.Task fetching the transaction
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for task in self._detail_tasks.values():
+            task.cancel()
+        self._detail_tasks.clear()
+
+    def set_status(self, pending: _PendingSignature, status: dict) -> None:
+        """Hands a known status to the waiter - via a single getTransaction first if the waiter wants the details."""
+        if pending.future.done() or pending.status is not None:
+            return
+        if not pending.with_transaction or status["err"] is not None:
+            pending.future.set_result(status)
+            return
+        pending.status = status
+        self._detail_tasks[pending.signature] = asyncio.create_task(self._fetch_transaction(pending))
+
+    def due(self) -> list:
+        streaming = self.is_streaming()
+        now = time.monotonic()
+        return [
+            pending for pending in self._pending.values()
+            if not pending.future.done() and pending.status is None and (not streaming or now - pending.registered_at >= self.poll_after)
+        ]
+
+    async def poll_once(self) -> None:
+        due = self.due()
+        if not due:
+            return
+        
+        chunks = [due[i:i + self.chunk_size] for i in range(0, len(due), self.chunk_size)]
+        self.stats.polls += 1
+        self.stats.last_poll_size = len(due)
+        self.stats.max_poll_size = max(self.stats.max_poll_size, len(due))
+        await asyncio.gather(*(self._poll_chunk(chunk) for chunk in chunks))
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self.poll_once()
+            except Exception as e:
+                trade_logger.error(f"Signature status poller error: {e}")
+
+    async def _poll_chunk(self, chunk: list) -> None:
+        self.stats.rpc_calls += 1
+        self.stats.signatures_polled += len(chunk)
+        try:
+            response = await client.get_signature_statuses([Signature.from_string(pending.signature) for pending in chunk])
+        except Exception as e:
+            trade_logger.error(f"getSignatureStatuses error for {len(chunk)} signatures: {e}")
+            return
+        
+        for pending, status in zip(chunk, response.value):
+            if status is None:
+                continue
+            status_json = json.loads(status.to_json())
+            confirmation_status = status_json.get("confirmationStatus")
+            reached = COMMITMENT_RANK.get(confirmation_status, -1) >= COMMITMENT_RANK.get(pending.commitment, 1)
+            if status_json.get("err") is not None or reached:
+                self.set_status(pending, {
+                    "signature": pending.signature,
+                    "slot": status_json.get("slot"),
+                    "err": status_json.get("err"),
+                    "confirmationStatus": confirmation_status
+                })
+
+    async def _fetch_transaction(self, pending: _PendingSignature) -> None:
+        transaction = None
+        try:
+            async with self._detail_semaphore:
+                for attempt in range(1, CONFIRMATION_DETAIL_RETRIES + 1):
+                    self.stats.transactions_fetched += 1
+                    try:
+                        response = await client.get_transaction(
+                            Signature.from_string(pending.signature), 
+                            encoding="json", 
+                            commitment=Confirmed, 
+                            max_supported_transaction_version=0)
+                    except Exception as e:
+                        trade_logger.error(f"Error fetching confirmed transaction {pending.signature}: {e}")
+                        break
+                    
+                    # The RPC node serving getTransaction can lag the node that reported the status
+                    if response.value is not None:
+                        transaction = response
+                        break
+                    await asyncio.sleep(0.5 * attempt)
+        finally:
+            self._detail_tasks.pop(pending.signature, None)
+            if not pending.future.done():
+                pending.future.set_result({**pending.status, "transaction": transaction})
+
+class ConfirmationService:
+    """
+    Confirms every in-flight signature over a single websocket using signatureSubscribe.
+
+    Each waiter gets a future that is resolved the moment a signatureNotification arrives. Signatures that
+    have not been resolved after CONFIRMATION_POLL_AFTER seconds (or while the websocket is down) are picked
+    up by the shared SignatureStatusPoller, so a dropped notification never leaves a trade hanging.
+    
+    Resolved futures hold {"signature", "slot", "err", "confirmationStatus"} plus "transaction" (the
+    getTransaction response, or None if it could not be fetched) when the waiter asked for it. The
+    subscription is removed by the node once it has notified, so there is nothing to unsubscribe on success.
+    """
+
+    def __init__(self, ws_url: str=WS_URL, poll_interval: float=CONFIRMATION_POLL_INTERVAL, poll_after: float=CONFIRMATION_POLL_AFTER):
+        self.ws_url = ws_url
+        self._pending: dict = {}            # signature -> _PendingSignature
+        self._subscriptions: dict = {}      # subscription id -> signature
+        self._pending_requests: dict = {}   # request id -> signature
+        self._request_ids = itertools.count(1)
+        self._websocket = None
+        self._task: Optional[asyncio.Task] = None
+        self.poller = SignatureStatusPoller(self._pending, poll_interval, poll_after, is_streaming=lambda: self.connected)
+
+    @property
+    def connected(self) -> bool:
+        return self._websocket is not None
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        self.poller.start()
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.poller.stop()
+
+    async def wait_for_signature(self, signature, commitment: str='confirmed', timeout: float=None, with_transaction: bool=False) -> Optional[dict]:
+        """
+        Waits until a signature reaches the commitment level (or fails).
+        Returns the status dict, or None if nothing arrived within the timeout.
+        """
+        signature = str(signature)
+        pending = self._pending.get(signature)
+        if pending is None:
+            pending = _PendingSignature(signature, commitment, asyncio.get_running_loop().create_future(), time.monotonic())
+            self._pending[signature] = pending
+            self.start()
+            if self._websocket is not None:
+                await self._subscribe(pending)
+        pending.waiters += 1
+        pending.with_transaction = pending.with_transaction or with_transaction
+        
+        try:
+            # Shield the shared future so one waiter timing out does not cancel it for the others
+            return await asyncio.wait_for(asyncio.shield(pending.future), timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            await self._release(signature)
+
+    async def _release(self, signature: str) -> None:
+        pending = self._pending.get(signature)
+        if pending is None:
+            return
+        pending.waiters -= 1
+        if pending.waiters > 0:
+            return
+        del self._pending[signature]
+        self._pending_requests.pop(pending.request_id, None)
+        if pending.subscription_id is not None:
+            self._subscriptions.pop(pending.subscription_id, None)
+            if pending.status is None and not pending.future.done():
+                await self._send('signatureUnsubscribe', [pending.subscription_id])
+
+    async def _send(self, method: str, params: list) -> Optional[int]:
+        if self._websocket is None:
+            return None
+        request_id = next(self._request_ids)
+        try:
+            await self._websocket.send(json.dumps({"jsonrpc": "2.0", "id": request_id, "method": method, "params": params}))
+        except Exception as e:
+            trade_logger.error(f"Confirmation service {method} error: {e}")
+            return None
+        return request_id
+
+    async def _subscribe(self, pending: _PendingSignature) -> None:
+        request_id = await self._send('signatureSubscribe', [pending.signature, {"commitment": pending.commitment}])
+        if request_id is not None:
+            pending.request_id = request_id
+            self._pending_requests[request_id] = pending.signature
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                async with websockets.connect(self.ws_url, ping_interval=60, ping_timeout=20) as websocket:
+                    self._websocket = websocket
+                    self._subscriptions.clear()
+                    self._pending_requests.clear()
+                    for pending in list(self._pending.values()):
+                        pending.subscription_id = None
+                        if pending.status is None:
+                            await self._subscribe(pending)
+                    trade_logger.info(f"Confirmation service connected - {len(self._pending)} signatures in flight")
+
+                    async for message in websocket:
+                        self._handle_message(json.loads(message))
+            except asyncio.CancelledError:
+                self._websocket = None
+                raise
+            except Exception as e:
+                trade_logger.error(f"Confirmation service websocket error: {e} - reconnecting in {RELAY_DELAY} seconds")
+            self._websocket = None
+            await asyncio.sleep(RELAY_DELAY)
+
+    def _handle_message(self, data: dict) -> None:
+        # Subscription confirmation: {"jsonrpc": "2.0", "result": <subscription id>, "id": <request id>}
+        if "id" in data:
+            signature = self._pending_requests.pop(data["id"], None)
+            pending = self._pending.get(signature) if signature else None
+            if "result" not in data:
+                return
+            if pending is not None:
+                pending.subscription_id = data["result"]
+                self._subscriptions[data["result"]] = signature
+            elif signature is not None:
+                # The waiter gave up while the subscription was in flight
+                asyncio.create_task(self._send('signatureUnsubscribe', [data["result"]]))
+            return
+
+        if data.get("method") != "signatureNotification":
+            return
+        params = data.get("params", {})
+        signature = self._subscriptions.pop(params.get("subscription"), None)
+        pending = self._pending.get(signature) if signature else None
+        if pending is None:
+            return
+        
+        result = params["result"]
+        self.poller.set_status(pending, {
+            "signature": signature,
+            "slot": result["context"]["slot"],
+            "err": result["value"].get("err"),
+            "confirmationStatus": pending.commitment
+        })
+
+confirmation_service = ConfirmationService()
@@ -0,0 +1,196 @@
+import asyncio
+import json
+import statistics
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+import redis.asyncio as redis
+
+from config import migrations_logger, CORRELATION_TTL, CORRELATION_MAX_SIZE, CORRELATION_REDIS_DB, CORRELATION_VERDICT_TIMEOUT
+
+# Max number of withdraw -> initialize2 gaps kept for the summary
+MAX_GAP_SAMPLES = 1000
+
+@dataclass
+class CorrelationEntry:
+    token_mint: str
+    passed: Optional[bool]          # filter verdict - None while the filters are still running
+    data: dict = field(default_factory=dict)
+    withdraw_at: float = field(default_factory=time.time)       # wall clock time of the withdraw event
+    template: Any = None            # pre-armed BuyTemplate - in memory only, rebuilt at buy time after a restore
+    expires_at: float = 0.0         # time.monotonic() after which the entry is evicted
+    verdict: Optional[asyncio.Future] = None    # resolved with passed once the filters have finished
+
+class CorrelationStore:
+    """
+    Withdraw -> initialize2 correlation store, keyed by token mint.
+
+    A withdraw event puts an entry in, the matching initialize2 pops it. Entries whose initialize2 never arrives expire
+    after the TTL, and the store never holds more than max_size entries (oldest evicted first). With a redis client the
+    entries (without the buy template) are persisted, so a reconnect or restart does not lose pending migrations.
+    The time between withdraw and initialize2 is recorded for each matched token. An initialize2 that arrives while
+    the filters are still running waits (up to verdict_timeout) for the verdict instead of dropping the trade.
+    """
+
+    def __init__(
+        self, 
+        prefix: str, 
+        ttl: float=CORRELATION_TTL, 
+        max_size: int=CORRELATION_MAX_SIZE, 
+        redis_client: Optional[redis.Redis]=None, 
+        verdict_timeout: float=CORRELATION_VERDICT_TIMEOUT
+    ):
+        self.prefix = prefix
+        self.ttl = ttl
+        self.max_size = max_size
+        self.redis_client = redis_client
+        self.verdict_timeout = verdict_timeout
+        self._entries: OrderedDict = OrderedDict()     # token_mint -> CorrelationEntry
+        self.gaps: deque = deque(maxlen=MAX_GAP_SAMPLES)   # seconds between withdraw and initialize2 for matched tokens
+        self.expired = 0
+        self.evicted = 0
+
+    def __contains__(self, token_mint: str) -> bool:
+        return self.get(token_mint) is not None
+
+    def __len__(self) -> int:
+        self.purge_expired()
+        return len(self._entries)
+
+    def get(self, token_mint: str) -> Optional[CorrelationEntry]:
+        entry = self._entries.get(token_mint)
+        if entry is None:
+            return None
+        if time.monotonic() >= entry.expires_at:
+            self._expire(token_mint)
+            return None
+        return entry
+
+    async def put(self, token_mint: str, passed: Optional[bool], data: Optional[dict]=None, template: Any=None) -> CorrelationEntry:
+        entry = self.get(token_mint)
+        if entry is not None:
+            # Updated in place - it keeps its expiry, so it keeps its place in the insertion (= expiry) order
+            entry.passed = passed
+            entry.data = data or {}
+            entry.template = template
+        else:
+            entry = CorrelationEntry(
+                token_mint=token_mint,
+                passed=passed,
+                data=data or {},
+                template=template,
+                expires_at=time.monotonic() + self.ttl
+            )
+            self._entries[token_mint] = entry
+        if entry.verdict is None:
+            entry.verdict = asyncio.get_running_loop().create_future()
+        if passed is not None and not entry.verdict.done():
+            entry.verdict.set_result(passed)
+        self.purge_expired()
+        while len(self._entries) > self.max_size:
+            evicted_mint, _ = self._entries.popitem(last=False)
+            self.evicted += 1
+            migrations_logger.warning(f"Correlation store full - evicted {evicted_mint}")
+        await self._redis_set(entry)
+        return entry
+
+    async def pop(self, token_mint: str) -> Optional[CorrelationEntry]:
+        """
+        Removes a token once its initialize2 has arrived and records the withdraw -> initialize2 gap.
+        If the filters are still running the verdict is awaited first. An entry still without a verdict after
+        verdict_timeout is returned (passed=None) but kept in the store.
+        """
+        entry = self.get(token_mint)
+        if entry is None:
+            return None
+        if entry.passed is None and entry.verdict is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(entry.verdict), timeout=self.verdict_timeout)
+            except asyncio.TimeoutError:
+                migrations_logger.warning(f"No filter verdict for {token_mint} within {self.verdict_timeout}s of its initialize2")
+                return entry
+            # The entry may have expired or been popped by a duplicate initialize2 while waiting
+            entry = self.get(token_mint)
+            if entry is None:
+                return None
+        del self._entries[token_mint]
+        await self._redis_delete(token_mint)
+        
+        gap = time.time() - entry.withdraw_at
+        self.gaps.append(gap)
+        migrations_logger.info(f"Withdraw -> initialize2 gap for {token_mint}: {gap:.2f}s | {self.gap_summary()}")
+        return entry
+
+    def purge_expired(self) -> None:
+        now = time.monotonic()
+        # Entries are in insertion order and share one TTL, so the expired ones are at the front
+        while self._entries:
+            token_mint, entry = next(iter(self._entries.items()))
+            if now < entry.expires_at:
+                break
+            self._expire(token_mint)
+
+    def gap_summary(self) -> str:
+        if not self.gaps:
+            return "no gaps recorded"
+        return (f"gaps: {len(self.gaps)} | median: {statistics.median(self.gaps):.2f}s | max: {max(self.gaps):.2f}s | "
+                f"pending: {len(self._entries)} | expired: {self.expired} | evicted: {self.evicted}")
+
+    async def restore(self) -> int:
+        """Reloads the pending entries persisted in redis. Returns the number restored."""
+        if self.redis_client is None:
+            return 0
+        entries = []
+        try:
+            async for key in self.redis_client.scan_iter(f"{self.prefix}:*"):
+                data = await self.redis_client.get(key)
+                ttl = await self.redis_client.ttl(key)
+                if not data or ttl is None or ttl <= 0:
+                    continue
+                stored = json.loads(data)
+                entries.append(CorrelationEntry(
+                    token_mint=stored['token_mint'],
+                    passed=stored['passed'],
+                    data=stored['data'],
+                    withdraw_at=stored['withdraw_at'],
+                    expires_at=time.monotonic() + ttl
+                ))
+        except Exception as e:
+            migrations_logger.error(f"Error restoring correlation store from redis: {e}")
+        # scan_iter order is arbitrary - insert by expiry so purge_expired and eviction see the oldest first
+        for entry in sorted(entries, key=lambda entry: entry.expires_at):
+            self._entries[entry.token_mint] = entry
+        restored = len(entries)
+        migrations_logger.info(f"Restored {restored} pending {self.prefix} entries from redis")
+        return restored
+
+    def _expire(self, token_mint: str) -> None:
+        self._entries.pop(token_mint, None)
+        self.expired += 1
+        migrations_logger.info(f"No initialize2 within {self.ttl}s for {token_mint} - dropped from {self.prefix}")
+
+    async def _redis_set(self, entry: CorrelationEntry) -> None:
+        if self.redis_client is None:
+            return
+        try:
+            data = json.dumps({'token_mint': entry.token_mint, 'passed': entry.passed, 'data': entry.data, 'withdraw_at': entry.withdraw_at}, default=str)
+            ttl = max(1, int(entry.expires_at - time.monotonic()))
+            await self.redis_client.set(f"{self.prefix}:{entry.token_mint}", data, ex=ttl)
+        except Exception as e:
+            migrations_logger.error(f"Error writing correlation entry to redis: {e}")
+
+    async def _redis_delete(self, token_mint: str) -> None:
+        if self.redis_client is None:
+            return
+        try:
+            await self.redis_client.delete(f"{self.prefix}:{token_mint}")
+        except Exception as e:
+            migrations_logger.error(f"Error deleting correlation entry from redis: {e}")
+
+def create_correlation_store(prefix: str) -> CorrelationStore:
+    return CorrelationStore(
+        prefix=prefix,
+        redis_client=redis.Redis(host='localhost', port=6379, db=CORRELATION_REDIS_DB) if CORRELATION_REDIS_DB is not None else None
+    )
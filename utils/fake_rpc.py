@@ -0,0 +1,374 @@
+import asyncio
+import base64
+import itertools
+import json
+import os
+import random
+import struct
+import time
+from collections import Counter, deque
+from dataclasses import dataclass
+from typing import Optional
+
+import base58
+import httpx
+import websockets
+from construct import Renamed
+from solders.pubkey import Pubkey  # type: ignore
+from solders.transaction import VersionedTransaction  # type: ignore
+
+from layouts.amm_v4 import LIQUIDITY_STATE_LAYOUT_V4, MARKET_STATE_LAYOUT_V3
+from raydium.constants import WSOL, TOKEN_PROGRAM_ID
+from utils.replay import read_events, rpc_method
+
+# Slot time of the fake cluster (seconds)
+SLOT_TIME = 0.4
+
+# Size and rent of an SPL token account
+TOKEN_ACCOUNT_SIZE = 165
+OPEN_BOOK_PROGRAM = Pubkey.from_string("srmqPvymJeFKQ4zGQed1GFppgkRHL9kaELCbyksJtPX")
+
+@dataclass
+class FakeRpcSettings:
+    latency: float = 0.02           # seconds added to every RPC call and websocket notification
+    jitter: float = 0.01            # extra uniform random latency (seconds)
+    rate_limit: int = 0             # max RPC calls per second - further calls get HTTP 429 (0 disables it)
+    drop_rate: float = 0.0          # share of sent transactions that are accepted but never land
+    confirm_delay: float = SLOT_TIME    # seconds from sendTransaction to the transaction landing
+
+@dataclass
+class _FakeAccount:
+    data: bytes
+    owner: str
+    lamports: int
+
+@dataclass
+class _SentTransaction:
+    transaction: VersionedTransaction
+    lands_at: Optional[float]       # time.monotonic() when it lands - None if it was dropped
+    slot: int
+
+def build_account(layout, values: dict) -> bytes:
+    """Builds a fixed size construct layout with every field zeroed except the ones given in values."""
+    data = bytearray(layout.sizeof())
+    offset = 0
+    for subcon in layout.subcons:
+        size = subcon.sizeof()
+        if isinstance(subcon, Renamed) and subcon.name in values:
+            data[offset:offset + size] = subcon.subcon.build(values[subcon.name])
+        offset += size
+    return bytes(data)
+
+def token_account_data(mint: Pubkey, owner: Pubkey, amount: int) -> bytes:
+    data = bytearray(TOKEN_ACCOUNT_SIZE)
+    data[0:32] = bytes(mint)
+    data[32:64] = bytes(owner)
+    struct.pack_into('<Q', data, 64, amount)
+    data[108] = 1   # initialized
+    return bytes(data)
+
+def random_pubkey() -> Pubkey:
+    return Pubkey.from_bytes(os.urandom(32))
+
+class FakeSolana:
+    """
+    In-memory Solana cluster state answering the JSON-RPC methods the bot uses.
+
+    Accounts are set directly (add_amm_v4_pool) or loaded from a utils.replay recording. Sent transactions land
+    after confirm_delay unless dropped, and then show up in getSignatureStatuses, getTransaction and the
+    signatureSubscribe notifications of FakeRpcServer.
+    """
+
+    def __init__(self, settings: Optional[FakeRpcSettings]=None):
+        self.settings = settings or FakeRpcSettings()
+        self.accounts: dict = {}            # pubkey -> _FakeAccount
+        self.transactions: dict = {}        # signature -> _SentTransaction
+        self.calls = Counter()              # rpc method -> calls
+        self.dropped = 0
+        self.blockhash = base58.b58encode(os.urandom(32)).decode()
+        self._started_at = time.monotonic()
+        self._account_listeners: list = []  # callbacks called with the pubkey of every updated account
+
+    @property
+    def slot(self) -> int:
+        return 300_000_000 + int((time.monotonic() - self._started_at) / SLOT_TIME)
+
+    def set_account(self, pubkey: str, data: bytes, owner: str=str(TOKEN_PROGRAM_ID), lamports: int=2_039_280) -> None:
+        self.accounts[pubkey] = _FakeAccount(data, owner, lamports)
+        for callback in self._account_listeners:
+            callback(pubkey)
+
+    def add_account_listener(self, callback) -> None:
+        self._account_listeners.append(callback)
+
+    def add_amm_v4_pool(self, token_reserve: int=800_000_000_000_000, sol_reserve: int=80_000_000_000, token_decimals: int=6) -> tuple:
+        """Creates an AMM v4 pool with its market and vaults. Returns (pair_address, token_mint)."""
+        pair, market, token_mint = random_pubkey(), random_pubkey(), random_pubkey()
+        token_vault, sol_vault = random_pubkey(), random_pubkey()
+        authority = random_pubkey()
+        nonce = next(nonce for nonce in range(256) if self._market_authority(market, nonce) is not None)
+
+        self.set_account(str(pair), build_account(LIQUIDITY_STATE_LAYOUT_V4, {
+            'coinDecimals': token_decimals, 'pcDecimals': 9,
+            'tradeFeeNumerator': 25, 'tradeFeeDenominator': 10_000, 'swapFeeNumerator': 25, 'swapFeeDenominator': 10_000,
+            'poolCoinTokenAccount': bytes(token_vault), 'poolPcTokenAccount': bytes(sol_vault),
+            'coinMintAddress': bytes(token_mint), 'pcMintAddress': bytes(WSOL),
+            'ammOpenOrders': bytes(random_pubkey()), 'serumMarket': bytes(market), 'ammTargetOrders': bytes(random_pubkey()),
+        }), owner="675kPX9MHTjS2zt1qfr1NYHuzeLXfQM9H24wFSUt1Mp8")
+        self.set_account(str(market), build_account(MARKET_STATE_LAYOUT_V3, {
+            'vault_signer_nonce': nonce, 'base_mint': bytes(token_mint), 'quote_mint': bytes(WSOL),
+            'base_vault': bytes(random_pubkey()), 'quote_vault': bytes(random_pubkey()),
+            'bids': bytes(random_pubkey()), 'asks': bytes(random_pubkey()), 'event_queue': bytes(random_pubkey()),
+        }), owner=str(OPEN_BOOK_PROGRAM))
+        self.set_account(str(token_vault), token_account_data(token_mint, authority, token_reserve))
+        self.set_account(str(sol_vault), token_account_data(WSOL, authority, sol_reserve))
+        return str(pair), str(token_mint)
+
+    @staticmethod
+    def _market_authority(market: Pubkey, nonce: int) -> Optional[Pubkey]:
+        try:
+            return Pubkey.create_program_address([bytes(market), struct.pack('<Q', nonce)], OPEN_BOOK_PROGRAM)
+        except Exception:
+            return None
+
+    def load_recording(self, path: str) -> int:
+        """Loads the accounts read with getAccountInfo/getMultipleAccounts in a utils.replay recording. Returns the count."""
+        loaded = 0
+        for event in read_events(path):
+            if event.kind != 'http' or event.request is None:
+                continue
+            _, key = event.request.split('|', 1)
+            method = rpc_method(key)
+            if method not in ('getAccountInfo', 'getMultipleAccounts'):
+                continue
+            params = json.loads(key.split(':', 2)[2])
+            if len(params) > 1 and (params[1] or {}).get('dataSlice'):
+                continue
+            try:
+                value = json.loads(event.payload)['result']['value']
+            except (ValueError, KeyError, TypeError):
+                continue
+            pubkeys, values = (params[0], value) if method == 'getMultipleAccounts' else ([params[0]], [value])
+            for pubkey, account in zip(pubkeys, values):
+                if account and isinstance(account.get('data'), list) and account['data'][1] == 'base64':
+                    self.set_account(pubkey, base64.b64decode(account['data'][0]), account['owner'], account['lamports'])
+                    loaded += 1
+        return loaded
+
+    def landed(self, signature: str) -> Optional[_SentTransaction]:
+        sent = self.transactions.get(signature)
+        if sent is None or sent.lands_at is None or time.monotonic() < sent.lands_at:
+            return None
+        return sent
+
+    def handle(self, method: str, params: list):
+        """Returns the JSON-RPC result for a call. Raises LookupError for unsupported methods."""
+        self.calls[method] += 1
+        handler = getattr(self, f"_rpc_{method}", None)
+        if handler is None:
+            raise LookupError(method)
+        return handler(*params)
+
+    def _context(self, value) -> dict:
+        return {"context": {"slot": self.slot, "apiVersion": "2.0.0"}, "value": value}
+
+    def _account_json(self, pubkey: str, options: dict):
+        account = self.accounts.get(pubkey)
+        if account is None:
+            return None
+        data = account.data
+        data_slice = (options or {}).get('dataSlice')
+        if data_slice:
+            data = data[data_slice['offset']:data_slice['offset'] + data_slice['length']]
+        return {"data": [base64.b64encode(data).decode(), "base64"], "executable": False, "lamports": account.lamports,
+                "owner": account.owner, "rentEpoch": 0, "space": len(account.data)}
+
+    def _rpc_getAccountInfo(self, pubkey: str, options: dict=None):
+        return self._context(self._account_json(pubkey, options))
+
+    def _rpc_getMultipleAccounts(self, pubkeys: list, options: dict=None):
+        return self._context([self._account_json(pubkey, options) for pubkey in pubkeys])
+
+    def _rpc_getLatestBlockhash(self, options: dict=None):
+        return self._context({"blockhash": self.blockhash, "lastValidBlockHeight": self.slot + 150})
+
+    def _rpc_getSlot(self, options: dict=None):
+        return self.slot
+
+    def _rpc_getMinimumBalanceForRentExemption(self, size: int, options: dict=None):
+        return (size + 128) * 6960
+
+    def _rpc_getBalance(self, pubkey: str, options: dict=None):
+        return self._context(10 * 10**9)
+
+    def _rpc_getTokenAccountsByOwner(self, owner: str, filter: dict, options: dict=None):
+        return self._context([])
+
+    def _rpc_simulateTransaction(self, transaction: str, options: dict=None):
+        return self._context({"err": None, "logs": [], "accounts": None, "unitsConsumed": 0, "returnData": None})
+
+    def _rpc_sendTransaction(self, transaction: str, options: dict=None):
+        txn = VersionedTransaction.from_bytes(base64.b64decode(transaction))
+        signature = str(txn.signatures[0])
+        if signature not in self.transactions:
+            dropped = random.random() < self.settings.drop_rate
+            self.dropped += dropped
+            lands_at = None if dropped else time.monotonic() + self.settings.confirm_delay
+            self.transactions[signature] = _SentTransaction(txn, lands_at, self.slot + max(1, round(self.settings.confirm_delay / SLOT_TIME)))
+        return signature
+
+    def _rpc_getSignatureStatuses(self, signatures: list, options: dict=None):
+        statuses = []
+        for signature in signatures:
+            sent = self.landed(signature)
+            statuses.append(None if sent is None else {"slot": sent.slot, "confirmations": None, "err": None,
+                                                       "status": {"Ok": None}, "confirmationStatus": "confirmed"})
+        return self._context(statuses)
+
+    def _rpc_getTransaction(self, signature: str, options: dict=None):
+        sent = self.landed(signature)
+        if sent is None:
+            return None
+        message = sent.transaction.message
+        account_keys = [str(key) for key in message.account_keys]
+        return {
+            "slot": sent.slot,
+            "blockTime": int(time.time()),
+            "version": 0,
+            "transaction": {
+                "signatures": [str(sig) for sig in sent.transaction.signatures],
+                "message": {
+                    "accountKeys": account_keys,
+                    "header": {
+                        "numRequiredSignatures": message.header.num_required_signatures,
+                        "numReadonlySignedAccounts": message.header.num_readonly_signed_accounts,
+                        "numReadonlyUnsignedAccounts": message.header.num_readonly_unsigned_accounts
+                    },
+                    "recentBlockhash": str(message.recent_blockhash),
+                    "instructions": [
+                        {"programIdIndex": ix.program_id_index, "accounts": list(ix.accounts), "data": base58.b58encode(bytes(ix.data)).decode(), "stackHeight": None}
+                        for ix in message.instructions
+                    ],
+                    "addressTableLookups": []
+                }
+            },
+            "meta": {
+                "err": None, "status": {"Ok": None}, "fee": 5000,
+                "preBalances": [0] * len(account_keys), "postBalances": [0] * len(account_keys),
+                "innerInstructions": [], "logMessages": [], "preTokenBalances": [], "postTokenBalances": [], "rewards": [],
+                "loadedAddresses": {"writable": [], "readonly": []}, "computeUnitsConsumed": 0
+            }
+        }
+
+class FakeRpcTransport(httpx.AsyncBaseTransport):
+    """
+    httpx transport answering JSON-RPC from a FakeSolana in-process - plug it in with utils.replay.use_transport.
+    Every call waits latency + jitter, and calls beyond rate_limit per second get HTTP 429 like a real provider.
+    """
+
+    def __init__(self, fake: FakeSolana):
+        self.fake = fake
+        self.settings = fake.settings
+        self.rate_limited = 0
+        self._recent_calls: deque = deque()     # time.monotonic() of the calls in the last second
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        body = json.loads(await request.aread())
+        await asyncio.sleep(self.settings.latency + random.uniform(0, self.settings.jitter))
+
+        if self.settings.rate_limit:
+            now = time.monotonic()
+            while self._recent_calls and now - self._recent_calls[0] >= 1:
+                self._recent_calls.popleft()
+            if len(self._recent_calls) >= self.settings.rate_limit:
+                self.rate_limited += 1
+                return httpx.Response(429, content=b'Too Many Requests', request=request)
+            self._recent_calls.append(now)
+
+        result = [self._call(item) for item in body] if isinstance(body, list) else self._call(body)
+        return httpx.Response(200, json=result, request=request)
+
+    def _call(self, payload: dict) -> dict:
+        try:
+            result = self.fake.handle(payload['method'], payload.get('params') or [])
+        except LookupError:
+            return {"jsonrpc": "2.0", "error": {"code": -32601, "message": "Method not found"}, "id": payload.get('id')}
+        except Exception as e:
+            return {"jsonrpc": "2.0", "error": {"code": -32602, "message": str(e)}, "id": payload.get('id')}
+        return {"jsonrpc": "2.0", "result": result, "id": payload.get('id')}
+
+class FakeRpcServer:
+    """
+    Local websocket server for a FakeSolana: signatureSubscribe notifies when a transaction lands, accountSubscribe
+    on every set_account, and logsSubscribe/blockSubscribe connections receive the frames passed to broadcast.
+    """
+
+    def __init__(self, fake: FakeSolana):
+        self.fake = fake
+        self.settings = fake.settings
+        self._subscription_ids = itertools.count(1)
+        self._account_subscribers: dict = {}    # pubkey -> [(websocket, subscription id)]
+        self._stream_subscribers: list = []     # [(websocket, subscription id)] of log/block subscriptions
+        self._server = None
+        fake.add_account_listener(self._account_updated)
+
+    async def start(self, host: str='127.0.0.1', port: int=8901) -> None:
+        self._server = await websockets.serve(self._handler, host, port)
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def broadcast(self, frame: str) -> None:
+        """Sends a raw frame to every logs/block subscription (e.g. a recorded migration notification)."""
+        for websocket, _ in list(self._stream_subscribers):
+            await self._send(websocket, frame)
+
+    async def _send(self, websocket, message: str, delayed: bool=True) -> None:
+        if delayed:
+            await asyncio.sleep(self.settings.latency + random.uniform(0, self.settings.jitter))
+        try:
+            await websocket.send(message)
+        except websockets.ConnectionClosed:
+            pass
+
+    async def _handler(self, websocket, *_):
+        try:
+            async for message in websocket:
+                request = json.loads(message)
+                method, params = request.get('method', ''), request.get('params') or []
+                if method.endswith('Unsubscribe'):
+                    await self._send(websocket, json.dumps({"jsonrpc": "2.0", "result": True, "id": request.get('id')}), delayed=False)
+                    continue
+
+                subscription_id = next(self._subscription_ids)
+                await self._send(websocket, json.dumps({"jsonrpc": "2.0", "result": subscription_id, "id": request.get('id')}), delayed=False)
+                if method == 'signatureSubscribe':
+                    asyncio.create_task(self._notify_signature(websocket, subscription_id, params[0]))
+                elif method == 'accountSubscribe':
+                    self._account_subscribers.setdefault(params[0], []).append((websocket, subscription_id))
+                elif method in ('logsSubscribe', 'blockSubscribe'):
+                    self._stream_subscribers.append((websocket, subscription_id))
+        finally:
+            self._stream_subscribers = [entry for entry in self._stream_subscribers if entry[0] is not websocket]
+            for pubkey, subscribers in self._account_subscribers.items():
+                subscribers[:] = [entry for entry in subscribers if entry[0] is not websocket]
+
+    async def _notify_signature(self, websocket, subscription_id: int, signature: str) -> None:
+        sent = self.fake.transactions.get(signature)
+        if sent is None or sent.lands_at is None:
+            return      # unknown or dropped - the poller will time it out
+        await asyncio.sleep(max(0, sent.lands_at - time.monotonic()))
+        await self._send(websocket, json.dumps({
+            "jsonrpc": "2.0", "method": "signatureNotification",
+            "params": {"result": {"context": {"slot": sent.slot}, "value": {"err": None}}, "subscription": subscription_id}
+        }))
+
+    def _account_updated(self, pubkey: str) -> None:
+        for websocket, subscription_id in self._account_subscribers.get(pubkey, []):
+            account = self.fake._account_json(pubkey, None)
+            asyncio.create_task(self._send(websocket, json.dumps({
+                "jsonrpc": "2.0", "method": "accountNotification",
+                "params": {"result": self.fake._context(account), "subscription": subscription_id}
+            })))
@@ -0,0 +1,169 @@
+import asyncio
+import json
+import statistics
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Optional
+
+import websockets
+
+from config import (migrations_logger, MIGRATION_ADDRESS, LISTENER_WS_URLS, LISTENER_SUBSCRIPTION, LISTENER_DEDUPE_SIZE, LISTENER_RECV_TIMEOUT, 
+                    RELAY_DELAY)
+from utils.replay import record_frame
+from utils.ws_messages import MIGRATION_MARKERS, TransactionEvent, decode_transactions
+
+# Max number of arrival lags kept per endpoint for the stats summary
+MAX_LAG_SAMPLES = 1000
+
+@dataclass
+class EndpointStats:
+    url: str
+    connected: bool = False
+    notifications: int = 0          # transactions received (duplicates included)
+    first: int = 0                  # notifications this endpoint delivered before every other endpoint
+    beaten: int = 0                 # notifications another endpoint delivered first
+    reconnects: int = 0
+    lags: deque = field(default_factory=lambda: deque(maxlen=MAX_LAG_SAMPLES))    # seconds behind the first arrival, for signatures another endpoint won
+
+    def summary(self) -> str:
+        total = self.first + self.beaten
+        win_rate = self.first / total if total else 0.0
+        median_lag = f"{statistics.median(self.lags) * 1000:.1f}ms" if self.lags else "n/a"
+        return (f"{self.url} | connected: {self.connected} | notifications: {self.notifications} | first: {self.first} "
+                f"({win_rate:.0%}) | median lag when beaten: {median_lag} | reconnects: {self.reconnects}")
+
+class LogListener:
+    """
+    Runs the same subscription on several websocket endpoints at once and emits each transaction once.
+
+    Frames are pre-filtered on the raw text for the markers and only then decoded with the typed schemas in
+    utils.ws_messages. The callback gets a TransactionEvent for each transaction whose logs contain a marker. With
+    blockSubscribe the event also carries the full transaction with its meta (the getTransaction shape), so the caller
+    does not need to fetch it.
+
+    An endpoint that answers blockSubscribe with an error (the provider has not enabled it) falls back to logsSubscribe
+    - the caller then fetches the transactions with getTransaction.
+
+    Every endpoint has its own connection and reconnect loop, so one provider dropping does not open a gap while the
+    others are still up. Notifications are deduplicated by signature: the first arrival is handed to the callback and
+    later copies only update the per-endpoint stats (how often an endpoint was first and how far behind it was otherwise).
+    """
+
+    def __init__(
+        self,
+        on_notification: Callable[[TransactionEvent], Awaitable[None]],
+        ws_urls: list=LISTENER_WS_URLS,
+        mentions: str=MIGRATION_ADDRESS,
+        commitment: str='confirmed',
+        subscription: str=LISTENER_SUBSCRIPTION,
+        dedupe_size: int=LISTENER_DEDUPE_SIZE,
+        markers: tuple=MIGRATION_MARKERS
+    ):
+        self.on_notification = on_notification     # called with the first arrival of each TransactionEvent
+        self.ws_urls = ws_urls
+        self.mentions = mentions
+        self.commitment = commitment
+        self.subscription = subscription            # 'logsSubscribe' or 'blockSubscribe'
+        self.subscriptions = {url: subscription for url in ws_urls}     # per endpoint, after any fallback
+        self.dedupe_size = dedupe_size
+        self.markers = markers
+        self.stats = {url: EndpointStats(url=url) for url in ws_urls}
+        self._seen: OrderedDict = OrderedDict()    # signature -> time.monotonic() of the first arrival
+        self._tasks: list = []
+
+    @property
+    def connected(self) -> bool:
+        return any(stats.connected for stats in self.stats.values())
+
+    def start(self) -> None:
+        if not self.ws_urls:
+            raise ValueError("Log listener has no websocket endpoints - set WS_URL or QN_WS_URL (LISTENER_WS_URLS is empty)")
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._run(url)) for url in self.ws_urls]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    async def run_forever(self) -> None:
+        self.start()
+        await asyncio.gather(*self._tasks)
+
+    def stats_summary(self) -> str:
+        return "\n".join(stats.summary() for stats in self.stats.values())
+
+    async def _run(self, url: str) -> None:
+        stats = self.stats[url]
+        while True:
+            try:
+                async with websockets.connect(url, ping_interval=60, ping_timeout=20) as websocket:
+                    await self._subscribe(websocket, url)
+                    stats.connected = True
+
+                    while True:
+                        message = await asyncio.wait_for(websocket.recv(), timeout=LISTENER_RECV_TIMEOUT)
+                        received_at = time.monotonic()
+                        record_frame(url, message)
+                        for event in decode_transactions(message, self.markers, received_at):
+                            await self._emit(stats, event)
+            except asyncio.CancelledError:
+                stats.connected = False
+                raise
+            except Exception as e:
+                migrations_logger.error(f"Log listener error on {url}: {e} - reconnecting in {RELAY_DELAY} seconds")
+            stats.connected = False
+            stats.reconnects += 1
+            await asyncio.sleep(RELAY_DELAY)
+
+    async def _subscribe(self, websocket, url: str) -> None:
+        """Sends the endpoint's subscription. Raises ConnectionError if it is refused (after the logsSubscribe fallback)."""
+        while True:
+            subscription = self.subscriptions[url]
+            await websocket.send(json.dumps(self._subscription_request(subscription)))
+            response = await websocket.recv()
+            error = json.loads(response).get('error')
+            if error is None:
+                migrations_logger.info(f"Log listener subscribed on {url} ({subscription}): {response}")
+                return
+            if subscription != 'blockSubscribe':
+                raise ConnectionError(f"{subscription} refused: {error}")
+            migrations_logger.warning(f"blockSubscribe refused on {url}: {error} - falling back to logsSubscribe")
+            self.subscriptions[url] = 'logsSubscribe'
+
+    def _subscription_request(self, subscription: str) -> dict:
+        if subscription == 'blockSubscribe':
+            params = [
+                {"mentionsAccountOrProgram": self.mentions},
+                {
+                    "commitment": self.commitment,
+                    "encoding": "json",
+                    "transactionDetails": "full",
+                    "showRewards": False,
+                    "maxSupportedTransactionVersion": 0
+                }
+            ]
+        else:
+            params = [{"mentions": [self.mentions]}, {"commitment": self.commitment}]
+        return {"jsonrpc": "2.0", "id": 1, "method": subscription, "params": params}
+
+    async def _emit(self, stats: EndpointStats, event: TransactionEvent) -> None:
+        stats.notifications += 1
+        now = time.monotonic()
+        signature = event.signature
+        first_seen = self._seen.get(signature)
+        if first_seen is not None:
+            stats.beaten += 1
+            stats.lags.append(now - first_seen)
+            return
+
+        stats.first += 1
+        self._seen[signature] = now
+        while len(self._seen) > self.dedupe_size:
+            self._seen.popitem(last=False)
+
+        try:
+            await self.on_notification(event)
+        except Exception as e:
+            migrations_logger.error(f"Log listener callback error for {signature}: {e}")
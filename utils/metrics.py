@@ -0,0 +1,227 @@
+import asyncio
+import bisect
+import time
+from typing import Callable, Optional
+
+import httpx
+import msgspec
+
+from config import migrations_logger, METRICS_HOST, METRICS_PORT
+
+# Default histogram buckets (seconds) - RPC round trips up to confirmations
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Priority fee buckets (compute unit price in micro-lamports)
+FEE_BUCKETS = (10_000, 30_000, 100_000, 250_000, 500_000, 750_000, 1_000_000, 2_000_000, 5_000_000)
+
+def _escape(value) -> str:
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+def _format_labels(label_names: tuple, values: tuple, extra: str='') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(label_names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class Metric:
+    """Base of the metric types - samples are keyed on the tuple of label values, in label_names order."""
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, label_names: tuple=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values: dict = {}
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, '')) for name in self.label_names)
+
+    def samples(self) -> list:
+        """[(sample name, label string, value)]"""
+        return [(self.name, _format_labels(self.label_names, key), value) for key, value in self._values.items()]
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines += [f"{name}{labels} {_format_value(value)}" for name, labels, value in self.samples()]
+        return "\n".join(lines)
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float=1, **labels) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, label_names: tuple=()):
+        super().__init__(name, documentation, label_names)
+        self._function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float, **labels) -> None:
+        self._values[self._key(labels)] = value
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        """Reads the (unlabelled) value from function at scrape time instead of storing it."""
+        self._function = function
+
+    def samples(self) -> list:
+        if self._function is not None:
+            try:
+                return [(self.name, '', self._function())]
+            except Exception:
+                return []
+        return super().samples()
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, label_names: tuple=(), buckets: tuple=LATENCY_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        series = self._values.get(key)
+        if series is None:
+            # [per-bucket counts (the last one is +Inf), sum]
+            series = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def samples(self) -> list:
+        samples = []
+        for key, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                samples.append((f"{self.name}_bucket", _format_labels(self.label_names, key, f'le="{_format_value(bound)}"'), cumulative))
+            labels = _format_labels(self.label_names, key)
+            samples.append((f"{self.name}_sum", labels, total))
+            samples.append((f"{self.name}_count", labels, cumulative))
+        return samples
+
+class Registry:
+    def __init__(self):
+        self.metrics: list = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self.metrics) + "\n"
+
+registry = Registry()
+
+# Listeners and filters
+migrations_seen = registry.register(Counter('bot_migrations_seen_total', 'Migration transactions dispatched by the listeners', ('event',)))
+filter_results = registry.register(Counter('bot_filter_results_total', 'Risk filter verdicts (passed / failed / no_data)', ('result',)))
+
+# RPC and external HTTP calls (method is the JSON-RPC method, or the HTTP verb for plain HTTP APIs)
+requests_total = registry.register(Counter('bot_requests_total', 'HTTP/RPC requests by provider and method', ('provider', 'method', 'status')))
+request_seconds = registry.register(Histogram('bot_request_seconds', 'HTTP/RPC request latency', ('provider', 'method')))
+rate_limited = registry.register(Counter('bot_rate_limited_total', 'HTTP 429 responses by provider', ('provider', 'method')))
+
+# Trading
+trade_attempts = registry.register(Counter('bot_trade_attempts_total', 'buy/sell attempts by fee level group', ('side', 'fee_level')))
+slippage_retries = registry.register(Counter('bot_slippage_retries_total', 'Attempts retried with a higher slippage', ('side',)))
+trades = registry.register(Counter('bot_trades_total', 'Finished buy/sell executions by the fee level group that filled', ('side', 'outcome', 'fee_level')))
+priority_fee_used = registry.register(Histogram('bot_priority_fee_microlamports', 'Compute unit price of the transaction variants that filled', buckets=FEE_BUCKETS))
+confirmation_seconds = registry.register(Histogram('bot_confirmation_seconds', 'Time from waiting on a signature to its status', ('outcome',)))
+open_positions = registry.register(Gauge('bot_open_positions', 'Positions held by the position manager'))
+
+# Event loop
+event_loop_lag = registry.register(Histogram('bot_event_loop_lag_seconds', 'Lateness of the loop lag monitor wake-ups', buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)))
+
+class _RpcCall(msgspec.Struct):
+    method: str = ''
+
+_rpc_call_decoder = msgspec.json.Decoder(_RpcCall)
+
+def request_method(request: httpx.Request) -> str:
+    """The JSON-RPC method of a request ('batch' for batch calls), or the HTTP verb if it is not JSON-RPC."""
+    try:
+        body = request.content
+    except httpx.RequestNotRead:
+        return request.method
+    if not body:
+        return request.method
+    if body[:1] == b'[':
+        return 'batch'
+    try:
+        return _rpc_call_decoder.decode(body).method or request.method
+    except msgspec.DecodeError:
+        return request.method
+
+class MetricsTransport(httpx.AsyncBaseTransport):
+    """httpx transport that counts and times every request by provider (host) and RPC method."""
+
+    def __init__(self, transport: Optional[httpx.AsyncBaseTransport]=None):
+        self._transport = transport or httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        provider, method = request.url.host, request_method(request)
+        started_at = time.perf_counter()
+        try:
+            response = await self._transport.handle_async_request(request)
+        except Exception:
+            requests_total.inc(provider=provider, method=method, status='error')
+            raise
+        finally:
+            request_seconds.observe(time.perf_counter() - started_at, provider=provider, method=method)
+        requests_total.inc(provider=provider, method=method, status=response.status_code)
+        if response.status_code == 429:
+            rate_limited.inc(provider=provider, method=method)
+        return response
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+class MetricsServer:
+    """Minimal asyncio HTTP server answering every GET with the registry in the Prometheus text format."""
+
+    def __init__(self, registry: Registry=registry, host: str=METRICS_HOST, port: Optional[int]=METRICS_PORT):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self) -> None:
+        if self.port is None or self._server is not None:
+            return
+        try:
+            self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        except OSError as e:
+            # e.g. the port is taken by another bot process - keep trading without the endpoint
+            migrations_logger.error(f"Metrics endpoint disabled - could not listen on {self.host}:{self.port}: {e}")
+            return
+        migrations_logger.info(f"Metrics served on http://{self.host}:{self.port}/metrics")
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            # Read (and ignore) the request line and headers
+            while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                pass
+            body = self.registry.render().encode()
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                         b"Content-Length: " + str(len(body)).encode() + b"\r\nConnection: close\r\n\r\n" + body)
+            await writer.drain()
+        except Exception as e:
+            migrations_logger.warning(f"Metrics request error: {e}")
+        finally:
+            writer.close()
+
+metrics_server = MetricsServer()
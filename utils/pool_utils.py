@@ -1,17 +1,21 @@
+import asyncio
+import json
 import struct
-from dataclasses import dataclass
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, fields
 from enum import Enum
 from typing import Optional
 
+import redis.asyncio as redis
+
 from solana.rpc.commitment import Processed
 from solana.rpc.types import MemcmpOpts
 from solders.instruction import AccountMeta, Instruction  # type: ignore
 from solders.pubkey import Pubkey  # type: ignore
 
-from config import client, qn_client, trade_logger
-from layouts.amm_v4 import LIQUIDITY_STATE_LAYOUT_V4, MARKET_STATE_LAYOUT_V3
-from layouts.clmm import CLMM_POOL_STATE_LAYOUT
-from layouts.cpmm import CPMM_POOL_STATE_LAYOUT
+from config import client, qn_client, trade_logger, POOL_KEYS_CACHE_TTL, POOL_KEYS_CACHE_MAX_SIZE, POOL_KEYS_REDIS_DB
+from layouts.fast import LIQUIDITY_STATE_V4, MARKET_STATE_V3, CLMM_POOL_STATE, CPMM_POOL_STATE
 from raydium.constants import (
     WSOL,  
     TOKEN_PROGRAM_ID,
@@ -20,6 +24,7 @@ from raydium.constants import (
     RAYDIUM_CLMM,
     DEFAULT_QUOTE_MINT,
 )
+from utils.account_reader import TOKEN_AMOUNT_SLICE, decode_spl_token_amount, get_account_data, get_token_amounts
 
 @dataclass
 class AmmV4PoolKeys:
@@ -42,6 +47,10 @@ class AmmV4PoolKeys:
     ray_authority_v4: Pubkey
     open_book_program: Pubkey
     token_program_id: Pubkey
+    trade_fee_numerator: int = 25
+    trade_fee_denominator: int = 10_000
+    swap_fee_numerator: int = 25
+    swap_fee_denominator: int = 10_000
 
 @dataclass
 class CpmmPoolKeys:
@@ -120,15 +129,13 @@ async def fetch_amm_v4_pool_keys(pair_address: str) -> Optional[AmmV4PoolKeys]:
    
     try:
         amm_id = Pubkey.from_string(pair_address)
-        amm_data = await qn_client.get_account_info_json_parsed(amm_id, commitment=Processed)
-        amm_data = amm_data.value.data
+        amm_data = await get_account_data(qn_client, amm_id)
         
-        amm_data_decoded = LIQUIDITY_STATE_LAYOUT_V4.parse(amm_data)
+        amm_data_decoded = LIQUIDITY_STATE_V4.parse(amm_data)
         marketId = Pubkey.from_bytes(amm_data_decoded.serumMarket)
-        marketInfo = await qn_client.get_account_info_json_parsed(marketId, commitment=Processed)
-        marketInfo = marketInfo.value.data
+        marketInfo = await get_account_data(qn_client, marketId)
         
-        market_decoded = MARKET_STATE_LAYOUT_V3.parse(marketInfo)
+        market_decoded = MARKET_STATE_V3.parse(marketInfo)
         vault_signer_nonce = market_decoded.vault_signer_nonce
         
         ray_authority_v4=Pubkey.from_string("5Q544fKrFoe6tsEbD7S8EmxGTJYAKtTVhAW5Q5pge4j1")
@@ -154,7 +161,11 @@ async def fetch_amm_v4_pool_keys(pair_address: str) -> Optional[AmmV4PoolKeys]:
             event_queue=Pubkey.from_bytes(market_decoded.event_queue),
             ray_authority_v4=ray_authority_v4,
             open_book_program=open_book_program,
-            token_program_id=token_program_id
+            token_program_id=token_program_id,
+            trade_fee_numerator=amm_data_decoded.tradeFeeNumerator,
+            trade_fee_denominator=amm_data_decoded.tradeFeeDenominator,
+            swap_fee_numerator=amm_data_decoded.swapFeeNumerator,
+            swap_fee_denominator=amm_data_decoded.swapFeeDenominator
         )
 
         return pool_keys
@@ -162,12 +173,109 @@ async def fetch_amm_v4_pool_keys(pair_address: str) -> Optional[AmmV4PoolKeys]:
         trade_logger.error(f"Error fetching pool keys: {e}")
         return None
 
+class PoolKeysCache:
+    """
+    Process-wide cache of AmmV4PoolKeys keyed by pair address.
+
+    Pool keys are immutable once a pool exists, so they only need to be fetched and decoded once per pair.
+    The first tier is an in-memory LRU with a TTL. The optional second tier is redis, so keys survive restarts
+    and can be shared between processes. Concurrent lookups for the same pair share a single fetch.
+    """
+
+    def __init__(self, ttl: float=POOL_KEYS_CACHE_TTL, max_size: int=POOL_KEYS_CACHE_MAX_SIZE, redis_client: Optional[redis.Redis]=None):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.redis_client = redis_client
+        self._entries: OrderedDict = OrderedDict()     # pair_address -> (expires_at, pool_keys)
+        self._in_flight: dict = {}                     # pair_address -> asyncio.Task fetching the keys
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, pair_address: str) -> Optional[AmmV4PoolKeys]:
+        entry = self._entries.get(pair_address)
+        if entry is None:
+            return None
+        expires_at, pool_keys = entry
+        if time.monotonic() >= expires_at:
+            del self._entries[pair_address]
+            return None
+        self._entries.move_to_end(pair_address)
+        return pool_keys
+
+    def put(self, pair_address: str, pool_keys: AmmV4PoolKeys) -> None:
+        self._entries[pair_address] = (time.monotonic() + self.ttl, pool_keys)
+        self._entries.move_to_end(pair_address)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, pair_address: str) -> None:
+        self._entries.pop(pair_address, None)
+
+    async def get_or_fetch(self, pair_address: str) -> Optional[AmmV4PoolKeys]:
+        pool_keys = self.get(pair_address)
+        if pool_keys is not None:
+            self.hits += 1
+            return pool_keys
+        
+        # Share the fetch with any other task already looking up this pair
+        task = self._in_flight.get(pair_address)
+        if task is None:
+            self.misses += 1
+            task = asyncio.create_task(self._load(pair_address))
+            self._in_flight[pair_address] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(pair_address, None))
+        return await asyncio.shield(task)
+
+    async def _load(self, pair_address: str) -> Optional[AmmV4PoolKeys]:
+        pool_keys = await self._redis_get(pair_address)
+        if pool_keys is None:
+            pool_keys = await fetch_amm_v4_pool_keys(pair_address)
+            if pool_keys is None:
+                return None
+            await self._redis_set(pair_address, pool_keys)
+        self.put(pair_address, pool_keys)
+        return pool_keys
+
+    async def _redis_get(self, pair_address: str) -> Optional[AmmV4PoolKeys]:
+        if self.redis_client is None:
+            return None
+        try:
+            data = await self.redis_client.get(f"pool_keys:{pair_address}")
+            return amm_v4_pool_keys_from_dict(json.loads(data)) if data else None
+        except Exception as e:
+            trade_logger.error(f"Error reading pool keys from redis: {e}")
+            return None
+
+    async def _redis_set(self, pair_address: str, pool_keys: AmmV4PoolKeys) -> None:
+        if self.redis_client is None:
+            return
+        try:
+            data = json.dumps(amm_v4_pool_keys_to_dict(pool_keys))
+            await self.redis_client.set(f"pool_keys:{pair_address}", data, ex=int(self.ttl))
+        except Exception as e:
+            trade_logger.error(f"Error writing pool keys to redis: {e}")
+
+def amm_v4_pool_keys_to_dict(pool_keys: AmmV4PoolKeys) -> dict:
+    return {f.name: (str(getattr(pool_keys, f.name)) if f.type is Pubkey else getattr(pool_keys, f.name)) for f in fields(AmmV4PoolKeys)}
+
+def amm_v4_pool_keys_from_dict(data: dict) -> AmmV4PoolKeys:
+    # Fields missing from older cache entries fall back to the dataclass defaults
+    return AmmV4PoolKeys(**{f.name: (Pubkey.from_string(data[f.name]) if f.type is Pubkey else data[f.name]) for f in fields(AmmV4PoolKeys) if f.name in data})
+
+pool_keys_cache = PoolKeysCache(
+    redis_client=redis.Redis(host='localhost', port=6379, db=POOL_KEYS_REDIS_DB) if POOL_KEYS_REDIS_DB is not None else None
+)
+
+async def get_amm_v4_pool_keys(pair_address: str) -> Optional[AmmV4PoolKeys]:
+    """Cached version of fetch_amm_v4_pool_keys - use this on the trade hot path."""
+    return await pool_keys_cache.get_or_fetch(pair_address)
+
 def fetch_cpmm_pool_keys(pair_address: str) -> Optional[CpmmPoolKeys]:
     try:
         pool_state = Pubkey.from_string(pair_address)
         raydium_vault_auth_2 = Pubkey.from_string("GpMZbSM2GgvTKHJirzeGfMFoaZ8UR2X7F4v8vHTvxFbL")
-        pool_state_data = client.get_account_info_json_parsed(pool_state, commitment=Processed).value.data
-        parsed_data = CPMM_POOL_STATE_LAYOUT.parse(pool_state_data)
+        pool_state_data = client.get_account_info(pool_state, commitment=Processed, encoding="base64").value.data
+        parsed_data = CPMM_POOL_STATE.parse(pool_state_data)
 
         pool_keys = CpmmPoolKeys(
             pool_state=pool_state,
@@ -221,8 +329,8 @@ def fetch_clmm_pool_keys(pair_address: str, zero_for_one: bool = True) -> Option
 
     try:
         pool_state = Pubkey.from_string(pair_address)
-        pool_state_data = client.get_account_info_json_parsed(pool_state, commitment=Processed).value.data
-        parsed_data = CLMM_POOL_STATE_LAYOUT.parse(pool_state_data)
+        pool_state_data = client.get_account_info(pool_state, commitment=Processed, encoding="base64").value.data
+        parsed_data = CLMM_POOL_STATE.parse(pool_state_data)
 
         tick_spacing = int(parsed_data.tick_spacing)
         tick_current = int(parsed_data.tick_current)
@@ -427,49 +535,39 @@ def make_clmm_swap_instruction(
         trade_logger.error(f"Error occurred: {e}")
         return None
 
-async def get_amm_v4_reserves(pool_keys: AmmV4PoolKeys) -> tuple:
+async def get_amm_v4_raw_reserves(pool_keys: AmmV4PoolKeys) -> tuple:
+    """
+    Reads the raw u64 vault amounts of a pool.
+
+    Returns:
+        (token_reserve, sol_reserve, token_decimal) - reserves in the smallest unit (lamports for SOL), oriented
+        by mint rather than by the pool's base/quote order. (None, None, None) on error.
+    """
     try:
-        quote_vault = pool_keys.quote_vault
-        quote_decimal = pool_keys.quote_decimals
-        quote_mint = pool_keys.quote_mint
-        
-        base_vault = pool_keys.base_vault
-        base_decimal = pool_keys.base_decimals
-        base_mint = pool_keys.base_mint
-    
-        balances_response = await qn_client.get_multiple_accounts_json_parsed(
-            [quote_vault, base_vault], 
-            Processed
-        )
-        balances = balances_response.value
-        
-        quote_account = balances[0]
-        base_account = balances[1]
-        
-        quote_account_balance = quote_account.data.parsed['info']['tokenAmount']['uiAmount']
-        base_account_balance = base_account.data.parsed['info']['tokenAmount']['uiAmount']
-        
-        if quote_account_balance is None or base_account_balance is None:
-            trade_logger.error("Error: One of the account balances is None.")
+        _, (base_amount, quote_amount) = await get_token_amounts(qn_client, [pool_keys.base_vault, pool_keys.quote_vault])
+        if base_amount is None or quote_amount is None:
+            trade_logger.error("Error: One of the vault accounts was not found.")
             return None, None, None
         
-        if base_mint == WSOL:                         
-            base_reserve = quote_account_balance  
-            quote_reserve = base_account_balance  
-            token_decimal = quote_decimal 
-        else:
-            base_reserve = base_account_balance  
-            quote_reserve = quote_account_balance
-            token_decimal = base_decimal
-
-        # trade_logger.info(f"Base Mint: {base_mint} | Quote Mint: {quote_mint}")
-        price = round(quote_reserve/base_reserve,9)
-        trade_logger.info(f"Base Reserve: {base_reserve} | Quote Reserve: {quote_reserve} | Token Decimal: {token_decimal} | price: {price}")
-        return base_reserve, quote_reserve, token_decimal
+        if pool_keys.base_mint == WSOL:
+            return quote_amount, base_amount, pool_keys.quote_decimals
+        return base_amount, quote_amount, pool_keys.base_decimals
 
     except Exception as e:
-        trade_logger.error(f"Error occurred: {e}")
+        trade_logger.error(f"Error reading pool reserves: {e}")
+        return None, None, None
+
+async def get_amm_v4_reserves(pool_keys: AmmV4PoolKeys) -> tuple:
+    """Returns (token_reserve, sol_reserve, token_decimal) with the reserves in UI units (floats) - use get_amm_v4_raw_reserves for quotes."""
+    token_reserve, sol_reserve, token_decimal = await get_amm_v4_raw_reserves(pool_keys)
+    if token_reserve is None:
         return None, None, None
+    
+    base_reserve = token_reserve / 10**token_decimal
+    quote_reserve = sol_reserve / 10**9
+    price = round(quote_reserve/base_reserve,9) if base_reserve else None
+    trade_logger.info(f"Base Reserve: {base_reserve} | Quote Reserve: {quote_reserve} | Token Decimal: {token_decimal} | price: {price}")
+    return base_reserve, quote_reserve, token_decimal
 
 def get_cpmm_reserves(pool_keys: CpmmPoolKeys):
     quote_vault = pool_keys.token_0_vault
@@ -485,16 +583,18 @@ def get_cpmm_reserves(pool_keys: CpmmPoolKeys):
     protocol_fees_token_1 = pool_keys.protocol_fees_token_1 / (10 ** base_decimal)
     fund_fees_token_1 = pool_keys.fund_fees_token_1 / (10 ** base_decimal)
     
-    balances_response = client.get_multiple_accounts_json_parsed(
+    balances_response = client.get_multiple_accounts(
         [quote_vault, base_vault], 
-        Processed
+        Processed,
+        encoding="base64",
+        data_slice=TOKEN_AMOUNT_SLICE
     )
     balances = balances_response.value
 
     quote_account = balances[0]
     base_account = balances[1]
-    quote_account_balance = quote_account.data.parsed['info']['tokenAmount']['uiAmount']
-    base_account_balance = base_account.data.parsed['info']['tokenAmount']['uiAmount']
+    quote_account_balance = decode_spl_token_amount(quote_account.data, 0) / 10**quote_decimal
+    base_account_balance = decode_spl_token_amount(base_account.data, 0) / 10**base_decimal
     
     if quote_account_balance is None or base_account_balance is None:
         trade_logger.error("Error: One of the account balances is None.")
@@ -527,16 +627,18 @@ def get_clmm_reserves(pool_keys: ClmmPoolKeys):
     protocol_fees_token_1 = pool_keys.protocol_fees_token_1 / (10 ** base_decimal)
     fund_fees_token_1 = pool_keys.fund_fees_token_1 / (10 ** base_decimal)
     
-    balances_response = client.get_multiple_accounts_json_parsed(
+    balances_response = client.get_multiple_accounts(
         [quote_vault, base_vault], 
-        Processed
+        Processed,
+        encoding="base64",
+        data_slice=TOKEN_AMOUNT_SLICE
     )
     balances = balances_response.value
 
     quote_account = balances[0]
     base_account = balances[1]
-    quote_account_balance = quote_account.data.parsed['info']['tokenAmount']['uiAmount']
-    base_account_balance = base_account.data.parsed['info']['tokenAmount']['uiAmount']
+    quote_account_balance = decode_spl_token_amount(quote_account.data, 0) / 10**quote_decimal
+    base_account_balance = decode_spl_token_amount(base_account.data, 0) / 10**base_decimal
     
     if quote_account_balance is None or base_account_balance is None:
         print("Error: One of the account balances is None.")
@@ -0,0 +1,310 @@
+import asyncio
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional
+
+import numpy as np
+
+from config import (trade_logger, EXIT_LADDER, HARD_STOPLOSS, STOPLOSS, TRAILING_STOP_ACTIVATION, TIME_DECAY_START, TIME_DECAY_FLOOR,
+                    MAX_TRADE_TIME_MINS, POSITION_CHECK_INTERVAL, POSITION_TABLE_CAPACITY, POSITION_MAX_EXIT_FAILURES)
+from utils.price_feed import PoolPrice, PriceTable, price_table
+from utils.submission import on_send
+
+# Max number of reaction latencies kept
+MAX_REACTION_SAMPLES = 1000
+
+@dataclass
+class ExitSignal:
+    pair_address: str
+    token_mint: str
+    reason: str                 # 'take_profit' | 'trailing_stop' | 'stoploss' | 'expired'
+    percentage: int             # percentage of the current token balance to sell
+    price: Optional[float]      # price that triggered the exit (None if the pool has not been priced yet)
+    entry_price: Optional[float]    # None if the position has not been priced yet
+    detected_at: float          # time.monotonic() when the exit was detected
+    price_updated_at: Optional[float]   # time.monotonic() when the triggering price was received
+
+class PositionManager:
+    """
+    Keeps every open position in one array-backed table and evaluates the exit rules for all of them at once.
+
+    Exit rules, checked on every price event:
+      - hard stoploss at HARD_STOPLOSS below entry
+      - trailing stop at STOPLOSS below the highest price, armed once the high is TRAILING_STOP_ACTIVATION above entry
+      - take profit ladder (EXIT_LADDER): sell a share of the original position at each gain level
+      - time decay: after TIME_DECAY_START of the trade duration the next take profit target decays linearly towards
+        TIME_DECAY_FLOOR of its distance above entry, and the position is sold outright at the deadline
+
+    Price updates from the PriceTable only write the row's price and schedule an evaluation, so a burst of updates in
+    the same loop iteration costs a single vectorised pass. A periodic tick catches deadlines on pools that stop
+    trading. Sells are dispatched as tasks only for rows that crossed a threshold.
+
+    A failed sell is retried on the next evaluation, up to max_exit_failures times in a row - after that the position
+    is abandoned (closed without selling) so its sell is not re-sent forever.
+    """
+
+    def __init__(
+        self, 
+        price_table: PriceTable, 
+        capacity: int=POSITION_TABLE_CAPACITY, 
+        check_interval: float=POSITION_CHECK_INTERVAL, 
+        max_exit_failures: int=POSITION_MAX_EXIT_FAILURES
+    ):
+        self.price_table = price_table
+        self.check_interval = check_interval
+        self.max_exit_failures = max_exit_failures
+        self.reaction_latencies: deque = deque(maxlen=MAX_REACTION_SAMPLES)    # seconds from price update to the sell being sent
+        self._columns = {
+            'entry': 0.0,               # NaN until the position is priced
+            'hard_stop': 0.0,           # hard stoploss fraction below entry
+            'take_profit': np.inf,      # price target of the next ladder rung (before time decay)
+            'stoploss': -np.inf,
+            'trailing_stop': 0.0,       # fraction below the high
+            'trailing_arm': np.inf,     # high needed to arm the trailing stop
+            'high': 0.0,
+            'opened_at': 0.0,
+            'deadline': np.inf,
+            'remaining': 0.0,           # share of the original position still held
+            'price': np.nan,
+            'price_time': np.nan,
+        }
+        for column, fill in self._columns.items():
+            setattr(self, f'_{column}', np.full(capacity, fill))
+        self._active = np.zeros(capacity, dtype=bool)
+        self._selling = np.zeros(capacity, dtype=bool)
+        self._rung = np.zeros(capacity, dtype=np.int64)
+        self._exit_failures = np.zeros(capacity, dtype=np.int64)   # failed sells in a row
+        self._rows: dict = {}           # pair_address -> row
+        self._pairs: dict = {}          # row -> pair_address
+        self._positions: dict = {}      # pair_address -> (token_mint, on_exit, ladder, closed future)
+        self._free_rows = list(range(capacity - 1, -1, -1))
+        self._evaluation_scheduled = False
+        self._task: Optional[asyncio.Task] = None
+        price_table.add_listener(self._on_price)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def open(
+        self, 
+        pair_address: str, 
+        token_mint: str, 
+        entry_price: Optional[float], 
+        on_exit: Callable[[ExitSignal], Awaitable[bool]],
+        ladder: list=EXIT_LADDER,
+        stoploss: float=HARD_STOPLOSS, 
+        trailing_stop: float=STOPLOSS,
+        max_duration: float=MAX_TRADE_TIME_MINS * 60
+    ) -> asyncio.Future:
+        """
+        Adds a position. on_exit is awaited when an exit rule fires and should return True once the sell has confirmed.
+        ladder is a list of (gain, percentage of the original position) rungs, e.g. [(0.25, 50), (0.40, 100)] - the
+        last rung sells whatever is left. If entry_price is None (the buy price is unknown) the entry is taken from
+        the first price update, and until then only the deadline applies.
+        Returns a future that is resolved when the position is closed.
+        """
+        if pair_address in self._rows:
+            return self._positions[pair_address][3]
+        if not self._free_rows:
+            self._grow()
+        
+        ladder = sorted(ladder)
+        now = time.monotonic()
+        row = self._free_rows.pop()
+        self._hard_stop[row] = stoploss
+        self._trailing_stop[row] = trailing_stop
+        if entry_price is None:
+            self._entry[row] = np.nan
+            self._take_profit[row] = np.inf
+            self._stoploss[row] = -np.inf
+            self._trailing_arm[row] = np.inf
+            self._high[row] = 0.0
+        else:
+            self._set_entry(row, entry_price, ladder)
+        self._opened_at[row] = now
+        self._deadline[row] = now + max_duration
+        self._remaining[row] = 1.0
+        self._price[row] = np.nan
+        self._price_time[row] = np.nan
+        self._rung[row] = 0
+        self._exit_failures[row] = 0
+        self._active[row] = True
+        self._selling[row] = False
+        
+        closed = asyncio.get_running_loop().create_future()
+        self._rows[pair_address] = row
+        self._pairs[row] = pair_address
+        self._positions[pair_address] = (token_mint, on_exit, ladder, closed)
+        
+        latest = self.price_table.get(pair_address)
+        if latest is not None:
+            self._price[row] = latest.price
+            self._price_time[row] = latest.updated_at
+        self.start()
+        trade_logger.info(f"Position opened: {pair_address} | entry: {entry_price} | ladder: {ladder} | SL: {self._stoploss[row]:.9f} | "
+                          f"trailing: {trailing_stop:.0%} | open positions: {len(self)}")
+        return closed
+
+    def close(self, pair_address: str) -> None:
+        row = self._rows.pop(pair_address, None)
+        if row is None:
+            return
+        self._pairs.pop(row, None)
+        self._active[row] = False
+        self._selling[row] = False
+        self._free_rows.append(row)
+        closed = self._positions.pop(pair_address)[3]
+        if not closed.done():
+            closed.set_result(True)
+
+    def evaluate(self, now: Optional[float]=None) -> list:
+        """Runs the exit rules over every open position. Rows that fire are marked as selling and returned as ExitSignals."""
+        now = time.monotonic() if now is None else now
+        live = self._active & ~self._selling
+        if not live.any():
+            return []
+        
+        price = self._price
+        entry = self._entry
+        for row in np.flatnonzero(live & np.isnan(entry) & ~np.isnan(price)):
+            self._set_entry(row, float(price[row]), self._positions[self._pairs[row]][2])
+        np.fmax(self._high, price, out=self._high, where=live)
+        
+        # Time decay - pull the next take profit target towards entry over the last part of the trade
+        with np.errstate(divide='ignore', invalid='ignore'):
+            elapsed = (now - self._opened_at) / (self._deadline - self._opened_at)
+            decay = np.clip(1 - (1 - TIME_DECAY_FLOOR) * (elapsed - TIME_DECAY_START) / (1 - TIME_DECAY_START), TIME_DECAY_FLOOR, 1)
+        target = entry + (self._take_profit - entry) * decay
+        
+        expired = live & (now >= self._deadline)
+        stoploss = live & (price <= self._stoploss)
+        trailing_stop = live & (self._high >= self._trailing_arm) & (price <= self._high * (1 - self._trailing_stop))
+        take_profit = live & (price >= target)
+        full_exit = expired | stoploss | trailing_stop
+        
+        signals = []
+        for row in np.flatnonzero(full_exit | take_profit):
+            pair_address = self._pairs[row]
+            token_mint, _, ladder, _ = self._positions[pair_address]
+            if expired[row]:
+                reason, percentage = 'expired', 100
+            elif stoploss[row]:
+                reason, percentage = 'stoploss', 100
+            elif trailing_stop[row]:
+                reason, percentage = 'trailing_stop', 100
+            else:
+                reason, percentage = 'take_profit', self._rung_percentage(row, ladder)
+            
+            self._selling[row] = True
+            row_price = None if np.isnan(price[row]) else float(price[row])
+            price_time = None if np.isnan(self._price_time[row]) else float(self._price_time[row])
+            entry_price = None if np.isnan(entry[row]) else float(entry[row])
+            signals.append(ExitSignal(pair_address, token_mint, reason, percentage, row_price, entry_price, now, price_time))
+        return signals
+
+    def _set_entry(self, row: int, entry_price: float, ladder: list) -> None:
+        self._entry[row] = entry_price
+        self._take_profit[row] = entry_price * (1 + ladder[0][0]) if ladder else np.inf
+        self._stoploss[row] = entry_price * (1 - self._hard_stop[row])
+        self._trailing_arm[row] = entry_price * (1 + TRAILING_STOP_ACTIVATION)
+        self._high[row] = entry_price
+
+    def _rung_percentage(self, row: int, ladder: list) -> int:
+        # Rungs are a share of the original position - convert to a share of what is still held
+        rung_share = ladder[self._rung[row]][1] / 100
+        if self._rung[row] == len(ladder) - 1 or rung_share >= self._remaining[row]:
+            return 100
+        return max(1, min(100, round(rung_share / self._remaining[row] * 100)))
+
+    def _advance_rung(self, row: int, ladder: list) -> bool:
+        """Moves a position to its next ladder rung after a partial sell. Returns False if nothing is left to sell."""
+        self._remaining[row] -= ladder[self._rung[row]][1] / 100
+        self._rung[row] += 1
+        if self._rung[row] >= len(ladder) or self._remaining[row] <= 0:
+            return False
+        self._take_profit[row] = self._entry[row] * (1 + ladder[self._rung[row]][0])
+        return True
+
+    def _grow(self) -> None:
+        capacity = len(self._active)
+        extra = max(capacity, 1)
+        for column, fill in self._columns.items():
+            setattr(self, f'_{column}', np.concatenate([getattr(self, f'_{column}'), np.full(extra, fill)]))
+        self._active = np.concatenate([self._active, np.zeros(extra, dtype=bool)])
+        self._selling = np.concatenate([self._selling, np.zeros(extra, dtype=bool)])
+        self._rung = np.concatenate([self._rung, np.zeros(extra, dtype=np.int64)])
+        self._exit_failures = np.concatenate([self._exit_failures, np.zeros(extra, dtype=np.int64)])
+        self._free_rows.extend(range(capacity + extra - 1, capacity - 1, -1))
+
+    def _on_price(self, pool_price: PoolPrice) -> None:
+        row = self._rows.get(pool_price.pair_address)
+        if row is None:
+            return
+        self._price[row] = pool_price.price
+        self._price_time[row] = pool_price.updated_at
+        if not self._evaluation_scheduled:
+            self._evaluation_scheduled = True
+            asyncio.get_running_loop().call_soon(self._evaluate_and_dispatch)
+
+    def _evaluate_and_dispatch(self) -> None:
+        self._evaluation_scheduled = False
+        for signal in self.evaluate():
+            asyncio.create_task(self._dispatch(signal))
+
+    async def _dispatch(self, signal: ExitSignal) -> None:
+        position = self._positions.get(signal.pair_address)
+        if position is None:
+            return
+        _, on_exit, ladder, _ = position
+        trade_logger.info(f"Exit {signal.reason} ({signal.percentage}%) for {signal.pair_address} at price {signal.price}")
+        
+        # Reaction latency is measured when on_exit sends its first sell transaction (after fees, build and sign)
+        def record_reaction() -> None:
+            if signal.price_updated_at is None or on_send.get() is None:
+                return
+            on_send.set(None)
+            latency = time.monotonic() - signal.price_updated_at
+            self.reaction_latencies.append(latency)
+            trade_logger.info(f"Reaction latency for {signal.pair_address} (price update -> sell sent): {latency * 1000:.1f} ms")
+        on_send.set(record_reaction)
+        
+        sold = False
+        try:
+            sold = await on_exit(signal)
+        except Exception as e:
+            trade_logger.error(f"Exit error for {signal.pair_address}: {e}")
+        
+        row = self._rows.get(signal.pair_address)
+        if row is None:
+            return
+        if sold:
+            self._exit_failures[row] = 0
+            if signal.percentage >= 100 or not self._advance_rung(row, ladder):
+                self.close(signal.pair_address)
+                return
+        else:
+            self._exit_failures[row] += 1
+            if self._exit_failures[row] >= self.max_exit_failures:
+                trade_logger.error(f"Exit for {signal.pair_address} failed {self._exit_failures[row]} times in a row - abandoning the position")
+                self.close(signal.pair_address)
+                return
+        # Partial sell done, or a failed sell - the position is evaluated again on the next price update or tick
+        self._selling[row] = False
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.check_interval)
+            if self._rows:
+                self._evaluate_and_dispatch()
+
+position_manager = PositionManager(price_table)
@@ -0,0 +1,329 @@
+import asyncio
+import base64
+import itertools
+import json
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+import websockets
+from solders.pubkey import Pubkey  # type: ignore
+
+from config import qn_client, trade_logger, PRICE_FEED_WS_URL, RELAY_DELAY, RESERVE_POLL_INTERVAL
+from raydium.constants import WSOL
+from utils.account_reader import decode_spl_token_amount, get_token_amounts
+from utils.pool_utils import AmmV4PoolKeys
+
+# Max number of accounts accepted by a single getMultipleAccounts call
+MAX_MULTIPLE_ACCOUNTS = 100
+
+@dataclass
+class PoolPrice:
+    pair_address: str
+    token_reserve: int      # raw token vault amount
+    sol_reserve: int        # raw WSOL vault amount (lamports)
+    token_decimals: int
+    price: float            # SOL per token
+    slot: int
+    updated_at: float       # time.monotonic() when the update was received
+
+@dataclass
+class _PoolVaults:
+    token_vault: str
+    sol_vault: str
+    token_decimals: int
+
+def reserves_to_price(token_reserve: int, sol_reserve: int, token_decimals: int) -> Optional[float]:
+    if token_reserve == 0:
+        return None
+    return round((sol_reserve / 10**9) / (token_reserve / 10**token_decimals), 9)
+
+class PriceTable:
+    """
+    In-memory table of the latest price for each pair.
+    Trade loops await wait_for_update instead of sleeping, so they react as soon as a new price arrives.
+    """
+
+    def __init__(self):
+        self._prices: dict = {}     # pair_address -> PoolPrice
+        self._events: dict = {}     # pair_address -> asyncio.Event set (and replaced) on each update
+        self._listeners: list = []  # callbacks called with every PoolPrice update
+
+    def get(self, pair_address: str) -> Optional[PoolPrice]:
+        return self._prices.get(pair_address)
+
+    def add_listener(self, callback) -> None:
+        """Registers a (synchronous, cheap) callback that is called with every PoolPrice update."""
+        self._listeners.append(callback)
+
+    def update(self, pool_price: PoolPrice) -> None:
+        self._prices[pool_price.pair_address] = pool_price
+        event = self._events.pop(pool_price.pair_address, None)
+        if event is not None:
+            event.set()
+        for callback in self._listeners:
+            callback(pool_price)
+
+    def remove(self, pair_address: str) -> None:
+        self._prices.pop(pair_address, None)
+        event = self._events.pop(pair_address, None)
+        if event is not None:
+            event.set()
+
+    async def wait_for_update(self, pair_address: str, timeout: float) -> Optional[PoolPrice]:
+        """Waits for the next price update for a pair. Returns None if no update arrived within the timeout."""
+        event = self._events.setdefault(pair_address, asyncio.Event())
+        try:
+            await asyncio.wait_for(event.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+        return self._prices.get(pair_address)
+
+class PriceFeed:
+    """
+    Streams the vault balances of every open pool over a single websocket using accountSubscribe.
+
+    Each vault notification is decoded straight from the raw SPL token account bytes. A price is published
+    to the PriceTable once both vaults of a pool have been seen at the same slot (a swap always moves both).
+    Subscriptions are re-sent after a reconnect.
+    """
+
+    def __init__(self, ws_url: str=PRICE_FEED_WS_URL, price_table: PriceTable=None):
+        self.ws_url = ws_url
+        self.price_table = price_table or PriceTable()
+        self._pools: dict = {}              # pair_address -> _PoolVaults
+        self._vault_to_pair: dict = {}      # vault address -> pair_address
+        self._vault_amounts: dict = {}      # vault address -> (slot, raw amount)
+        self._subscriptions: dict = {}      # subscription id -> vault address
+        self._vault_subscription: dict = {} # vault address -> subscription id
+        self._pending_requests: dict = {}   # request id -> vault address
+        self._request_ids = itertools.count(1)
+        self._websocket = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def connected(self) -> bool:
+        return self._websocket is not None
+
+    @property
+    def pools(self) -> dict:
+        """pair_address -> vaults of every pool currently streamed"""
+        return self._pools
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def update_vaults(self, pair_address: str, slot: int, token_amount: int, sol_amount: int) -> None:
+        """Publishes vault amounts read over RPC. Ignored if the feed already holds newer data for the pool."""
+        vaults = self._pools.get(pair_address)
+        if vaults is None or token_amount is None or sol_amount is None:
+            return
+        for vault in (vaults.token_vault, vaults.sol_vault):
+            current = self._vault_amounts.get(vault)
+            if current is not None and current[0] > slot:
+                return
+        self._vault_amounts[vaults.token_vault] = (slot, token_amount)
+        self._vault_amounts[vaults.sol_vault] = (slot, sol_amount)
+        self._publish(pair_address)
+
+    async def add_pool(self, pair_address: str, pool_keys: AmmV4PoolKeys) -> None:
+        """Starts streaming the vaults of a pool. The table is seeded with one RPC read so a price is available immediately."""
+        if pair_address in self._pools:
+            return
+        
+        if pool_keys.base_mint == WSOL:
+            vaults = _PoolVaults(str(pool_keys.quote_vault), str(pool_keys.base_vault), pool_keys.quote_decimals)
+        else:
+            vaults = _PoolVaults(str(pool_keys.base_vault), str(pool_keys.quote_vault), pool_keys.base_decimals)
+        self._pools[pair_address] = vaults
+        self._vault_to_pair[vaults.token_vault] = pair_address
+        self._vault_to_pair[vaults.sol_vault] = pair_address
+        
+        await self._seed(pair_address, vaults)
+        self.start()
+        if self._websocket is not None:
+            for vault in (vaults.token_vault, vaults.sol_vault):
+                await self._subscribe(vault)
+
+    async def remove_pool(self, pair_address: str) -> None:
+        vaults = self._pools.pop(pair_address, None)
+        if vaults is None:
+            return
+        for vault in (vaults.token_vault, vaults.sol_vault):
+            self._vault_to_pair.pop(vault, None)
+            self._vault_amounts.pop(vault, None)
+            subscription_id = self._vault_subscription.pop(vault, None)
+            if subscription_id is not None:
+                self._subscriptions.pop(subscription_id, None)
+                await self._send('accountUnsubscribe', [subscription_id])
+        self.price_table.remove(pair_address)
+
+    async def _seed(self, pair_address: str, vaults: _PoolVaults) -> None:
+        try:
+            slot, (token_amount, sol_amount) = await get_token_amounts(qn_client, [Pubkey.from_string(vaults.token_vault), Pubkey.from_string(vaults.sol_vault)])
+            self.update_vaults(pair_address, slot, token_amount, sol_amount)
+        except Exception as e:
+            trade_logger.error(f"Error seeding price feed for {pair_address}: {e}")
+
+    async def _send(self, method: str, params: list) -> Optional[int]:
+        if self._websocket is None:
+            return None
+        request_id = next(self._request_ids)
+        try:
+            await self._websocket.send(json.dumps({"jsonrpc": "2.0", "id": request_id, "method": method, "params": params}))
+        except Exception as e:
+            trade_logger.error(f"Price feed {method} error: {e}")
+            return None
+        return request_id
+
+    async def _subscribe(self, vault: str) -> None:
+        request_id = await self._send('accountSubscribe', [vault, {"encoding": "base64", "commitment": "processed"}])
+        if request_id is not None:
+            self._pending_requests[request_id] = vault
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                async with websockets.connect(self.ws_url, ping_interval=60, ping_timeout=20) as websocket:
+                    self._websocket = websocket
+                    self._subscriptions.clear()
+                    self._vault_subscription.clear()
+                    self._pending_requests.clear()
+                    for vault in list(self._vault_to_pair):
+                        await self._subscribe(vault)
+                    trade_logger.info(f"Price feed connected - streaming {len(self._pools)} pools")
+
+                    async for message in websocket:
+                        self._handle_message(json.loads(message))
+            except asyncio.CancelledError:
+                self._websocket = None
+                raise
+            except Exception as e:
+                trade_logger.error(f"Price feed websocket error: {e} - reconnecting in {RELAY_DELAY} seconds")
+            self._websocket = None
+            await asyncio.sleep(RELAY_DELAY)
+
+    def _handle_message(self, data: dict) -> None:
+        # Subscription confirmation: {"jsonrpc": "2.0", "result": <subscription id>, "id": <request id>}
+        if "id" in data:
+            vault = self._pending_requests.pop(data["id"], None)
+            if vault is not None and "result" in data:
+                if vault in self._vault_to_pair:
+                    self._subscriptions[data["result"]] = vault
+                    self._vault_subscription[vault] = data["result"]
+                else:
+                    # The pool was removed while the subscription was in flight
+                    asyncio.create_task(self._send('accountUnsubscribe', [data["result"]]))
+            return
+
+        if data.get("method") != "accountNotification":
+            return
+        params = data.get("params", {})
+        vault = self._subscriptions.get(params.get("subscription"))
+        if vault is None:
+            return
+        
+        result = params["result"]
+        slot = result["context"]["slot"]
+        raw_data = base64.b64decode(result["value"]["data"][0])
+        self._vault_amounts[vault] = (slot, decode_spl_token_amount(memoryview(raw_data)))
+        pair_address = self._vault_to_pair.get(vault)
+        if pair_address is not None:
+            self._publish(pair_address)
+
+    def _publish(self, pair_address: str) -> None:
+        vaults = self._pools.get(pair_address)
+        token = self._vault_amounts.get(vaults.token_vault) if vaults else None
+        sol = self._vault_amounts.get(vaults.sol_vault) if vaults else None
+        if token is None or sol is None or token[0] != sol[0]:
+            return
+        
+        price = reserves_to_price(token[1], sol[1], vaults.token_decimals)
+        if price is None:
+            return
+        self.price_table.update(PoolPrice(
+            pair_address=pair_address,
+            token_reserve=token[1],
+            sol_reserve=sol[1],
+            token_decimals=vaults.token_decimals,
+            price=price,
+            slot=token[0],
+            updated_at=time.monotonic()
+        ))
+
+@dataclass
+class AggregatorStats:
+    ticks: int = 0              # ticks that had pools to read
+    rpc_calls: int = 0          # getMultipleAccounts calls
+    pools_read: int = 0         # pool reserve reads across all ticks
+
+class ReserveAggregator:
+    """
+    Reads the vaults of every pool in the price feed on one tick, in getMultipleAccounts chunks of up to 100 accounts.
+
+    This is the polling fallback for the websocket feed: while the feed is connected nothing is read, otherwise each
+    tick costs one call per 50 pools instead of one call per open position. Reserves are published through the feed,
+    so every trade task waiting on the PriceTable wakes up from the same read.
+    """
+
+    def __init__(self, feed: PriceFeed, interval: float=RESERVE_POLL_INTERVAL, chunk_size: int=MAX_MULTIPLE_ACCOUNTS):
+        self.feed = feed
+        self.interval = interval
+        self.pools_per_chunk = max(1, min(chunk_size, MAX_MULTIPLE_ACCOUNTS) // 2)   # both vaults of a pool go in the same call
+        self.stats = AggregatorStats()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def poll_once(self) -> None:
+        pools = list(self.feed.pools.items())
+        if not pools:
+            return
+        
+        self.stats.ticks += 1
+        chunks = [pools[i:i + self.pools_per_chunk] for i in range(0, len(pools), self.pools_per_chunk)]
+        await asyncio.gather(*(self._read_chunk(chunk) for chunk in chunks))
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            if self.feed.connected:
+                continue
+            try:
+                await self.poll_once()
+            except Exception as e:
+                trade_logger.error(f"Reserve aggregator error: {e}")
+
+    async def _read_chunk(self, chunk: list) -> None:
+        vault_keys = []
+        for _, vaults in chunk:
+            vault_keys.append(Pubkey.from_string(vaults.token_vault))
+            vault_keys.append(Pubkey.from_string(vaults.sol_vault))
+        
+        self.stats.rpc_calls += 1
+        try:
+            slot, amounts = await get_token_amounts(qn_client, vault_keys)
+        except Exception as e:
+            trade_logger.error(f"Error reading reserves for {len(chunk)} pools: {e}")
+            return
+        
+        self.stats.pools_read += len(chunk)
+        for i, (pair_address, _) in enumerate(chunk):
+            self.feed.update_vaults(pair_address, slot, amounts[2 * i], amounts[2 * i + 1])
+
+price_table = PriceTable()
+price_feed = PriceFeed(price_table=price_table)
+reserve_aggregator = ReserveAggregator(price_feed)
@@ -0,0 +1,244 @@
+import atexit
+import json
+import struct
+import time
+from collections import defaultdict, deque
+from typing import Iterator, Optional, Union
+
+import httpx
+import msgspec
+
+from config import migrations_logger, RECORD_EVENTS_FILE, METRICS_PORT
+from utils.metrics import MetricsTransport
+
+# Every record is a little-endian uint32 length followed by a msgpack array:
+# [wall clock time, kind ('ws' | 'http'), source (websocket url or request url), request key (http only), payload]
+RECORD_HEADER = struct.Struct('<I')
+
+# Flush the write buffer once it holds this many bytes (records are also flushed at exit)
+FLUSH_BYTES = 64 * 1024
+
+class EventRecord(msgspec.Struct, array_like=True):
+    timestamp: float
+    kind: str
+    source: str
+    request: Optional[str]
+    payload: bytes                  # raw frame (text frames are stored utf-8 encoded) or response body
+
+_encoder = msgspec.msgpack.Encoder()
+_decoder = msgspec.msgpack.Decoder(EventRecord)
+
+def request_key(method: str, url: str, body: bytes) -> str:
+    """
+    Key a request is matched on during replay. JSON-RPC calls are keyed on the RPC method and params (the request id
+    and the endpoint are ignored), anything else on the HTTP method and full URL.
+    """
+    if body:
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            payload = None
+        if isinstance(payload, dict) and 'method' in payload:
+            return f"rpc:{payload['method']}:{json.dumps(payload.get('params'), sort_keys=True)}"
+        if isinstance(payload, list):
+            return "rpc-batch:" + "|".join(f"{item.get('method')}:{json.dumps(item.get('params'), sort_keys=True)}" for item in payload)
+    return f"{method}:{url}"
+
+def rpc_method(key: str) -> Optional[str]:
+    """The RPC method of a request key - the fallback match when the exact params were never recorded."""
+    return key.split(':', 2)[1] if key.startswith('rpc:') else None
+
+class EventRecorder:
+    """
+    Appends raw websocket frames and HTTP/RPC responses to a compact append-only file.
+
+    Records are buffered in memory and written in FLUSH_BYTES blocks, so recording adds no syscall per frame.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.records = 0
+        self._buffer = bytearray()
+        self._file = open(path, 'ab')
+        atexit.register(self.close)
+
+    def record(self, kind: str, source: str, payload: Union[bytes, str], request: Optional[str]=None) -> None:
+        if isinstance(payload, str):
+            payload = payload.encode()
+        data = _encoder.encode(EventRecord(time.time(), kind, source, request, payload))
+        self._buffer += RECORD_HEADER.pack(len(data))
+        self._buffer += data
+        self.records += 1
+        if len(self._buffer) >= FLUSH_BYTES:
+            self.flush()
+
+    def flush(self) -> None:
+        if self._buffer and not self._file.closed:
+            self._file.write(self._buffer)
+            self._file.flush()
+            self._buffer.clear()
+
+    def close(self) -> None:
+        self.flush()
+        if not self._file.closed:
+            self._file.close()
+
+def read_events(path: str) -> Iterator[EventRecord]:
+    """Yields the records of a recording in the order they were written. A truncated last record is ignored."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    offset = 0
+    while offset + RECORD_HEADER.size <= len(data):
+        (length,) = RECORD_HEADER.unpack_from(data, offset)
+        offset += RECORD_HEADER.size
+        if offset + length > len(data):
+            break
+        yield _decoder.decode(data[offset:offset + length])
+        offset += length
+
+class RecordingTransport(httpx.AsyncBaseTransport):
+    """httpx transport that records the (decoded) body of every response next to the request key."""
+
+    def __init__(self, recorder: EventRecorder, transport: Optional[httpx.AsyncBaseTransport]=None):
+        self.recorder = recorder
+        self._transport = transport or httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        response = await self._transport.handle_async_request(request)
+        body = await response.aread()
+        key = request_key(request.method, str(request.url), request.content)
+        self.recorder.record('http', str(request.url), body, request=f"{response.status_code}|{key}")
+
+        # The body is already decoded, so the encoding headers no longer apply
+        headers = [(name, value) for name, value in response.headers.items() if name.lower() not in ('content-encoding', 'content-length', 'transfer-encoding')]
+        return httpx.Response(response.status_code, headers=headers, content=body, request=request, extensions=response.extensions)
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+# RPC methods whose params change on every run (signed transactions, fresh signatures) - the only ones answered by a
+# response recorded for the same method when their exact params were not recorded
+VOLATILE_RPC_METHODS = {'sendTransaction', 'getSignatureStatuses', 'getTransaction', 'getLatestBlockhash'}
+
+class ReplayTransport(httpx.AsyncBaseTransport):
+    """
+    httpx transport that answers from a recording instead of the network - the stub RPC/HTTP layer for a replay.
+
+    Responses are matched on the request key. Repeated calls with the same key get the recorded responses in order
+    (the last one is repeated). Calls to VOLATILE_RPC_METHODS with unseen params fall back to any response recorded
+    for the same RPC method. Every other unseen request (e.g. getAccountInfo for an unrecorded account) is counted as
+    unmatched, so a replay never answers with another account's data. The JSON-RPC id of the response is rewritten
+    to the id of the request.
+    """
+
+    def __init__(self, path: str):
+        self._responses: dict = defaultdict(deque)          # request key -> deque of (status, body)
+        self._method_responses: dict = defaultdict(deque)   # rpc method -> deque of (status, body)
+        self.served = 0
+        self.fallbacks = 0
+        self.unmatched = 0
+        self.send_times: list = []                          # time.monotonic() of each sendTransaction request
+        for event in read_events(path):
+            if event.kind != 'http' or event.request is None:
+                continue
+            status, key = event.request.split('|', 1)
+            self._responses[key].append((int(status), event.payload))
+            method = rpc_method(key)
+            if method in VOLATILE_RPC_METHODS:
+                self._method_responses[method].append((int(status), event.payload))
+
+    @staticmethod
+    def _next(responses: deque) -> tuple:
+        return responses.popleft() if len(responses) > 1 else responses[0]
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        body = await request.aread()
+        key = request_key(request.method, str(request.url), body)
+        method = rpc_method(key)
+        if method == 'sendTransaction':
+            self.send_times.append(time.monotonic())
+
+        if self._responses.get(key):
+            status, content = self._next(self._responses[key])
+        elif method is not None and self._method_responses.get(method):
+            self.fallbacks += 1
+            status, content = self._next(self._method_responses[method])
+        else:
+            self.unmatched += 1
+            migrations_logger.warning(f"Replay: no recorded response for {key[:120]}")
+            return httpx.Response(404, content=b'', request=request)
+        self.served += 1
+
+        # Answer with the id the caller used, as a real node would
+        if method is not None:
+            try:
+                payload = json.loads(content)
+                payload['id'] = json.loads(body).get('id')
+                content = json.dumps(payload)
+            except (ValueError, TypeError, AttributeError):
+                pass
+        return httpx.Response(status, content=content, headers={'content-type': 'application/json'}, request=request)
+
+# The active mode - at most one of them is set
+recorder: Optional[EventRecorder] = EventRecorder(RECORD_EVENTS_FILE) if RECORD_EVENTS_FILE else None
+replay_transport: Optional[ReplayTransport] = None
+
+# Transport plugged in by a harness (the replay stub, or the fake RPC of utils.fake_rpc) - takes over every HTTP/RPC call
+plugged_transport: Optional[httpx.AsyncBaseTransport] = None
+
+def use_transport(transport: httpx.AsyncBaseTransport) -> httpx.AsyncBaseTransport:
+    """Routes every instrumented HTTP/RPC client through transport. Call before the clients are created."""
+    global plugged_transport
+    plugged_transport = transport
+    return transport
+
+def start_replay(path: str) -> ReplayTransport:
+    """Serves every instrumented HTTP/RPC client from the recording at path. Call before the clients are created."""
+    global replay_transport
+    replay_transport = ReplayTransport(path)
+    use_transport(replay_transport)
+    return replay_transport
+
+def record_frame(source: str, frame: Union[bytes, str]) -> None:
+    """Records a raw websocket frame when recording is enabled."""
+    if recorder is not None:
+        recorder.record('ws', source, frame)
+
+def http_transport(limits: Optional[httpx.Limits]=None) -> Optional[httpx.AsyncBaseTransport]:
+    """
+    The transport HTTPX clients should use - the plugged in or recording transport, wrapped in a MetricsTransport
+    while the metrics endpoint is enabled. None when none of them applies.
+    """
+    network = lambda: httpx.AsyncHTTPTransport(limits=limits) if limits else None
+    transport = plugged_transport
+    if transport is None and recorder is not None:
+        transport = RecordingTransport(recorder, network())
+    if METRICS_PORT is not None:
+        transport = MetricsTransport(transport or network())
+    return transport
+
+def session_limits(session: httpx.AsyncClient) -> Optional[httpx.Limits]:
+    """The connection pool limits an httpx.AsyncClient was created with (None if its transport is not the default one)."""
+    pool = getattr(getattr(session, '_transport', None), '_pool', None)
+    if pool is None:
+        return None
+    return httpx.Limits(
+        max_connections=pool._max_connections,
+        max_keepalive_connections=pool._max_keepalive_connections,
+        keepalive_expiry=pool._keepalive_expiry
+    )
+
+async def instrument_rpc_clients(*rpc_clients) -> None:
+    """
+    Routes solana AsyncClients through http_transport (no-op when it is None). Every client gets its own transport
+    with the pool limits of the session it replaces, so closing one client leaves the others working.
+    The replaced sessions are closed.
+    """
+    for rpc_client in rpc_clients:
+        provider = rpc_client._provider
+        transport = http_transport(session_limits(provider.session))
+        if transport is None:
+            return
+        timeout = provider.session.timeout
+        await provider.session.aclose()
+        provider.session = httpx.AsyncClient(transport=transport, timeout=timeout)
@@ -0,0 +1,294 @@
+import asyncio
+import atexit
+import csv
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Optional
+
+from config import (migrations_logger, STORAGE_BACKEND, STORAGE_SQLITE_FILE, STORAGE_PARQUET_DIR, STORAGE_FLUSH_INTERVAL,
+                    STORAGE_FLUSH_ROWS, CSV_MIGRATIONS_FILE, CSV_TRADES_FILE)
+
+# Column kinds -> SQLite column types
+SQLITE_TYPES = {'str': 'TEXT', 'json': 'TEXT', 'float': 'REAL', 'int': 'INTEGER', 'bool': 'INTEGER'}
+
+@dataclass
+class Table:
+    name: str
+    columns: list           # [(column name, kind)] - kind is 'str', 'json', 'float', 'int' or 'bool'
+    csv_file: str           # file used by the csv backend
+
+    @property
+    def column_names(self) -> list:
+        return [name for name, _ in self.columns]
+
+def coerce(value, kind: str):
+    """Converts a value to its column kind so every row of a column has one type. Unconvertible values become None."""
+    if value is None or value == '':
+        return None
+    try:
+        if kind == 'str':
+            return value if isinstance(value, str) else json.dumps(value, default=str) if isinstance(value, (list, dict)) else str(value)
+        if kind == 'json':
+            return json.dumps(value, default=str)
+        if kind == 'float':
+            return float(value)
+        if kind == 'int':
+            return int(value)
+        if kind == 'bool':
+            return value.lower() in ('true', '1') if isinstance(value, str) else bool(value)
+    except (TypeError, ValueError):
+        return None
+    return value
+
+class CsvBackend:
+    """Appends rows to a CSV file per table - the header is written once when the file is created."""
+
+    def __init__(self):
+        self._headers_written: set = set()
+
+    def write(self, table: Table, rows: list) -> None:
+        new_file = table.name not in self._headers_written and not os.path.isfile(table.csv_file)
+        with open(table.csv_file, mode='a', newline='', encoding='utf-8') as csvfile:
+            writer = csv.DictWriter(csvfile, fieldnames=table.column_names, extrasaction='ignore')
+            if new_file:
+                writer.writeheader()
+            writer.writerows(rows)
+        self._headers_written.add(table.name)
+
+    def close(self) -> None:
+        pass
+
+class SqliteBackend:
+    """
+    One SQLite database in WAL mode with a table per Table - readers (notebooks) never block the writer.
+    Load a table with pandas.read_sql('SELECT * FROM migrations', sqlite3.connect(STORAGE_SQLITE_FILE)).
+    """
+
+    def __init__(self, path: str=STORAGE_SQLITE_FILE):
+        self.path = path
+        self._connection: Optional[sqlite3.Connection] = None
+        self._created: set = set()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            # Only ever used by one flush at a time (StorageWriter serialises them), from the executor threads
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('PRAGMA synchronous=NORMAL')
+        return self._connection
+
+    def write(self, table: Table, rows: list) -> None:
+        connection = self._connect()
+        if table.name not in self._created:
+            columns = ', '.join(f'"{name}" {SQLITE_TYPES[kind]}' for name, kind in table.columns)
+            connection.execute(f'CREATE TABLE IF NOT EXISTS "{table.name}" ({columns})')
+            # Columns added to a Table after the database was created
+            existing = {row[1] for row in connection.execute(f'PRAGMA table_info("{table.name}")')}
+            for name, kind in table.columns:
+                if name not in existing:
+                    connection.execute(f'ALTER TABLE "{table.name}" ADD COLUMN "{name}" {SQLITE_TYPES[kind]}')
+            self._created.add(table.name)
+
+        placeholders = ', '.join('?' for _ in table.columns)
+        names = ', '.join(f'"{name}"' for name in table.column_names)
+        with connection:
+            connection.executemany(
+                f'INSERT INTO "{table.name}" ({names}) VALUES ({placeholders})',
+                [tuple(coerce(row.get(name), kind) for name, kind in table.columns) for row in rows]
+            )
+
+    def close(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+class ParquetBackend:
+    """
+    Writes each flush as a Parquet file under <directory>/<table>/date=<YYYY-MM-DD>/, so the output rotates daily
+    and files are never rewritten. Every file of a table has the same schema (from the column kinds), so months of
+    data load in one read: pyarrow.dataset.dataset('<directory>/migrations', partitioning='hive').to_table().
+    Needs pyarrow, which is only imported when this backend is selected.
+    """
+
+    def __init__(self, directory: str=STORAGE_PARQUET_DIR):
+        import pyarrow
+        import pyarrow.parquet
+        self.pa = pyarrow
+        self.pq = pyarrow.parquet
+        self.directory = directory
+        self._types = {'str': pyarrow.string(), 'json': pyarrow.string(), 'float': pyarrow.float64(), 'int': pyarrow.int64(), 'bool': pyarrow.bool_()}
+
+    def write(self, table: Table, rows: list) -> None:
+        now = datetime.now(timezone.utc)
+        schema = self.pa.schema([(name, self._types[kind]) for name, kind in table.columns])
+        data = self.pa.Table.from_pylist([{name: coerce(row.get(name), kind) for name, kind in table.columns} for row in rows], schema=schema)
+        partition = os.path.join(self.directory, table.name, f"date={now.strftime('%Y-%m-%d')}")
+        os.makedirs(partition, exist_ok=True)
+        self.pq.write_table(data, os.path.join(partition, f"part-{now.strftime('%H%M%S')}-{time.monotonic_ns()}.parquet"))
+
+    def close(self) -> None:
+        pass
+
+def create_backend(name: str=STORAGE_BACKEND):
+    if name == 'sqlite':
+        return SqliteBackend()
+    if name == 'parquet':
+        return ParquetBackend()
+    if name == 'csv':
+        return CsvBackend()
+    raise ValueError(f"Unknown storage backend: {name}")
+
+class StorageWriter:
+    """
+    Buffers rows in memory and writes them from a worker thread, so saving a row never blocks the event loop.
+
+    append only adds the row to the buffer. A background task flushes the buffer every STORAGE_FLUSH_INTERVAL
+    seconds, or as soon as it holds STORAGE_FLUSH_ROWS rows, with the backend write run in asyncio.to_thread.
+    Flushes are serialised, so rows are written in the order they were appended. Whatever is still buffered
+    at exit is written synchronously.
+    """
+
+    def __init__(self, backend=None, flush_interval: float=STORAGE_FLUSH_INTERVAL, flush_rows: int=STORAGE_FLUSH_ROWS):
+        self.backend = backend or create_backend()
+        self.flush_interval = flush_interval
+        self.flush_rows = flush_rows
+        self.rows_written = 0
+        self._buffer: list = []                 # (table, row)
+        self._flush_requested: Optional[asyncio.Event] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._thread_lock = threading.Lock()    # the exit flush must not interleave with a running worker thread write
+        self._task: Optional[asyncio.Task] = None
+        atexit.register(self.close)
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._flush_requested = asyncio.Event()
+            self._flush_lock = asyncio.Lock()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+    def append(self, table: Table, row: dict) -> None:
+        self._buffer.append((table, row))
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            # No running event loop (e.g. a script) - write straight away
+            self._write(self._take())
+            return
+        self.start()
+        if len(self._buffer) >= self.flush_rows:
+            self._flush_requested.set()
+
+    async def flush(self) -> None:
+        if self._flush_lock is None:
+            self._write(self._take())
+            return
+        async with self._flush_lock:
+            rows = self._take()
+            if rows:
+                await asyncio.to_thread(self._write, rows)
+
+    def close(self) -> None:
+        self._write(self._take())
+        with self._thread_lock:
+            self.backend.close()
+
+    def _take(self) -> list:
+        rows, self._buffer = self._buffer, []
+        return rows
+
+    def _write(self, rows: list) -> None:
+        if not rows:
+            return
+        by_table: dict = {}
+        for table, row in rows:
+            by_table.setdefault(table.name, (table, []))[1].append(row)
+        with self._thread_lock:
+            for table, table_rows in by_table.values():
+                try:
+                    self.backend.write(table, table_rows)
+                    self.rows_written += len(table_rows)
+                except Exception as e:
+                    migrations_logger.error(f"Storage error writing {len(table_rows)} rows to {table.name}: {e}")
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_requested.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_requested.clear()
+            await self.flush()
+
+MIGRATIONS_TABLE = Table('migrations', [
+    ('timestamp', 'str'),
+    ('token_address', 'str'),
+    ('name', 'str'),
+    ('symbol', 'str'),
+    ('description', 'str'),
+    ('ipfs_description', 'str'),
+    ('creator', 'str'),
+    ('decimals', 'int'),
+    ('ipfs_url', 'str'),
+    ('twitter_url', 'str'),
+    ('twitter_handle', 'str'),
+    ('website_url', 'str'),
+    ('website_valid', 'bool'),
+    ('telegram_url', 'str'),
+    ('image_url', 'str'),
+    ('risks', 'json'),
+    ('score', 'float'),
+    ('total_pct_top_5', 'float'),
+    ('total_pct_top_10', 'float'),
+    ('total_pct_top_20', 'float'),
+    ('total_pct_insiders', 'float'),
+    ('is_dexscreener_paid_parsed', 'bool'),
+    ('is_dexscreener_paid_raw', 'json'),
+    ('number_of_twitter_handles', 'int'),
+    ('previous_twitter_handles', 'json'),
+    ('total_followers', 'int'),
+    ('total_influencers_count', 'int'),
+    ('total_projects_count', 'int'),
+    ('total_venture_capitals_count', 'int'),
+    ('total_user_protected', 'int'),
+    ('twitter_score', 'float'),
+    ('twitter_name', 'str'),
+    ('twitter_screen_name', 'str'),
+    ('twitter_description', 'str'),
+    ('twitter_followers_count', 'int'),
+    ('twitter_friends_count', 'int'),
+    ('twitter_register_date', 'str'),
+    ('twitter_tweets_count', 'int'),
+    ('twitter_verified', 'bool'),
+    ('twitter_can_dm', 'bool'),
+    ('execute_trade', 'bool'),
+], CSV_MIGRATIONS_FILE)
+
+TRADES_TABLE = Table('trades', [
+    ('token_address', 'str'),
+    ('pair_address', 'str'),
+    ('buy_timestamp', 'str'),
+    ('buy_transaction_hash', 'str'),
+    ('buy_tokens_spent', 'float'),
+    ('buy_tokens_received', 'float'),
+    ('buy_effective_price', 'float'),
+    ('sell_timestamp', 'str'),
+    ('sell_transaction_hash', 'str'),
+    ('sell_tokens_spent', 'float'),
+    ('sell_tokens_received', 'float'),
+    ('sell_effective_price', 'float'),
+    ('return_value', 'float'),
+    ('return_perc', 'float'),
+], CSV_TRADES_FILE)
+
+storage_writer = StorageWriter()
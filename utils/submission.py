@@ -0,0 +1,103 @@
+import asyncio
+import contextvars
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from solana.rpc.types import TxOpts
+from solders.transaction import VersionedTransaction  # type: ignore
+
+from config import client, trade_logger
+from utils.common_utils import confirm_txn
+from utils.metrics import priority_fee_used
+from utils.tracing import tracer
+
+@dataclass
+class StrategyStats:
+    attempts: int = 0           # number of broadcasts
+    fills: int = 0              # broadcasts where one variant confirmed
+    variants_sent: int = 0      # transactions sent across all broadcasts
+    expired: int = 0            # variants left unconfirmed after another variant won
+    fill_seconds: float = 0.0   # total seconds from first send to confirmation across fills
+    fees_paid: int = 0          # total lamports of fee (meta.fee) paid by the winning variants
+    fees_known: int = 0         # fills whose confirmed transaction reported its fee
+
+    def summary(self) -> str:
+        latency = self.fill_seconds / self.fills if self.fills else 0
+        fees = self.fees_paid / self.fees_known if self.fees_known else 0
+        return (f"attempts: {self.attempts} | fills: {self.fills} | variants sent: {self.variants_sent} | expired: {self.expired} | "
+                f"avg fill latency: {latency:.2f}s | avg fee paid: {fees:.0f} lamports")
+
+# Called (without arguments) right before a broadcast sends its transactions. Set per task - the position manager
+# uses it to time its reaction from the price update that triggered an exit to the sell being sent
+on_send: contextvars.ContextVar[Optional[Callable[[], None]]] = contextvars.ContextVar('on_send', default=None)
+
+# Submission stats per strategy ('serial' - one fee level per transaction, 'parallel' - several fee levels at once)
+submission_stats = {'serial': StrategyStats(), 'parallel': StrategyStats()}
+
+async def broadcast_transactions(
+    transactions: list, 
+    priority_fees: list, 
+    token_mint: str, 
+    started_at: Optional[float]=None
+) -> tuple:
+    """
+    Sends signed variants of the same trade (differing only in compute unit price) at the same time and
+    confirms them concurrently. The first variant to confirm wins and the rest are counted as expired.
+    The caller is responsible for making the variants mutually exclusive on-chain, so at most one can fill.
+
+    Returns (confirmed, trade_data, txn_sig) - confirmed and trade_data have the same meaning as in confirm_txn.
+    """
+    strategy = 'parallel' if len(transactions) > 1 else 'serial'
+    stats = submission_stats[strategy]
+    stats.attempts += 1
+    started_at = started_at or time.perf_counter()
+
+    trade_logger.info(f"Sending {len(transactions)} transaction(s) - compute unit prices: {priority_fees}")
+    send_start = time.perf_counter()
+    callback = on_send.get()
+    if callback is not None:
+        callback()
+    with tracer.span('send', variants=len(transactions)):
+        send_results = await asyncio.gather(
+            *(client.send_transaction(txn=txn, opts=TxOpts(skip_preflight=True)) for txn in transactions),
+            return_exceptions=True
+        )
+    trade_logger.info(f"Time to send: {(time.perf_counter() - started_at) * 1000:.1f} ms")
+
+    pending = {}
+    for fee, result in zip(priority_fees, send_results):
+        if isinstance(result, Exception):
+            trade_logger.error(f"Send failed for compute unit price {fee}: {result}")
+            continue
+        txn_sig = result.value
+        trade_logger.info(f"Transaction Signature: {txn_sig} | compute unit price: {fee}")
+        pending[asyncio.create_task(confirm_txn(txn_sig, token_mint))] = (txn_sig, fee)
+    stats.variants_sent += len(pending)
+
+    # The first confirmation wins. Errors from the other variants are expected once one has landed, so keep waiting
+    first_error = None
+    with tracer.span('confirm', variants=len(pending)):
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                txn_sig, fee = pending.pop(task)
+                confirmed, trade_data = task.result()
+                if confirmed is True:
+                    for other in pending:
+                        other.cancel()
+                    stats.fills += 1
+                    stats.expired += len(pending)
+                    stats.fill_seconds += time.perf_counter() - send_start
+                    # The fee actually charged - the compute unit price only caps it at price x requested units
+                    if trade_data and trade_data.get('Fee') is not None:
+                        stats.fees_paid += trade_data['Fee']
+                        stats.fees_known += 1
+                    priority_fee_used.observe(fee)
+                    trade_logger.info(f"Filled with compute unit price {fee} | {strategy} submission stats - {stats.summary()}")
+                    return True, trade_data, txn_sig
+                if first_error is None and confirmed is not None:
+                    first_error = confirmed
+
+    trade_logger.info(f"No variant filled | {strategy} submission stats - {stats.summary()}")
+    return first_error, None, None
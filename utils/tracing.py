@@ -0,0 +1,165 @@
+import asyncio
+import atexit
+import contextvars
+import json
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Optional
+
+from config import migrations_logger, TRACE_FILE, TRACE_STATS_INTERVAL
+
+# Max number of durations kept per stage for the p50/p99 summary
+MAX_STAGE_SAMPLES = 1000
+
+# Flush the JSONL buffer once it holds this many bytes (it is also flushed on each summary and at exit). The file is
+# written from a worker thread, never on the event loop
+FLUSH_BYTES = 16 * 1024
+
+@dataclass
+class Trace:
+    trace_id: str           # token mint
+    started_at: float       # time.monotonic() of the log notification that started the trace
+
+# The trace of the running task - asyncio.create_task copies it, so the tasks a traced handler spawns inherit it
+_current_trace: contextvars.ContextVar = contextvars.ContextVar('current_trace', default=None)
+
+def percentile(samples, share: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(share * len(ordered)))]
+
+class Tracer:
+    """
+    Lightweight span recorder for the path from a migration log notification to a confirmed fill.
+
+    A trace is keyed on the token mint and starts at the time.monotonic() the notification frame was read.
+    start_trace binds it to the running task, and code further down the pipeline records its stage with
+    `with tracer.span('pool_keys'):` without the mint being passed along. Spans outside a trace (sells,
+    startup) are not recorded.
+
+    Every span is appended to TRACE_FILE as one JSON line - {"trace", "stage", "offset" (seconds from the
+    notification), "duration", "time" (wall clock), ...attributes} - and its duration is kept for the
+    per-stage p50/p99 summary logged every TRACE_STATS_INTERVAL seconds.
+    """
+
+    def __init__(self, path: str=TRACE_FILE, stats_interval: float=TRACE_STATS_INTERVAL):
+        self.path = path
+        self.stats_interval = stats_interval
+        self.durations: dict = defaultdict(lambda: deque(maxlen=MAX_STAGE_SAMPLES))     # stage -> seconds
+        self._buffer: list = []
+        self._buffered_bytes = 0
+        self._write_lock = threading.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._task: Optional[asyncio.Task] = None
+        atexit.register(self.flush)
+
+    def start(self) -> None:
+        if self.stats_interval and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._report())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self._flush_in_thread()
+
+    @staticmethod
+    def current() -> Optional[Trace]:
+        return _current_trace.get()
+
+    def start_trace(self, trace_id: str, started_at: Optional[float]=None) -> Trace:
+        """Binds a new trace to the running task (and the tasks it creates from now on)."""
+        trace = Trace(trace_id, started_at or time.monotonic())
+        _current_trace.set(trace)
+        return trace
+
+    def end_trace(self, outcome: Optional[str]=None) -> None:
+        """
+        Unbinds the trace of the running task. With an outcome, a 'total' span from the notification to now is
+        recorded first (e.g. outcome='filled' once the buy has confirmed).
+        """
+        trace = _current_trace.get()
+        if trace is None:
+            return
+        if outcome is not None:
+            self.record(trace, 'total', trace.started_at, time.monotonic(), outcome=outcome)
+        _current_trace.set(None)
+
+    @contextmanager
+    def span(self, stage: str, **attributes):
+        """Records the time spent in the block as a stage of the current trace - a no-op outside of a trace."""
+        trace = _current_trace.get()
+        if trace is None:
+            yield
+            return
+        start = time.monotonic()
+        try:
+            yield
+        except BaseException as e:
+            attributes['error'] = type(e).__name__
+            raise
+        finally:
+            self.record(trace, stage, start, time.monotonic(), **attributes)
+
+    async def timed(self, stage: str, awaitable, **attributes):
+        """Awaits awaitable inside a span - for lookups that are fanned out as tasks."""
+        with self.span(stage, **attributes):
+            return await awaitable
+
+    def record(self, trace: Trace, stage: str, start: float, end: float, **attributes) -> None:
+        """Records a span measured by the caller (monotonic start and end)."""
+        duration = end - start
+        self.durations[stage].append(duration)
+        if not self.path:
+            return
+        line = json.dumps({
+            'trace': trace.trace_id, 'stage': stage, 'offset': round(start - trace.started_at, 6),
+            'duration': round(duration, 6), 'time': time.time() - (time.monotonic() - start), **attributes
+        }, default=str) + '\n'
+        self._buffer.append(line)
+        self._buffered_bytes += len(line)
+        if self._buffered_bytes >= FLUSH_BYTES and (self._flush_task is None or self._flush_task.done()):
+            try:
+                asyncio.get_running_loop()
+            except RuntimeError:
+                # No running event loop
+                self.flush()
+                return
+            self._flush_task = asyncio.create_task(self._flush_in_thread())
+
+    def flush(self) -> None:
+        """Writes the buffered spans synchronously - used at exit, on the loop use _flush_in_thread."""
+        self._write(self._take())
+
+    async def _flush_in_thread(self) -> None:
+        await asyncio.to_thread(self._write, self._take())
+
+    def _take(self) -> list:
+        lines, self._buffer = self._buffer, []
+        self._buffered_bytes = 0
+        return lines
+
+    def _write(self, lines: list) -> None:
+        if not lines or not self.path:
+            return
+        with self._write_lock:
+            with open(self.path, 'a') as f:
+                f.writelines(lines)
+
+    def stats_summary(self) -> str:
+        lines = []
+        for stage, samples in self.durations.items():
+            if samples:
+                lines.append(f"{stage}: count {len(samples)} | p50 {percentile(samples, 0.5) * 1000:.1f}ms | "
+                             f"p99 {percentile(samples, 0.99) * 1000:.1f}ms | max {max(samples) * 1000:.1f}ms")
+        return "\n".join(lines) if lines else "no spans recorded"
+
+    async def _report(self) -> None:
+        while True:
+            await asyncio.sleep(self.stats_interval)
+            await self._flush_in_thread()
+            migrations_logger.info(f"Trace stage latencies (last {MAX_STAGE_SAMPLES} per stage):\n{self.stats_summary()}")
+
+tracer = Tracer()
@@ -0,0 +1,104 @@
+import asyncio
+import statistics
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Optional
+
+from config import migrations_logger, WORKER_POOL_SIZE, WORKER_QUEUE_SIZE, WORKER_STATS_INTERVAL
+
+# Max number of latency samples kept per stage for the stats summary
+MAX_LATENCY_SAMPLES = 1000
+
+@dataclass
+class PoolStats:
+    submitted: int = 0          # items accepted into the queue
+    dropped: int = 0            # items rejected because the queue was full
+    processed: int = 0          # items the handler finished (including failures)
+    failed: int = 0             # items whose handler raised
+    max_depth: int = 0
+    queue_waits: deque = field(default_factory=lambda: deque(maxlen=MAX_LATENCY_SAMPLES))      # seconds from submit to a worker picking it up
+    handle_times: deque = field(default_factory=lambda: deque(maxlen=MAX_LATENCY_SAMPLES))     # seconds spent in the handler
+
+    def summary(self, depth: int) -> str:
+        median_ms = lambda samples: f"{statistics.median(samples) * 1000:.1f}ms" if samples else "n/a"
+        max_ms = lambda samples: f"{max(samples) * 1000:.1f}ms" if samples else "n/a"
+        return (f"depth: {depth} (max {self.max_depth}) | submitted: {self.submitted} | dropped: {self.dropped} | "
+                f"processed: {self.processed} | failed: {self.failed} | queue wait median/max: {median_ms(self.queue_waits)}/"
+                f"{max_ms(self.queue_waits)} | handler median/max: {median_ms(self.handle_times)}/{max_ms(self.handle_times)}")
+
+class WorkerPool:
+    """
+    Bounded asyncio.Queue drained by a fixed number of worker tasks.
+
+    Lets a websocket reader hand off slow work (the filter chain) without awaiting it, so frames keep being read
+    while the filters run. submit never blocks: when the queue is full the item is dropped and counted, which keeps
+    the reader responsive under a burst. Queue depth, drops and the queue wait / handler latency of each item are
+    tracked in PoolStats and logged every WORKER_STATS_INTERVAL seconds.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        handler: Callable[[Any], Awaitable[None]],
+        workers: int=WORKER_POOL_SIZE,
+        max_size: int=WORKER_QUEUE_SIZE,
+        stats_interval: float=WORKER_STATS_INTERVAL
+    ):
+        self.name = name
+        self.handler = handler
+        self.workers = workers
+        self.stats_interval = stats_interval
+        self.stats = PoolStats()
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_size)   # (time.monotonic() at submit, item)
+        self._tasks: list = []
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def start(self) -> None:
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+            if self.stats_interval:
+                self._tasks.append(asyncio.create_task(self._report()))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    def submit(self, item: Any) -> bool:
+        """Queues an item for the workers. Returns False (and counts a drop) if the queue is full."""
+        try:
+            self._queue.put_nowait((time.monotonic(), item))
+        except asyncio.QueueFull:
+            self.stats.dropped += 1
+            migrations_logger.warning(f"{self.name} queue full ({self._queue.maxsize}) - dropped an item | dropped so far: {self.stats.dropped}")
+            return False
+        self.stats.submitted += 1
+        self.stats.max_depth = max(self.stats.max_depth, self._queue.qsize())
+        return True
+
+    def stats_summary(self) -> str:
+        return f"{self.name} workers: {self.workers} | {self.stats.summary(self.depth)}"
+
+    async def _work(self) -> None:
+        while True:
+            submitted_at, item = await self._queue.get()
+            started_at = time.monotonic()
+            self.stats.queue_waits.append(started_at - submitted_at)
+            try:
+                await self.handler(item)
+            except Exception as e:
+                self.stats.failed += 1
+                migrations_logger.error(f"{self.name} worker error: {e}")
+            finally:
+                self.stats.handle_times.append(time.monotonic() - started_at)
+                self.stats.processed += 1
+                self._queue.task_done()
+
+    async def _report(self) -> None:
+        while True:
+            await asyncio.sleep(self.stats_interval)
+            migrations_logger.info(self.stats_summary())
@@ -0,0 +1,143 @@
+from typing import Any, Optional, Union
+
+import msgspec
+
+# Log lines that mark a migration transaction - frames without any of them are dropped before decoding
+WITHDRAW_LOG = "Program log: Instruction: Withdraw"
+INITIALIZE2_LOG = "Program log: initialize2: InitializeInstruction2"
+MIGRATION_MARKERS = ("Instruction: Withdraw", "initialize2")
+
+# The schemas below only name the fields the listeners read. msgspec skips every other field while parsing, so
+# a full-detail block (instructions, inner instructions, balances, rewards...) never becomes Python objects.
+
+class TokenBalance(msgspec.Struct):
+    mint: str
+    owner: Optional[str] = None
+
+class TransactionMeta(msgspec.Struct):
+    err: Any = None
+    logMessages: Optional[list[str]] = None
+    postTokenBalances: Optional[list[TokenBalance]] = None
+
+class Message(msgspec.Struct):
+    accountKeys: list[str] = []
+
+class UiTransaction(msgspec.Struct):
+    signatures: list[str] = []
+    message: Message = msgspec.field(default_factory=Message)
+
+class Transaction(msgspec.Struct):
+    """A full transaction with its meta - the shape of a blockSubscribe transaction and of a getTransaction result."""
+    transaction: UiTransaction
+    meta: Optional[TransactionMeta] = None
+
+    @property
+    def signature(self) -> Optional[str]:
+        return self.transaction.signatures[0] if self.transaction.signatures else None
+
+    @property
+    def account_keys(self) -> list:
+        return self.transaction.message.accountKeys
+
+    @property
+    def logs(self) -> list:
+        return (self.meta.logMessages if self.meta else None) or []
+
+    def owned_mint(self, owner: str) -> Optional[str]:
+        """Mint of the first post-transaction token balance held by owner."""
+        balances = (self.meta.postTokenBalances if self.meta else None) or []
+        return next((balance.mint for balance in balances if balance.owner == owner), None)
+
+class Block(msgspec.Struct):
+    transactions: list[Transaction] = []
+
+class BlockValue(msgspec.Struct):
+    slot: int = 0
+    block: Optional[Block] = None
+
+class BlockResult(msgspec.Struct):
+    value: BlockValue
+
+class BlockParams(msgspec.Struct):
+    result: BlockResult
+    subscription: int = 0
+
+class BlockNotification(msgspec.Struct, tag_field="method", tag="blockNotification"):
+    params: BlockParams
+
+class LogsValue(msgspec.Struct):
+    signature: str
+    err: Any = None
+    logs: Optional[list[str]] = None
+
+class LogsResult(msgspec.Struct):
+    value: LogsValue
+
+class LogsParams(msgspec.Struct):
+    result: LogsResult
+    subscription: int = 0
+
+class LogsNotification(msgspec.Struct, tag_field="method", tag="logsNotification"):
+    params: LogsParams
+
+class TransactionResponse(msgspec.Struct):
+    result: Optional[Transaction] = None
+
+class TransactionEvent(msgspec.Struct):
+    """One transaction emitted by a listener - transaction is only set when the notification carried it (blockSubscribe)."""
+    signature: str
+    logs: list[str]
+    err: Any = None
+    transaction: Optional[Transaction] = None
+    received_at: float = 0.0        # time.monotonic() when the frame carrying it was read (utils.tracing)
+
+_notification_decoder = msgspec.json.Decoder(Union[LogsNotification, BlockNotification])
+_transaction_decoder = msgspec.json.Decoder(TransactionResponse)
+
+def has_marker(frame: Union[str, bytes], markers: tuple=MIGRATION_MARKERS) -> bool:
+    """Raw substring scan of an undecoded frame - far cheaper than parsing a block that holds no migration."""
+    if isinstance(frame, (bytes, bytearray, memoryview)):
+        frame = bytes(frame)
+        return any(marker.encode() in frame for marker in markers)
+    return any(marker in frame for marker in markers)
+
+def decode_notification(frame: Union[str, bytes]) -> Optional[Union[LogsNotification, BlockNotification]]:
+    """Decodes a logsNotification or blockNotification frame. Returns None for any other message or a malformed frame."""
+    try:
+        return _notification_decoder.decode(frame)
+    except msgspec.DecodeError:     # also covers ValidationError
+        return None
+
+def decode_transactions(frame: Union[str, bytes], markers: tuple=MIGRATION_MARKERS, received_at: float=0.0) -> list:
+    """
+    Returns the TransactionEvents of a notification frame whose logs contain one of the markers.
+    Frames without a marker anywhere in them are skipped without being decoded.
+    """
+    if not has_marker(frame, markers):
+        return []
+    notification = decode_notification(frame)
+    if notification is None:
+        return []
+
+    if isinstance(notification, LogsNotification):
+        value = notification.params.result.value
+        return [TransactionEvent(signature=value.signature, logs=value.logs or [], err=value.err, received_at=received_at)]
+
+    block = notification.params.result.value.block
+    events = []
+    for transaction in (block.transactions if block else []):
+        logs = transaction.logs
+        if transaction.signature is None or not any(marker in log for log in logs for marker in markers):
+            continue
+        events.append(TransactionEvent(
+            signature=transaction.signature,
+            logs=logs,
+            err=transaction.meta.err if transaction.meta else None,
+            transaction=transaction,
+            received_at=received_at
+        ))
+    return events
+
+def decode_transaction_response(response: Union[str, bytes]) -> Optional[Transaction]:
+    """Decodes the JSON of a getTransaction response (json encoding) into a Transaction."""
+    return _transaction_decoder.decode(response).result